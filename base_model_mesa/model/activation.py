@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Dirty-set activation for the object engine: only households whose inputs changed are stepped again.
+
+Households.step only depends on the adaptation of the households within radius 2 in the social network and on
+the household's own awareness, estimated flood damage, subsidy and adaptation, and stepping a household again
+with the same inputs does not change anything. With AdaptationModel(activation='dirty') these inputs tell the
+scheduler when they change (see TrackedAttribute in agents.py), and each step only the households with a changed
+input are stepped, in the same order as SimultaneousActivation. When a household adapts, its neighbours later in
+the order are stepped in the same step (as they would see the adaptation with SimultaneousActivation as well) and
+the neighbours earlier in the order in the next step. Once no input changes any more, the steps cost nothing.
+"""
+import heapq
+
+import numpy as np
+from mesa.time import SimultaneousActivation
+
+
+class DirtySetActivation(SimultaneousActivation):
+    """
+    Parameters
+    ----------
+    model: the AdaptationModel
+    radius: radius of the social network in which households count their adapted friends (as in Households.step)
+    """
+
+    def __init__(self, model, radius=2):
+        super().__init__(model)
+        self.radius = radius
+        self.stepped_per_step = []          # number of households stepped in every step
+        self._positions = None              # schedule position of every household, built at the first step
+        self._neighbours = None
+        self._next = None                   # positions to step in the next step, None steps all households
+        self._queue = None                  # positions still to step in the running step (a heap)
+        self._queued = None
+        self._current = None                # position of the household being stepped
+
+    def add(self, agent):
+        super().add(agent)
+        self._positions = None
+        self._next = None
+
+    def remove(self, agent):
+        super().remove(agent)
+        self._positions = None
+        self._next = None
+
+    def _build_positions(self):
+        """Map the households to their position in the schedule and the neighbourhood matrix to these positions."""
+        agents = self.agents
+        self._positions = {agent.unique_id: position for position, agent in enumerate(agents)}
+        # Rows of the neighbourhood matrix are network nodes, so it is reordered to the schedule like in engine.py
+        order = np.array([self.model.node_index[agent.pos] for agent in agents])
+        position_of_row = np.empty(len(order), dtype=np.int64)
+        position_of_row[order] = np.arange(len(order))
+        neighbourhood = self.model.get_neighbourhood_matrix(self.radius)
+        self._neighbours = (neighbourhood, order, position_of_row)
+
+    def _neighbour_positions(self, position):
+        neighbourhood, order, position_of_row = self._neighbours
+        row = order[position]
+        return position_of_row[neighbourhood.indices[neighbourhood.indptr[row]:neighbourhood.indptr[row + 1]]]
+
+    def _mark(self, position):
+        """Step the household at position: later in the running step if it did not have its turn yet, else next step."""
+        if self._current is not None and position > self._current:
+            if position not in self._queued:
+                self._queued.add(position)
+                heapq.heappush(self._queue, position)
+        elif self._next is not None:
+            self._next.add(position)
+
+    def mark_changed(self, household, name):
+        """Called by the Households when an input of step changes (the model's input_listener)."""
+        if self._positions is None:                        # the first step steps all households anyway
+            return
+        position = self._positions[household.unique_id]
+        if name == 'is_adapted':
+            for neighbour in self._neighbour_positions(position).tolist():
+                self._mark(neighbour)
+        else:
+            self._mark(position)
+
+    def _queued_keys(self, agents, stepped):
+        """Unique ids of the queued households in schedule order, the queue can grow while they are stepped."""
+        while self._queue:
+            self._current = heapq.heappop(self._queue)
+            stepped.append(self._current)
+            yield agents[self._current].unique_id
+
+    def step(self):
+        """Step the households with changed inputs in schedule order, then advance them."""
+        if self._positions is None:
+            self._build_positions()
+            self._next = None
+        agents = self.agents
+        self._queue = list(range(len(agents))) if self._next is None else sorted(self._next)
+        self._queued = set(self._queue)
+        self._next = set()
+        stepped = []
+        # through do_each like SimultaneousActivation, so wrappers of do_each (e.g. profiling.py) see both phases
+        self.do_each('step', agent_keys=self._queued_keys(agents, stepped))
+        self._current = None
+        self.do_each('advance', agent_keys=[agents[position].unique_id for position in stepped])
+        self.stepped_per_step.append(len(stepped))
+        self.steps += 1
+        self.time += 1
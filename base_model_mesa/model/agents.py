@@ -7,6 +7,82 @@ from shapely import contains_xy
 # Import functions from functions.py
 from functions import generate_random_location_within_map_domain, get_flood_depth, calculate_basic_flood_damage, floodplain_multipolygon
 
+# The thresholds of the decision of a household to adapt (see the report). A model can override them with
+# AdaptationModel(decision_thresholds={...}), e.g. in a sensitivity analysis (see sensitivity.py).
+DECISION_THRESHOLDS = {
+    'willingness': 3,                   # willingness at which a household adapts
+    'friends_high': 0.75,               # share of adapted friends above which the friend influence is 2
+    'friends_medium': 0.50,             # share of adapted friends from which the friend influence is 1 (else -1)
+    'damage_high': 0.68,                # estimated damage from which the damage influence is 3 (1.5 meter water depth)
+    'damage_medium': 0.58,              # estimated damage from which the damage influence is 2 (1 meter water depth)
+    'damage_low': 0.20,                 # estimated damage from which the damage influence is 2 (a base risk)
+    'awareness_high': 0.8,              # awareness from which the awareness influence is 2
+    'awareness_medium': 0.50,           # awareness from which the awareness influence is 1
+}
+
+
+def make_decision_thresholds(overrides=None):
+    """The decision thresholds with the given ones (a dict of name to value) overridden."""
+    overrides = overrides or {}
+    for name in overrides:
+        if name not in DECISION_THRESHOLDS:
+            raise ValueError(f"Unknown decision threshold: '{name}'. "
+                             f"Currently implemented thresholds are: {list(DECISION_THRESHOLDS)}")
+    return {**DECISION_THRESHOLDS, **overrides}
+
+
+class HouseholdTotals:
+    """
+    Running count and sums over all households, kept up to date when a household's tracked attributes change,
+    so that the model reporters do not have to scan all agents every step.
+    """
+    FIELDS = ('is_adapted', 'initial_damage_estimated', 'flood_damage_estimated', 'flood_damage_actual')
+
+    def __init__(self):
+        self.count = 0
+        self.sums = dict.fromkeys(HouseholdTotals.FIELDS, 0)
+
+    def add(self, field, amount):
+        self.sums[field] += amount
+
+    def mean(self, field):
+        return self.sums[field] / self.count if self.count > 0 else 0
+
+
+class TrackedAttribute:
+    """
+    Households attribute whose changes are added to the model's HouseholdTotals.
+    With the vectorized engine the engine keeps the totals itself, so changes to the objects are not counted.
+
+    Parameters
+    ----------
+    total: add the changes to the HouseholdTotals
+    step_input: the attribute is an input of Households.step, its changes are passed to model.input_listener
+                (set by activation='dirty', see activation.py)
+    """
+
+    def __init__(self, total=True, step_input=False):
+        self.total = total
+        self.step_input = step_input
+
+    def __set_name__(self, owner, name):
+        self.name = name
+        self.private_name = '_' + name
+
+    def __get__(self, household, owner=None):
+        if household is None:
+            return self
+        return household.__dict__[self.private_name]
+
+    def __set__(self, household, value):
+        old_value = household.__dict__.get(self.private_name, 0)
+        household.__dict__[self.private_name] = value
+        model = household.model
+        if self.total and model.households is None:
+            model.household_totals.add(self.name, value - old_value)
+        if self.step_input and model.input_listener is not None and value != old_value:
+            model.input_listener(household, self.name)
+
 
 # Define the Households agent class
 class Households(Agent):
@@ -16,49 +92,65 @@ class Households(Agent):
     In a real scenario, this would be based on actual geographical data or more complex logic.
     """
 
+    # These attributes are summed up in model.household_totals for the model reporters
+    is_adapted = TrackedAttribute(step_input=True)
+    initial_damage_estimated = TrackedAttribute()
+    flood_damage_estimated = TrackedAttribute(step_input=True)
+    flood_damage_actual = TrackedAttribute()
+    # The other inputs of step, only tracked for activation='dirty'
+    awareness = TrackedAttribute(total=False, step_input=True)
+    subsidy = TrackedAttribute(total=False, step_input=True)
 
-    def __init__(self, unique_id, model):
+
+    def __init__(self, unique_id, model, location=None, flood_depth=None, in_floodplain=None):
         super().__init__(unique_id, model)
-        unique_seed = model.seed + unique_id                         # Creating unique seed per Household, unnecessary but with my limited knowledge of MESA and seeds I thought initially that this was necessary.
-        self.random_generator = random.Random(unique_seed)           # setting the seed to the seed set in the model initialization
+        model.household_totals.count += 1
+        streams = model.random_streams                               # None with rng='legacy'
+        population = model.population                                # income class, awareness and initial adaptation of all households, see population.py
         self.is_adapted = False
-        self.income_class = Households.generate_income_class()       # Generates income class for each agent in a different function
+        self.income_class = population.income_class[unique_id]      # The income classes are handed out by the model's PopulationSynthesizer
         self.willingness = 0                                         # Willingness to adapt starts of at 0, this can be affected by friends and awareness
-        self.awareness = self.random_generator.uniform(0.2, 1) # Randomizer for the awareness of the household, class does not determine awareness.
+        self.awareness = float(population.awareness[unique_id])     # Random awareness of the household, class does not determine awareness.
         self.final_adaption = False                                  # This boolean makes sure that once an adaption has been made, it doesnt go on adapting again and again
         self.reduction = 0                                           # No initial reduction.
         self.adapted_friends_percentage = 0                          # Initially the households have no friends that are adapetd, this needs to be an attribute so that it can be used to calculate willingness
         self.subsidy = 0                                             # Intially there is no subsidy, Government can change this value to 1, this is not a Boolean so that the government could potentiall increase subsidy to 2
 
-        unique_seed = model.seed + unique_id                         # So that each agent is individually randomized to be adapted in the next code
-        self.local_random = random.Random(unique_seed)
-        if self.local_random.random() > 0.90:                        # There is a 10 percent chance that a household is already adapted
+        if population.is_adapted[unique_id]:                         # There is a 10 percent chance that a household is already adapted
             self.is_adapted = True
             self.initial_adaptation_setup()                          # Prior adapted households still need to get their bought protection, but adding this function (which is a but dubbel op) this can be assured.
         else:
             self.is_adapted = False                                  # Initial adaptation status set to False
 
         # getting flood map values
-        # Get a random location on the map
-        loc_x, loc_y = generate_random_location_within_map_domain(model.seed, self.unique_id)       #generates a location with the random unique to respect the seed
+        # Get a random location on the map, unless the model already placed all households at once
+        if location is None:
+            location_rng = None if streams is None else streams.generator('location', unique_id)
+            loc_x, loc_y = generate_random_location_within_map_domain(model.seed, self.unique_id, rng=location_rng)       #generates a location with the random unique to respect the seed
+        else:
+            loc_x, loc_y = location
         self.location = Point(loc_x, loc_y)
 
         # Check whether the location is within floodplain
-        self.in_floodplain = False
-        if contains_xy(geom=floodplain_multipolygon, x=self.location.x, y=self.location.y):
-            self.in_floodplain = True
+        # The model tests all households at once with its spatial index (see HouseholdSpatialIndex in spatial.py)
+        if in_floodplain is None:
+            in_floodplain = bool(contains_xy(geom=floodplain_multipolygon, x=self.location.x, y=self.location.y))
+        self.in_floodplain = in_floodplain
 
         # Get the estimated flood depth at those coordinates. 
         # the estimated flood depth is calculated based on the flood map (i.e., past data) so this is not the actual flood depth
         # Flood depth can be negative if the location is at a high elevation
-        self.flood_depth_estimated = get_flood_depth(corresponding_map=model.flood_map, location=self.location, band=model.band_flood_img)
+        # The model looks up the depths of all households at once (see HouseholdPixelIndex in floodmaps.py)
+        if flood_depth is None:
+            flood_depth = get_flood_depth(corresponding_map=model.flood_map, location=self.location, band=model.band_flood_img)
+        self.flood_depth_estimated = flood_depth
         # handle negative values of flood depth
         if self.flood_depth_estimated < 0:
             self.flood_depth_estimated = 0
 
 
         # calculate the estimated flood damage given the estimated flood depth. Flood damage is a factor between 0 and 1
-        self.flood_damage_estimated = calculate_basic_flood_damage(flood_depth=self.flood_depth_estimated)
+        self.flood_damage_estimated = calculate_basic_flood_damage(flood_depth=self.flood_depth_estimated, curve=model.damage_curve)
         self.initial_damage_estimated = self.flood_damage_estimated       #for the result analysis this is necessary.
 
         # Add an attribute for the actual flood depth. This is set to zero at the beginning of the simulation since there is not flood yet
@@ -66,44 +158,19 @@ class Households(Agent):
         self.flood_depth_actual = 0
         
         #calculate the actual flood damage given the actual flood depth. Flood damage is a factor between 0 and 1
-        self.flood_damage_actual = calculate_basic_flood_damage(flood_depth=self.flood_depth_actual)
-
-
-    _income_classes_initialized = False
-    _income_class_list = []                          # For generating and distributing income classes
-    _total_households = 100                          # This is hardcoded, but shouldn't be. This needs to be linked to the model attribute households which is an input variable.
-
-    @classmethod                           # class method
-    def generate_income_class(cls):
-        if not cls._income_classes_initialized:
-            # Calculate the number of households for each income class
-            # Distribution is based on literature, see report. Values have been rounded.
-            distribution = {
-                'lower': 0.20,           # 20% of population
-                'lower-middle': 0.15,    # 15% of population
-                'middle': 0.30,          # 30% of population
-                'upper-middle': 0.30,    # 30% of population
-                'upper': 0.05            # 5% of population
-            }
-            income_distribution = []
-            for income_class, percentage in distribution.items():                # This function makes sure that the percentage per class is represented in the households.
-                count = int(percentage * cls._total_households)                  # But making a list and the popping, it is possible to create the wanted amount per class.
-                income_distribution.extend([income_class] * count)               # distribution hoeft niet gerandomiseerd te worden aangezien er met seeds experimenten worden gerunt, voor een gerandomiseerd model zou het wel van belang zijn.
-
-            # random.shuffle(income_distribution)
-            cls._income_class_list = income_distribution
-            cls._income_classes_initialized = True
+        self.flood_damage_actual = calculate_basic_flood_damage(flood_depth=self.flood_depth_actual, curve=model.damage_curve)
 
-        return cls._income_class_list.pop() if cls._income_class_list else 'default'
 
     def count_friends(self, radius):
         """Count the number of adapted neighbors within a given radius."""
         # at step 0, each Agent has no adapted friends, but due to the fact that the agent steps are executed one by one, agents that are executed later have a chance to have adapted friends.
         # To mitigate the effect that this has on the calculatd willingness, agents will by activated Simultaneously (SimultaneousActivation) instead of Randomly (RandomActivation)
-        # Retrieve all neighbor nodes within the specified radius
-        neighbor_nodes = self.model.grid.get_neighborhood(self.pos, include_center=False, radius=radius)
+        # Retrieve all neighbor nodes within the specified radius, from the neighbourhood matrix that the model computes once
+        neighbourhood = self.model.get_neighbourhood_matrix(radius)
+        row = self.model.node_index[self.pos]
+        neighbor_nodes = [self.model.node_list[i] for i in neighbourhood.indices[neighbourhood.indptr[row]:neighbourhood.indptr[row + 1]]]
         # Retrieve agents in these nodes
-        neighbor_agents = [self.model.grid.get_cell_list_contents([node])[0] for node in neighbor_nodes]
+        neighbor_agents = self.model.grid.get_cell_list_contents(neighbor_nodes)
         # Count the number of adapted neighbors
         adapted_friends_count = sum(agent.is_adapted for agent in neighbor_agents)
         # Calculate the total number of friends
@@ -117,21 +184,23 @@ class Households(Agent):
 
     def calculate_friend_influence(self):
         # the percentage of friends who are adapted influences the willingess, a lot of adapted friends increase the willingness with 2 points, more than half is 1 point etc.
-        if self.adapted_friends_percentage > 0.75:                       # if all almost all youre friends are adapting to floodrisk you will want to do it too ( see report)
+        thresholds = self.model.decision_thresholds
+        if self.adapted_friends_percentage > thresholds['friends_high']:   # if all almost all youre friends are adapting to floodrisk you will want to do it too ( see report)
             return 2  # High Positive influence
-        elif self.adapted_friends_percentage >= 0.50:
+        elif self.adapted_friends_percentage >= thresholds['friends_medium']:
             return 1  # Positive influence
-        elif self.adapted_friends_percentage < 0.50:   # if none of your friends are adapting to floodrisk, you will not be likely to make this investment
+        elif self.adapted_friends_percentage < thresholds['friends_medium']:   # if none of your friends are adapting to floodrisk, you will not be likely to make this investment
             return -1   # low influence
         else:
             return 0  # No influence
 
     def calculate_flood_damage_estimated_influence(self):
-        if self.flood_damage_estimated >= 0.68:                  # this damage factor is equal to a water depth of 1.5 meter (see report)
+        thresholds = self.model.decision_thresholds
+        if self.flood_damage_estimated >= thresholds['damage_high']:      # this damage factor is equal to a water depth of 1.5 meter (see report)
             return 3 # high positive influence
-        elif self.flood_damage_estimated >= 0.58:                # this damage factor is equal to 1 meter water depth
+        elif self.flood_damage_estimated >= thresholds['damage_medium']:  # this damage factor is equal to 1 meter water depth
             return 2 # medium influence
-        elif self.flood_damage_estimated >= 0.20:                # this damage factor is equal to water depth higher than 0 -> so a base risk
+        elif self.flood_damage_estimated >= thresholds['damage_low']:     # this damage factor is equal to water depth higher than 0 -> so a base risk
             return 2 # influence
         elif self.flood_damage_estimated == 0:                   # if there is no flood damage estimated, then it is highly unlikely a household will adapt
             return -2
@@ -142,9 +211,10 @@ class Households(Agent):
         #how mare aware a household is of floods and the dangers, the more a household will be willing
         # awareness is hightened by government class with their awareness campaign.
         # this method means that a household has a chance of 1/8 exceeding the maximum awarness and reaping the max benfits of the  awareness.
-        if self.awareness >= 0.8:
+        thresholds = self.model.decision_thresholds
+        if self.awareness >= thresholds['awareness_high']:
             return 2
-        elif self.awareness >=0.50:
+        elif self.awareness >= thresholds['awareness_medium']:
             return 1
         else:
             return 0 # awareness is not high enough to influence the willingness
@@ -208,7 +278,7 @@ class Households(Agent):
         self.count_friends(2)  # use last steps percentage of adapted friends, otherwise certain households have an unfair advantage
         self.calculate_willingness()  # goes to the calculate willingness
 
-        if self.willingness >= 3:                                      # Breaking point for a Household to adapt is 3, the found average willingness of Households. There it is deemed to be a good breaking point.
+        if self.willingness >= self.model.decision_thresholds['willingness']:   # Breaking point for a Household to adapt is 3, the found average willingness of Households. There it is deemed to be a good breaking point.
             self.is_adapted = True
 
         if self.is_adapted and not self.final_adaption:                                                 #verbinden met measure
@@ -247,11 +317,15 @@ class Government(Agent):             # make this a function.
         super().__init__(unique_id, model)
         self.gov_action_A_sub = model.gov_action_A_sub
         self.gov_action_B_awa = model.gov_action_B_awa
+        self.gov_campaign_region = model.gov_campaign_region
 
     def give_subsidies(self):
         '''Government Action A: Subsidize Flood adaptations, giving houeholds money so that they can purchase better flood adaptations'''
 
         subsidy_amount = 1                                           # Defines the amount of subsidy the government gives each households
+        if self.model.households is not None:                        # The vectorized engine keeps the subsidies in an array
+            self.model.households.give_subsidies(subsidy_amount)
+            return
         for agent in self.model.schedule.agents:                     # Adds the subsidy to the Households, bringing the income class up to the next level.
             if isinstance(agent, Households):
                 agent.subsidy += subsidy_amount
@@ -259,9 +333,21 @@ class Government(Agent):             # make this a function.
 
     def awareness_campaign(self):
         '''Goverment Action B: Awareness Campaign, informing households on floodrisks and stimulating them to take action and adapt.'''
+        # The households in the region of the campaign (None is all households), found with the spatial index of the model
+        targets = self.model.spatial_index.households_in_region(self.gov_campaign_region)
+        if self.model.households is not None:                         # The vectorized engine keeps the awareness in an array
+            self.model.households.awareness_campaign(targets)
+            return
+
+        if self.model.random_streams is not None:                     # With rng='philox' the increases of all households are drawn at once
+            increases = self.model.random_streams.random('awareness_campaign')
+            for agent in self.model.schedule.agents:
+                if isinstance(agent, Households) and (targets is None or targets[agent.unique_id]):
+                    agent.awareness = agent.awareness + increases[agent.unique_id]
+            return
 
         for agent in self.model.schedule.agents:                      # Increase the awareness of each household by a random value between 0 and 1
-            if isinstance(agent, Households):                         # So in the end, a households awareness is decided by the addition of two randomly generated values between 0 and 1
+            if isinstance(agent, Households) and (targets is None or targets[agent.unique_id]):  # So in the end, a households awareness is decided by the addition of two randomly generated values between 0 and 1
                 unique_seed = self.model.seed + agent.unique_id       # Use of Random seed, not necessary but I had limited understanding of seeds at this moment.
                 local_random = random.Random(unique_seed)
 
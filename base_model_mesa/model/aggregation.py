@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming statistics of the model reporters over many runs (seeds), without keeping the runs.
+
+EnsembleStatistics folds the model reporters of every finished run into running statistics per scenario, step and
+reporter: the count, mean and variance (Welford, merged with the formula of Chan et al.) and a KLL quantile sketch.
+Its memory does not grow with the number of runs, and the statistics of runs in different processes or sweeps can be
+merged, so a 10k-seed ensemble needs no more memory than a 10-seed one.
+
+    statistics = EnsembleStatistics(by=['gov_action_A_sub', 'gov_action_B_awa'])
+    run_sweep(AdaptationModel, parameters, statistics=statistics, keep_results=False)
+    statistics.get_dataframe()
+"""
+import math
+import random
+
+import numpy as np
+import pandas as pd
+
+# The model reporters of AdaptationModel
+REPORTERS = ("percentage_adapted_households",
+             "Average initial flood damage estimated",
+             "Average flood damage estimated",
+             "Average flood damage actual")
+
+
+class RunningMoments:
+    """Count, mean and sum of squared deviations of a value per step, updated with one or many values at once."""
+
+    def __init__(self):
+        self.count = np.zeros(0, dtype=np.int64)
+        self.mean = np.zeros(0, dtype=np.float64)
+        self.m2 = np.zeros(0, dtype=np.float64)
+
+    def _grow(self, steps):
+        if steps > len(self.count):
+            extra = steps - len(self.count)
+            self.count = np.concatenate([self.count, np.zeros(extra, dtype=np.int64)])
+            self.mean = np.concatenate([self.mean, np.zeros(extra)])
+            self.m2 = np.concatenate([self.m2, np.zeros(extra)])
+
+    def _combine(self, steps, count, mean, m2):
+        """Combine the moments of other values into the moments of steps (the parallel formula of Chan et al.)."""
+        self._grow(int(np.max(steps)) + 1 if len(steps) else 0)
+        total = self.count[steps] + count
+        delta = mean - self.mean[steps]
+        self.mean[steps] += delta * count / total
+        self.m2[steps] += m2 + delta ** 2 * self.count[steps] * count / total
+        self.count[steps] = total
+
+    def add(self, step, values):
+        """Add one value or an array of values (e.g. of all replicates) of one step."""
+        values = np.atleast_1d(np.asarray(values, dtype=np.float64))
+        if len(values) == 0:
+            return
+        mean = values.mean()
+        self._combine(np.array([step]), len(values), mean, ((values - mean) ** 2).sum())
+
+    def merge(self, other):
+        """Add the moments of another RunningMoments."""
+        steps = np.flatnonzero(other.count)
+        self._combine(steps, other.count[steps], other.mean[steps], other.m2[steps])
+
+    def variance(self):
+        """The sample variance per step, NaN for steps with fewer than two values."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > 1, self.m2 / (self.count - 1), np.nan)
+
+
+class QuantileSketch:
+    """
+    KLL sketch of the quantiles of a stream of values, in O(k) memory.
+    Level h keeps values with weight 2**h. When a level is full its sorted values are compacted: every other value
+    (starting at a random offset) moves one level up. Up to k values the quantiles are exact.
+
+    Parameters
+    ----------
+    k: size of the top level, the rank error is about 1.7 / k
+    seed: seed of the compaction offsets
+    """
+
+    def __init__(self, k=200, seed=0):
+        self.k = k
+        self.count = 0
+        self.levels = [np.zeros(0)]
+        self._random = random.Random(seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - 1 - level
+        return max(int(math.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.zeros(0))
+                items = np.sort(items)
+                keep = items[len(items) - len(items) % 2:]           # an odd value out stays on this level
+                pairs = items[:len(items) - len(keep)]
+                offset = self._random.getrandbits(1)
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], pairs[offset::2]])
+                self.levels[level] = keep
+            level += 1
+
+    def add(self, values):
+        """Add one value or an array of values."""
+        values = np.atleast_1d(np.asarray(values, dtype=np.float64))
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.count += len(values)
+        self._compress()
+
+    def merge(self, other):
+        """Add the values of another sketch."""
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.zeros(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.count += other.count
+        self._compress()
+
+    def quantiles(self, qs):
+        """The values at the quantiles qs (the smallest value with at least that share of the weight up to it)."""
+        if self.count == 0:
+            return np.full(len(qs), np.nan)
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2 ** level) for level, items in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        cumulative = np.cumsum(weights[order])
+        positions = np.searchsorted(cumulative, np.asarray(qs) * cumulative[-1], side='left')
+        return values[order][np.minimum(positions, len(values) - 1)]
+
+
+class EnsembleStatistics:
+    """
+    Parameters
+    ----------
+    by: the parameters that make up a scenario, the statistics are kept per combination of their values
+    reporters: the model reporters to keep statistics of
+    quantiles: the quantiles given by get_dataframe
+    sketch_size: k of the quantile sketches
+    """
+
+    def __init__(self, by=(), reporters=REPORTERS, quantiles=(0.05, 0.25, 0.5, 0.75, 0.95), sketch_size=200):
+        self.by = tuple(by)
+        self.reporters = tuple(reporters)
+        self.quantiles = tuple(quantiles)
+        self.sketch_size = sketch_size
+        self.runs = {}                    # scenario -> number of runs
+        self._moments = {}                # (scenario, reporter) -> RunningMoments
+        self._sketches = {}               # (scenario, reporter, step) -> QuantileSketch
+
+    def _add(self, scenario, step, reporter, values):
+        if (scenario, reporter) not in self._moments:
+            self._moments[scenario, reporter] = RunningMoments()
+        self._moments[scenario, reporter].add(step, values)
+        if (scenario, reporter, step) not in self._sketches:
+            self._sketches[scenario, reporter, step] = QuantileSketch(self.sketch_size)
+        self._sketches[scenario, reporter, step].add(values)
+
+    def add_rows(self, rows):
+        """Add one run from its model data rows, as returned by run_model or batch_run (with Step and the parameters)."""
+        scenarios = set()
+        for row in rows:
+            scenario = tuple(row[parameter] for parameter in self.by)
+            scenarios.add(scenario)
+            for reporter in self.reporters:
+                self._add(scenario, row['Step'], reporter, row[reporter])
+        for scenario in scenarios:
+            self.runs[scenario] = self.runs.get(scenario, 0) + 1
+
+    def add_model(self, model):
+        """Add a finished model, its scenario are the values of its attributes named in by."""
+        scenario = tuple(getattr(model, parameter) for parameter in self.by)
+        model_vars = model.datacollector.model_vars
+        for reporter in self.reporters:
+            for step, value in enumerate(model_vars[reporter]):
+                self._add(scenario, step, reporter, value)
+        self.runs[scenario] = self.runs.get(scenario, 0) + 1
+
+    def add_ensemble(self, ensemble):
+        """Add all replicates of a finished AdaptationEnsemble at once."""
+        scenario = tuple(getattr(ensemble, parameter) for parameter in self.by)
+        for reporter in self.reporters:
+            for step, values in enumerate(ensemble.model_vars[reporter]):
+                self._add(scenario, step, reporter, values)
+        self.runs[scenario] = self.runs.get(scenario, 0) + len(ensemble.seeds)
+
+    def merge(self, other):
+        """Add the statistics of another EnsembleStatistics with the same by and reporters (e.g. from another worker)."""
+        if other.by != self.by or other.reporters != self.reporters:
+            raise ValueError("Only statistics with the same scenario parameters and reporters can be merged")
+        for scenario, runs in other.runs.items():
+            self.runs[scenario] = self.runs.get(scenario, 0) + runs
+        for key, moments in other._moments.items():
+            self._moments.setdefault(key, RunningMoments()).merge(moments)
+        for key, sketch in other._sketches.items():
+            self._sketches.setdefault(key, QuantileSketch(self.sketch_size)).merge(sketch)
+
+    def get_dataframe(self):
+        """The statistics with one row per scenario, step and reporter."""
+        records = []
+        for (scenario, reporter), moments in self._moments.items():
+            variance = moments.variance()
+            for step in np.flatnonzero(moments.count).tolist():
+                record = dict(zip(self.by, scenario))
+                record.update({'Step': step, 'Reporter': reporter, 'Count': int(moments.count[step]),
+                               'Mean': moments.mean[step], 'Variance': variance[step], 'Std': math.sqrt(variance[step])})
+                values = self._sketches[scenario, reporter, step].quantiles(self.quantiles)
+                record.update({f'Q{q:g}': value for q, value in zip(self.quantiles, values.tolist())})
+                records.append(record)
+        columns = list(self.by) + ['Step', 'Reporter', 'Count', 'Mean', 'Variance', 'Std'] + [f'Q{q:g}' for q in self.quantiles]
+        return pd.DataFrame(records, columns=columns).sort_values(list(self.by) + ['Reporter', 'Step'], ignore_index=True)
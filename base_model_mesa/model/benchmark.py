@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the AdaptationModel: construction, stepping and data collection are timed separately.
+
+Every case (number of households x network x flood map) runs in a fresh process, so its peak memory is its own and
+caches from earlier cases do not make it look faster. The results are appended to a JSON lines history together
+with the git commit, so runs of different commits can be compared:
+
+    python benchmark.py                                          # the full grid, 100 to 1M households
+    python benchmark.py --households 100 1000 --networks barabasi_albert --flood-maps harvey
+    python benchmark.py --compare <old commit> <new commit>      # compare two commits in the history
+    python benchmark.py --history <path>                         # keep the history in another file
+
+The default history, base_model_mesa/benchmark_history.jsonl, is local to the machine and ignored by git.
+
+Large cases are slow (the erdos_renyi network has a number of edges quadratic in the number of households), so
+every case has a timeout and is recorded as 'timeout' when it does not finish.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+try:
+    import resource                                         # not available on Windows, peak memory is then not recorded
+except ImportError:
+    resource = None
+
+benchmark_history_path = r'../benchmark_history.jsonl'      # ignored by git, see .gitignore
+
+HOUSEHOLD_COUNTS = (100, 1_000, 10_000, 100_000, 1_000_000)
+NETWORKS = ('erdos_renyi', 'barabasi_albert', 'watts_strogatz', 'no_network')
+FLOOD_MAP_CHOICES = ('harvey', '100yr', '500yr')
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB, or None when it cannot be measured."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':                            # bytes on macOS, kilobytes on Linux
+        return peak / 2 ** 20
+    return peak / 2 ** 10
+
+
+def git_revision():
+    """The current commit and whether the tree has uncommitted changes, None when git is not available."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status.strip())
+
+
+def run_case(number_of_households, network, flood_map_choice, steps=20, model_kwargs=None):
+    """
+    Time one model run: construction, every step and the extraction of the collected data.
+
+    Parameters
+    ----------
+    number_of_households, network, flood_map_choice: the AdaptationModel parameters of this case
+    steps: number of steps to run
+    model_kwargs: other AdaptationModel parameters, e.g. {'engine': 'vectorized'}
+
+    Returns
+    -------
+    result: dict with the wall time of each phase in seconds, the time of every step and the peak memory in MB
+    """
+    rss_at_start = peak_rss_mb()
+    start = time.perf_counter()
+    from model import AdaptationModel                       # importing loads the geodata, this is timed separately
+    import_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    model = AdaptationModel(number_of_households=number_of_households, network=network,
+                            flood_map_choice=flood_map_choice, **(model_kwargs or {}))
+    init_time = time.perf_counter() - start
+
+    step_times = []
+    for _ in range(steps):
+        start = time.perf_counter()
+        model.step()
+        step_times.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    model.datacollector.get_model_vars_dataframe()
+    model_vars_time = time.perf_counter() - start
+    start = time.perf_counter()
+    model.datacollector.get_agent_vars_dataframe()
+    agent_vars_time = time.perf_counter() - start
+
+    return {
+        'phases': {
+            'import': import_time,
+            'init': init_time,
+            'step': sum(step_times),
+            'model_vars': model_vars_time,
+            'agent_vars': agent_vars_time,
+        },
+        'step_times': step_times,
+        'wall_time': import_time + init_time + sum(step_times) + model_vars_time + agent_vars_time,
+        'peak_rss_mb': peak_rss_mb(),
+        'rss_at_start_mb': rss_at_start,
+    }
+
+
+def run_case_isolated(case, steps=20, model_kwargs=None, timeout=1800):
+    """
+    Run one case in a fresh process.
+
+    Returns
+    -------
+    result: the result of run_case with a 'status' of 'ok', or a 'status' of 'timeout' or 'error' without timings
+    """
+    context = multiprocessing.get_context('spawn')          # a fresh interpreter, nothing is cached from earlier cases
+    with context.Pool(1) as pool:
+        async_result = pool.apply_async(run_case, (*case,), {'steps': steps, 'model_kwargs': model_kwargs})
+        try:
+            result = async_result.get(timeout)
+        except multiprocessing.TimeoutError:
+            return {'status': 'timeout', 'timeout': timeout}
+        except Exception as error:                           # e.g. a MemoryError of a case that is too large
+            return {'status': 'error', 'error': f'{type(error).__name__}: {error}'}
+    return {'status': 'ok', **result}
+
+
+def run_benchmarks(household_counts=HOUSEHOLD_COUNTS, networks=NETWORKS, flood_map_choices=FLOOD_MAP_CHOICES,
+                   steps=20, model_kwargs=None, timeout=1800, history_path=benchmark_history_path, label=None):
+    """
+    Run every combination of household count, network and flood map, and append the results to the history.
+
+    Parameters
+    ----------
+    household_counts, networks, flood_map_choices: the cases to run
+    steps: number of steps per run
+    model_kwargs: other AdaptationModel parameters used for all cases
+    timeout: seconds after which a case is stopped and recorded as 'timeout'
+    history_path: JSON lines file the results are appended to, None only returns them
+    label: free text stored with the results, e.g. the name of the change being measured
+
+    Returns
+    -------
+    records: list of dicts, one per case
+    """
+    commit, dirty = git_revision()
+    environment = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+    timestamp = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    records = []
+    for number_of_households in household_counts:
+        for network in networks:
+            for flood_map_choice in flood_map_choices:
+                case = (number_of_households, network, flood_map_choice)
+                result = run_case_isolated(case, steps, model_kwargs, timeout)
+                record = {
+                    'timestamp': timestamp,
+                    'commit': commit,
+                    'dirty': dirty,
+                    'label': label,
+                    'environment': environment,
+                    'case': {'number_of_households': number_of_households, 'network': network,
+                             'flood_map_choice': flood_map_choice, 'steps': steps, **(model_kwargs or {})},
+                    **result,
+                }
+                records.append(record)
+                if history_path is not None:
+                    with open(history_path, 'a') as file:       # appended per case, so a long run keeps what it measured
+                        file.write(json.dumps(record) + '\n')
+                print(format_record(record), flush=True)
+    return records
+
+
+def format_mb(megabytes):
+    return 'n/a' if megabytes is None else f'{megabytes:.0f}MB'
+
+
+def format_record(record):
+    """One line summary of a benchmark record."""
+    case = record['case']
+    name = f"{case['number_of_households']:>9} {case['network']:<16} {case['flood_map_choice']:<7}"
+    if record['status'] != 'ok':
+        return f"{name} {record['status']}"
+    phases = ' '.join(f"{phase}={seconds:.3f}s" for phase, seconds in record['phases'].items())
+    return f"{name} wall={record['wall_time']:.3f}s peak_rss={format_mb(record['peak_rss_mb'])} {phases}"
+
+
+def load_history(history_path=benchmark_history_path):
+    """All records in the history, in the order they were written."""
+    if not os.path.exists(history_path):
+        return []
+    with open(history_path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def compare_commits(base, head, history_path=benchmark_history_path):
+    """
+    Compare the wall time and peak memory of two commits, per case. Commits can be given as a prefix of the hash.
+    When a case was run more than once for a commit, its latest record is used.
+
+    Returns
+    -------
+    rows: list of (case, base record, head record) for the cases measured for both commits
+    """
+    latest = {base: {}, head: {}}
+    for record in load_history(history_path):
+        for commit in (base, head):
+            if record['commit'] and record['commit'].startswith(commit) and record['status'] == 'ok':
+                latest[commit][json.dumps(record['case'], sort_keys=True)] = record
+    return [(json.loads(case), latest[base][case], latest[head][case])
+            for case in latest[base] if case in latest[head]]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark AdaptationModel construction, stepping and data collection.')
+    parser.add_argument('--households', type=int, nargs='+', default=list(HOUSEHOLD_COUNTS))
+    parser.add_argument('--networks', nargs='+', default=list(NETWORKS), choices=NETWORKS)
+    parser.add_argument('--flood-maps', nargs='+', default=list(FLOOD_MAP_CHOICES), choices=FLOOD_MAP_CHOICES)
+    parser.add_argument('--steps', type=int, default=20)
+    parser.add_argument('--engine', default='object', help="AdaptationModel engine, 'object' or 'vectorized'")
+    parser.add_argument('--collector', default='mesa', help="AdaptationModel collector, 'mesa' or 'columnar'")
+    parser.add_argument('--network-backend', default='networkx', help="AdaptationModel network_backend, 'networkx' or 'csr'")
+    parser.add_argument('--timeout', type=float, default=1800, help='seconds per case')
+    parser.add_argument('--history', default=benchmark_history_path)
+    parser.add_argument('--label', default=None)
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'HEAD'), help='compare two commits in the history')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        base, head = args.compare
+        for case, base_record, head_record in compare_commits(base, head, args.history):
+            ratio = head_record['wall_time'] / base_record['wall_time']
+            print(f"{case['number_of_households']:>9} {case['network']:<16} {case['flood_map_choice']:<7} "
+                  f"wall {base_record['wall_time']:.3f}s -> {head_record['wall_time']:.3f}s ({ratio:.2f}x)  "
+                  f"peak_rss {format_mb(base_record['peak_rss_mb'])} -> {format_mb(head_record['peak_rss_mb'])}")
+        return
+
+    run_benchmarks(args.households, args.networks, args.flood_maps, args.steps,
+                   model_kwargs={'engine': args.engine, 'collector': args.collector, 'network_backend': args.network_backend},
+                   timeout=args.timeout, history_path=args.history, label=args.label)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar replacement for mesa's DataCollector.
+
+Mesa's DataCollector stores one Python tuple per agent per step, so agent-level output grows as agents x steps
+Python objects. The ColumnarDataCollector writes agent variables into preallocated typed NumPy columns instead,
+encodes text variables (like the income class) as categories, can collect agent variables only at chosen steps or
+for a sampled subset of the households, and flushes full chunks to Parquet so only one chunk is kept in memory.
+Model variables are collected in the same way as mesa does.
+
+The Parquet file is complete once the collector is closed: by close() (AdaptationModel.close() calls it), at the end
+of a with block, or when the collector is garbage collected.
+"""
+import types
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+
+class ColumnarDataCollector:
+    """
+    Parameters
+    ----------
+    model_reporters: dict of variable name to reporter, handled like in mesa's DataCollector
+    agent_reporters: dict of variable name to the agent attribute to collect
+    agent_dtypes: dict of variable name to the NumPy dtype of its column, float64 when not given
+    categories: dict of variable name to the tuple of its categories, these columns are stored as category codes
+    agent_steps: steps at which agent variables are collected, None collects them every step
+    agent_sample: number of households to collect agent variables for, None collects them for all households
+    sample_seed: seed for choosing the sampled households
+    chunk_steps: number of collected steps kept in memory before they are flushed
+    output_path: Parquet file the agent variables are written to, when None the chunks are kept in memory
+    """
+
+    def __init__(self, model_reporters=None, agent_reporters=None, agent_dtypes=None, categories=None,
+                 agent_steps=None, agent_sample=None, sample_seed=None, chunk_steps=10, output_path=None):
+        self.model_reporters = dict(model_reporters or {})
+        self.agent_reporters = dict(agent_reporters or {})
+        self.agent_dtypes = {name: np.dtype((agent_dtypes or {}).get(name, np.float64)) for name in self.agent_reporters}
+        self.categories = dict(categories or {})
+        for name in self.categories:
+            self.agent_dtypes[name] = np.dtype(np.int16)
+        self.agent_steps = None if agent_steps is None else set(agent_steps)
+        self.agent_sample = agent_sample
+        self.sample_seed = sample_seed
+        self.chunk_steps = chunk_steps
+        self.output_path = output_path
+
+        self.model_vars = {name: [] for name in self.model_reporters}
+        self.agent_ids = None               # unique ids of the collected households, fixed at the first collection
+        self._agent_index = None            # their positions in the schedule
+        self._buffer = None
+        self._buffer_steps = []
+        self._chunks = []                   # flushed chunks, only used without output_path
+        self._writer = None
+        self._closed = False
+
+    def _record_model_vars(self, model):
+        for name, reporter in self.model_reporters.items():
+            if isinstance(reporter, (types.LambdaType, partial)):
+                self.model_vars[name].append(reporter(model))
+            elif isinstance(reporter, str):
+                self.model_vars[name].append(getattr(model, reporter, None))
+            elif isinstance(reporter, list):
+                self.model_vars[name].append(reporter[0](*reporter[1]))
+            else:
+                self.model_vars[name].append(reporter())
+
+    def _select_agents(self, model):
+        """Choose the households to collect, once, and allocate the column buffers for them."""
+        agents = model.schedule.agents
+        agent_index = np.arange(len(agents))
+        if self.agent_sample is not None and self.agent_sample < len(agents):
+            rng = np.random.default_rng(self.sample_seed)
+            agent_index = np.sort(rng.choice(len(agents), size=self.agent_sample, replace=False))
+        self._agent_index = agent_index
+        self.agent_ids = np.array([agents[i].unique_id for i in agent_index.tolist()])
+        self._buffer = {name: np.empty((self.chunk_steps, len(agent_index)), dtype=dtype)
+                        for name, dtype in self.agent_dtypes.items()}
+
+    def _agent_column(self, model, name):
+        """Values of one agent variable for the collected households, read from the engine arrays when there are any."""
+        attribute = self.agent_reporters[name]
+        households = getattr(model, 'households', None)
+        if households is not None and isinstance(getattr(households, attribute, None), np.ndarray):
+            return getattr(households, attribute)[self._agent_index]
+        agents = model.schedule.agents
+        values = [getattr(agents[i], attribute) for i in self._agent_index.tolist()]
+        if name in self.categories:
+            code = {category: i for i, category in enumerate(self.categories[name])}
+            values = [code[value] for value in values]
+        return np.asarray(values)
+
+    def collect(self, model):
+        """Collect the model variables, and the agent variables when this step is one of the agent_steps."""
+        self._record_model_vars(model)
+        step = model.schedule.steps
+        if not self.agent_reporters or (self.agent_steps is not None and step not in self.agent_steps):
+            return
+        if self._closed:
+            raise RuntimeError("The Parquet output of this collector is closed, agent variables can no longer be collected")
+        if self._buffer is None:
+            self._select_agents(model)
+        row = len(self._buffer_steps)
+        for name, column in self._buffer.items():
+            column[row] = self._agent_column(model, name)
+        self._buffer_steps.append(step)
+        if len(self._buffer_steps) == self.chunk_steps:
+            self.flush()
+
+    def _chunk_table(self):
+        """The buffered steps in long format: one row per collected household per step."""
+        steps = np.array(self._buffer_steps)
+        n_steps, n_agents = len(steps), len(self.agent_ids)
+        table = {'Step': np.repeat(steps, n_agents), 'AgentID': np.tile(self.agent_ids, n_steps)}
+        for name, column in self._buffer.items():
+            table[name] = column[:n_steps].ravel().copy()
+        return table
+
+    def flush(self):
+        """Write the buffered steps to the Parquet file (or keep them as an in-memory chunk) and empty the buffer."""
+        if not self._buffer_steps:
+            return
+        table = self._chunk_table()
+        self._buffer_steps = []
+        if self.output_path is None:
+            self._chunks.append(table)
+            return
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        arrays = {}
+        for name, values in table.items():
+            if name in self.categories:
+                arrays[name] = pa.DictionaryArray.from_arrays(values, list(self.categories[name]))
+            else:
+                arrays[name] = pa.array(values)
+        arrow_table = pa.table(arrays)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.output_path, arrow_table.schema)
+        self._writer.write_table(arrow_table)
+
+    def close(self):
+        """Flush the remaining steps and close the Parquet file."""
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self._closed = self.output_path is not None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __del__(self):
+        # a run that is never closed still gets a complete Parquet file once its collector is garbage collected
+        if getattr(self, 'output_path', None) is not None and not self._closed:
+            self.close()
+
+    def get_model_vars_dataframe(self):
+        """Model variables as a DataFrame with one row per collected step, like mesa's DataCollector."""
+        return pd.DataFrame(self.model_vars)
+
+    def get_agent_vars_dataframe(self):
+        """
+        Agent variables as a DataFrame indexed by (Step, AgentID), like mesa's DataCollector.
+        Category columns are pandas Categoricals. With an output_path the file is closed (ending the agent
+        collection) and read back.
+        """
+        if self.output_path is not None:
+            self.close()
+            return pd.read_parquet(self.output_path).set_index(['Step', 'AgentID'])
+        self.flush()
+        columns = ['Step', 'AgentID'] + list(self.agent_reporters)
+        if not self._chunks:
+            return pd.DataFrame(columns=columns).set_index(['Step', 'AgentID'])
+        data = {name: np.concatenate([chunk[name] for chunk in self._chunks]) for name in columns}
+        for name, categories in self.categories.items():
+            data[name] = pd.Categorical.from_codes(data[name], categories=list(categories))
+        return pd.DataFrame(data).set_index(['Step', 'AgentID'])
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+pytest configuration of the model tests, run them from this directory with `python -m pytest -q`.
+
+The flood maps and the floodplain shapefile are not part of the repository, so the tests run on small synthetic input
+data: a model domain polygon, a floodplain of two rectangles in it and three flood depth rasters at 200 m resolution,
+written to a temporary input_data directory. The modules read the input data through paths relative to the working
+directory (e.g. ../input_data/floodmaps), some of them when they are imported, so the working directory is set to a
+model directory next to the synthetic input data before the test modules are collected.
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+import geopandas as gpd
+import numpy as np
+import rasterio as rs
+from rasterio.transform import from_origin
+from shapely.geometry import MultiPolygon, Polygon, box
+
+model_directory = os.path.dirname(os.path.abspath(__file__))
+if model_directory not in sys.path:
+    sys.path.insert(0, model_directory)
+
+# Corners of the synthetic model domain in EPSG:26915 (metres), an irregular polygon near Houston
+DOMAIN_CORNERS = [(250000, 3280000), (272000, 3276000), (281000, 3291000), (268000, 3302000), (249000, 3296000)]
+FLOOD_MAP_NAMES = ('Harvey_depth_meters', '100yr_storm_depth_meters', '500yr_storm_depth_meters')
+RESOLUTION = 200.0
+
+
+def write_input_data(input_directory):
+    """Write the synthetic model domain, floodplain and flood maps, and copy the depth-damage table."""
+    for directory in ('model_domain/houston_model', 'floodplain', 'floodmaps'):
+        os.makedirs(os.path.join(input_directory, directory))
+    domain = Polygon(DOMAIN_CORNERS)
+    gpd.GeoDataFrame(geometry=[domain], crs=26915).to_crs(4326).to_file(
+        os.path.join(input_directory, 'model_domain/houston_model/houston_model.shp'))
+    minx, miny, maxx, maxy = domain.bounds
+    centre_x, centre_y = (minx + maxx) / 2, (miny + maxy) / 2
+    floodplain = MultiPolygon([box(minx, miny, centre_x, centre_y), box(centre_x, centre_y, maxx, maxy)])
+    gpd.GeoDataFrame(geometry=[floodplain], crs=26915).to_crs(4269).to_file(
+        os.path.join(input_directory, 'floodplain/floodplain_area.shp'))
+
+    # depths with a few dry pixels (below 0), on a grid with a margin of 2 km around the domain
+    random_generator = np.random.default_rng(0)
+    width, height = int((maxx - minx + 4000) / RESOLUTION), int((maxy - miny + 4000) / RESOLUTION)
+    for name in FLOOD_MAP_NAMES:
+        depths = (random_generator.gamma(1.2, 0.8, size=(height, width)) - 0.4).astype('float32')
+        with rs.open(os.path.join(input_directory, 'floodmaps', f'{name}.tif'), 'w', driver='GTiff', height=height,
+                     width=width, count=1, dtype='float32', crs='EPSG:26915',
+                     transform=from_origin(minx - 2000, maxy + 2000, RESOLUTION, RESOLUTION)) as dataset:
+            dataset.write(depths, 1)
+    shutil.copy(os.path.join(model_directory, '..', 'input_data', 'flood_depth-damage_function.xlsx'), input_directory)
+
+
+def pytest_configure(config):
+    config.synthetic_root = tempfile.mkdtemp(prefix='flood_adaptation_tests_')
+    write_input_data(os.path.join(config.synthetic_root, 'input_data'))
+    working_directory = os.path.join(config.synthetic_root, 'model')
+    os.makedirs(working_directory)
+    config.original_working_directory = os.getcwd()
+    os.chdir(working_directory)
+
+
+def pytest_unconfigure(config):
+    os.chdir(config.original_working_directory)
+    shutil.rmtree(config.synthetic_root, ignore_errors=True)
+
+
+def pytest_report_header(config):
+    return f"synthetic input data: {os.path.join(config.synthetic_root, 'input_data')}"
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorized (struct-of-arrays) household engine for the Flood Adaptation Model.
+
+When the model is created with engine='vectorized', the household state is kept in NumPy arrays
+and all households are advanced with a few batched operations per step, instead of calling
+Households.step once per agent. The decision rules are the same as in agents.py, and for a given
+seed the engine produces the same adaptation decisions as the object path.
+"""
+import random
+import numpy as np
+import scipy.sparse as sp
+from mesa.time import SimultaneousActivation
+
+from functions import calculate_flood_damage
+
+# Income classes in the order of their protection level, 'default' is given to households that did not get a class
+INCOME_CLASSES = ('lower', 'lower-middle', 'middle', 'upper-middle', 'upper', 'default')
+# Protection types bought per income class (same order as INCOME_CLASSES, 'default' buys nothing)
+PROTECTION_TYPES = ('minimal_protection', 'basic_protection', 'medium_protection', 'high_protection', 'maximum_protection')
+PROTECTION_REDUCTIONS = np.array([0.10, 0.20, 0.35, 0.50, 0.60])
+NO_PROTECTION = -1
+
+
+class HouseholdArrays:
+    """
+    The household state as arrays and the array versions of the household and government actions.
+    Subclasses set the state arrays, the neighbourhood (neighbours, friend_count and _earlier_neighbours), the random
+    numbers (shock_random and campaign_random), the unique_ids of the elements and the model.
+    """
+
+    def __len__(self):
+        return len(self.is_adapted)
+
+    def _calculate_willingness(self, adapted_friends_percentage):
+        """Array version of Households.calculate_willingness."""
+        thresholds = self.model.decision_thresholds
+        friend_influence = np.where(adapted_friends_percentage > thresholds['friends_high'], 2,
+                                    np.where(adapted_friends_percentage >= thresholds['friends_medium'], 1, -1))
+        damage = self.flood_damage_estimated
+        damage_influence = np.select([damage >= thresholds['damage_high'], damage >= thresholds['damage_medium'],
+                                      damage >= thresholds['damage_low'], damage == 0],
+                                     [3, 2, 2, -2], default=0)
+        awareness_influence = np.select([self.awareness >= thresholds['awareness_high'],
+                                         self.awareness >= thresholds['awareness_medium']], [2, 1], default=0)
+        return friend_influence + damage_influence + awareness_influence
+
+    def step(self):
+        """
+        Advance all households by one step, the array version of Households.step.
+
+        Households.step changes is_adapted in place while the scheduler walks through the agents,
+        so a household sees the decisions of the households that were activated before it in the
+        same step. The new decisions are therefore found by fixed-point iteration: starting with no
+        new adaptations, every pass recomputes the decisions given the adaptations of earlier
+        neighbours of the previous pass. Adaptation can only switch on and willingness only grows
+        with the number of adapted friends, so this converges to exactly the sequential result.
+        """
+        adapted_before = self.is_adapted.copy()
+        has_friends = self.friend_count > 0
+        adapted_friends_before = self.neighbours @ adapted_before.view(np.int8)          # one sparse mat-vec for all households
+        newly_adapted = np.zeros(len(self), dtype=bool)
+        while True:
+            adapted_friends_count = adapted_friends_before
+            if newly_adapted.any():
+                adapted_friends_count = adapted_friends_before + self._earlier_neighbours @ newly_adapted.view(np.int8)
+            adapted_friends_percentage = self.adapted_friends_percentage.copy()
+            adapted_friends_percentage[has_friends] = adapted_friends_count[has_friends] / self.friend_count[has_friends]
+            willingness = self._calculate_willingness(adapted_friends_percentage)
+            decision = (willingness >= self.model.decision_thresholds['willingness']) & ~adapted_before
+            if np.array_equal(decision, newly_adapted):
+                break
+            newly_adapted = decision
+
+        self.adapted_friends_percentage = adapted_friends_percentage
+        self.willingness = willingness
+        self.is_adapted |= newly_adapted
+        self.model.household_totals.add('is_adapted', int(newly_adapted.sum()))
+
+        # Adapted households that did not finish their adaptation buy protection according to their income class
+        buying = self.is_adapted & ~self.final_adaption & (self.income_class < len(PROTECTION_TYPES))
+        protection = self.income_class[buying].astype(np.int8)
+        subsidized = self.subsidy[buying] == 1                           # subsidy upgrades the protection one level
+        protection[subsidized] = np.minimum(protection[subsidized] + 1, len(PROTECTION_TYPES) - 1)
+        self.protection[buying] = protection
+        self.reduction[buying] = PROTECTION_REDUCTIONS[protection]
+
+    def apply_adaptations(self):
+        """Lower the estimated flood depth and damage of households that adapted in the previous step."""
+        adapting = self.is_adapted & ~self.final_adaption
+        # Multiply in the dtype of the flood map, like the scalar arithmetic on the agents does
+        factor = (1 - self.reduction[adapting]).astype(self.flood_depth_estimated.dtype)
+        self.flood_depth_estimated[adapting] = self.flood_depth_estimated[adapting] * factor
+        old_damage = self.flood_damage_estimated[adapting].sum()
+        self.flood_damage_estimated[adapting] = calculate_flood_damage(self.flood_depth_estimated[adapting], self.model.damage_curve)
+        self.model.household_totals.add('flood_damage_estimated', self.flood_damage_estimated[adapting].sum() - old_damage)
+        self.final_adaption |= adapting
+
+    def apply_shock(self, factors=None, depths=None):
+        """
+        The actual flood: the actual depth is a random number between 0.8 and 1.2 times the estimated depth.
+        The model can pass other factors (e.g. one per zone of the flood map) and other depths (of a flood on another map).
+        """
+        if factors is None:
+            factors = 0.8 + (1.2 - 0.8) * self.shock_random
+        if depths is None:
+            depths = self.flood_depth_estimated
+        factor = factors.astype(self.flood_depth_estimated.dtype)
+        self.flood_depth_actual = factor * depths
+        old_damage = self.flood_damage_actual.sum()
+        self.flood_damage_actual = calculate_flood_damage(self.flood_depth_actual, self.model.damage_curve)
+        self.model.household_totals.add('flood_damage_actual', self.flood_damage_actual.sum() - old_damage)
+
+    def give_subsidies(self, subsidy_amount):
+        """Array version of Government.give_subsidies."""
+        self.subsidy += subsidy_amount
+
+    def awareness_campaign(self, targets=None):
+        """
+        Array version of Government.awareness_campaign, adding a random value between 0 and 1 to the awareness of the
+        households in targets (a boolean array per unique id, None is all households).
+        """
+        if targets is None:
+            self.awareness += self.campaign_random
+        else:
+            reached = targets[self.unique_ids]
+            self.awareness[reached] += self.campaign_random[reached]
+
+
+class VectorizedHouseholds(HouseholdArrays):
+    """
+    Struct-of-arrays representation of all Households of a model.
+    Element i of every array belongs to the i-th household in the schedule, so the array order is
+    also the activation order of the households.
+    """
+
+    def __init__(self, model, radius=2):
+        self.model = model
+        self.agents = list(model.schedule.agents)
+        depth_dtype = model.band_flood_img.dtype
+
+        # Household state, copied from the agents that were just created
+        self.awareness = np.array([agent.awareness for agent in self.agents], dtype=np.float64)
+        self.willingness = np.array([agent.willingness for agent in self.agents], dtype=np.int64)
+        self.is_adapted = np.array([agent.is_adapted for agent in self.agents], dtype=bool)
+        self.final_adaption = np.array([agent.final_adaption for agent in self.agents], dtype=bool)
+        self.reduction = np.array([agent.reduction for agent in self.agents], dtype=np.float64)
+        self.subsidy = np.array([agent.subsidy for agent in self.agents], dtype=np.int64)
+        self.adapted_friends_percentage = np.array([agent.adapted_friends_percentage for agent in self.agents], dtype=np.float64)
+        self.income_class = np.array([INCOME_CLASSES.index(agent.income_class) for agent in self.agents], dtype=np.int8)
+        self.protection = np.array([PROTECTION_TYPES.index(agent.protection_type) if hasattr(agent, 'protection_type') else NO_PROTECTION
+                                    for agent in self.agents], dtype=np.int8)
+        self.flood_depth_estimated = np.array([agent.flood_depth_estimated for agent in self.agents], dtype=depth_dtype)
+        self.flood_damage_estimated = np.array([agent.flood_damage_estimated for agent in self.agents], dtype=np.float64)
+        self.initial_damage_estimated = np.array([agent.initial_damage_estimated for agent in self.agents], dtype=np.float64)
+        self.flood_depth_actual = np.array([agent.flood_depth_actual for agent in self.agents], dtype=depth_dtype)
+        self.flood_damage_actual = np.array([agent.flood_damage_actual for agent in self.agents], dtype=np.float64)
+
+        # Random numbers for the shock and the awareness campaign. With rng='legacy' both are the
+        # first draw of random.Random(seed + unique_id), with rng='philox' they come from independent streams
+        unique_ids = np.array([agent.unique_id for agent in self.agents])
+        self.unique_ids = unique_ids
+        if model.random_streams is None:
+            self.shock_random = np.array([random.Random(model.seed + unique_id).random() for unique_id in unique_ids.tolist()])
+            self.campaign_random = self.shock_random
+        else:
+            self.shock_random = model.random_streams.random('shock')[unique_ids]
+            self.campaign_random = model.random_streams.random('awareness_campaign')[unique_ids]
+
+        # Social network neighbourhood of every household as a sparse matrix in schedule order
+        order = [model.node_index[agent.pos] for agent in self.agents]
+        self.neighbours = model.get_neighbourhood_matrix(radius)[order][:, order].tocsr()
+        self.friend_count = np.diff(self.neighbours.indptr)
+        # Neighbours that come earlier in the schedule have already stepped when a household steps
+        self._earlier_neighbours = sp.tril(self.neighbours, k=-1, format='csr')
+
+    def sync_agents(self):
+        """Write the array state back to the Households objects, so agent reporters and plots see the current state."""
+        columns = zip(self.agents, self.awareness.tolist(), self.willingness.tolist(), self.is_adapted.tolist(),
+                      self.final_adaption.tolist(), self.reduction.tolist(), self.subsidy.tolist(),
+                      self.adapted_friends_percentage.tolist(), self.flood_depth_estimated.tolist(),
+                      self.flood_damage_estimated.tolist(), self.flood_depth_actual.tolist(),
+                      self.flood_damage_actual.tolist(), self.protection.tolist())
+        for (agent, awareness, willingness, is_adapted, final_adaption, reduction, subsidy, adapted_friends_percentage,
+             flood_depth_estimated, flood_damage_estimated, flood_depth_actual, flood_damage_actual, protection) in columns:
+            agent.awareness = awareness
+            agent.willingness = willingness
+            agent.is_adapted = is_adapted
+            agent.final_adaption = final_adaption
+            agent.reduction = reduction
+            agent.subsidy = subsidy
+            agent.adapted_friends_percentage = adapted_friends_percentage
+            agent.flood_depth_estimated = flood_depth_estimated
+            agent.flood_damage_estimated = flood_damage_estimated
+            agent.flood_depth_actual = flood_depth_actual
+            agent.flood_damage_actual = flood_damage_actual
+            if protection != NO_PROTECTION:
+                agent.protection_type = PROTECTION_TYPES[protection]
+
+
+class VectorizedActivation(SimultaneousActivation):
+    """
+    Scheduler for the vectorized engine: instead of calling step on every household,
+    all households are stepped at once through model.households.
+    """
+
+    def step(self):
+        self.model.households.step()
+        self.steps += 1
+        self.time += 1
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+Ensemble engine: many seeds (replicates) of one scenario advanced together in one vectorized pass.
+
+A Monte Carlo over seeds with batch_run creates one AdaptationModel per seed and steps each of them in Python. The
+AdaptationEnsemble keeps the households of all replicates in (replicates x households) arrays instead. The social
+networks of the replicates are combined into one block-diagonal neighbourhood matrix, so every step of all replicates
+is one pass of the vectorized engine (see engine.py). The flood map, the damage curve and the income classes are the
+same for every replicate and are shared.
+
+Every replicate uses its own counter-based random streams (see rng.py) and bulk household placement, so replicate
+`seed` gives the same model variables as
+
+    AdaptationModel(seed=seed, rng='philox', household_placement=household_placement, engine='vectorized', ...)
+"""
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from agents import HouseholdTotals, make_decision_thresholds
+from engine import HouseholdArrays, INCOME_CLASSES, PROTECTION_TYPES, PROTECTION_REDUCTIONS, NO_PROTECTION
+from floodmaps import flood_map_cache, flood_map_paths, HouseholdPixelIndex
+from functions import (calculate_flood_damage, generate_random_locations_within_map_domain, get_flood_depths,
+                       load_damage_curve)
+from network import generate_network, neighbourhood_matrix, generate_adjacency, adjacency_neighbourhood
+from population import PopulationSynthesizer
+from rng import RandomStreams
+from spatial import HouseholdSpatialIndex, check_region
+
+# The model variables of AdaptationModel, computed per replicate
+MODEL_METRICS = {
+    "percentage_adapted_households": 'is_adapted',
+    "Average initial flood damage estimated": 'initial_damage_estimated',
+    "Average flood damage estimated": 'flood_damage_estimated',
+    "Average flood damage actual": 'flood_damage_actual',
+}
+
+
+class EnsembleHouseholds(HouseholdArrays):
+    """
+    The vectorized engine over the households of all replicates. The arrays are flat, element
+    replicate * number_of_households + unique_id belongs to household unique_id of that replicate.
+    There are no Households objects, the state only lives in the arrays.
+    """
+
+    def __init__(self, ensemble, state, neighbours):
+        self.model = ensemble
+        for name, values in state.items():
+            setattr(self, name, values)
+        self.unique_ids = np.arange(len(self.is_adapted))      # the flat position, as the awareness campaign targets are flat as well
+        self.neighbours = neighbours
+        self.friend_count = np.diff(self.neighbours.indptr)
+        # The blocks are on the diagonal, so the lower triangle is the lower triangle of every replicate
+        self._earlier_neighbours = sp.tril(self.neighbours, k=-1, format='csr')
+
+
+class AdaptationEnsemble:
+    """
+    Parameters
+    ----------
+    seeds: the seeds of the replicates
+    number_of_households, flood_map_choice, damage_curve, network, probability_of_network_connection,
+    number_of_edges, number_of_nearest_neighbours, gov_action_A_sub, gov_action_B_awa, decision_thresholds: as in AdaptationModel
+    flood_events, shock, shock_zone_size: the floods and how the actual depth varies around the flood map, as in AdaptationModel
+    gov_campaign_region: "all", "floodplain" or a shapely geometry, as in AdaptationModel
+    household_placement: "rejection" or "triangulation", the bulk placements of AdaptationModel
+    network_backend: "networkx" or "csr", as in AdaptationModel
+    radius: radius of the social network in which households count their adapted friends
+    antithetic: the antithetic partners of the replicates, as AdaptationModel(rng='philox', antithetic=True)
+    population_synthesizer: as in AdaptationModel
+    """
+
+    def __init__(self, seeds=range(100), number_of_households=100, flood_map_choice='harvey', damage_curve='basic',
+                 network='barabasi_albert', probability_of_network_connection=0.4, number_of_edges=3,
+                 number_of_nearest_neighbours=5, gov_action_A_sub=False, gov_action_B_awa=False, gov_campaign_region='all',
+                 household_placement='triangulation', network_backend='networkx', radius=2, antithetic=False,
+                 decision_thresholds=None, population_synthesizer=None, flood_events=None, shock='household',
+                 shock_zone_size=50):
+        self.seeds = list(seeds)
+        self.number_of_households = number_of_households
+        self.gov_action_A_sub = gov_action_A_sub
+        self.gov_action_B_awa = gov_action_B_awa
+        check_region(gov_campaign_region)
+        self.gov_campaign_region = gov_campaign_region
+        self.decision_thresholds = make_decision_thresholds(decision_thresholds)
+        self.steps = 0
+
+        if household_placement not in ('rejection', 'triangulation'):
+            raise ValueError(f"Unknown household placement: '{household_placement}'. "
+                             f"Currently implemented placements for ensembles are: 'rejection' and 'triangulation'")
+        if network_backend not in ('networkx', 'csr'):
+            raise ValueError(f"Unknown network backend: '{network_backend}'. "
+                             f"Currently implemented network backends are: 'networkx' and 'csr'")
+        if flood_map_choice not in flood_map_paths.keys():
+            raise ValueError(f"Unknown flood map choice: '{flood_map_choice}'. "
+                             f"Currently implemented choices are: {list(flood_map_paths.keys())}")
+        if flood_events is None:
+            flood_events = {5: flood_map_choice}
+        for step, event_map_choice in flood_events.items():
+            if event_map_choice not in flood_map_paths.keys():
+                raise ValueError(f"Unknown flood map choice of the flood at step {step}: '{event_map_choice}'. "
+                                 f"Currently implemented choices are: {list(flood_map_paths.keys())}")
+        if shock not in ('household', 'zonal'):
+            raise ValueError(f"Unknown shock: '{shock}'. "
+                             f"Currently implemented shocks are: 'household' and 'zonal'")
+        self.flood_map_choice = flood_map_choice
+        self.flood_events = dict(flood_events)
+        self.shock = shock
+        self.shock_zone_size = shock_zone_size
+        if damage_curve == 'basic':
+            self.damage_curve = None
+        elif damage_curve == 'table':
+            self.damage_curve = load_damage_curve()
+        else:
+            raise ValueError(f"Unknown damage curve: '{damage_curve}'. "
+                             f"Currently implemented damage curves are: 'basic' and 'table'")
+
+        # Shared by all replicates
+        self.flood_map = flood_map_cache.get(flood_map_paths[flood_map_choice])
+        band = self.flood_map.read(1)
+        if population_synthesizer is None:
+            population_synthesizer = PopulationSynthesizer()
+        income_class = np.array([INCOME_CLASSES.index(income_class)
+                                 for income_class in population_synthesizer.income_classes(number_of_households)], dtype=np.int8)
+        self.household_totals = HouseholdTotals()              # summed over all replicates, the model variables are per replicate
+
+        # Per replicate: the network, the random streams, the locations and the flood depths
+        # (the streams and pixels are kept for the floods, see apply_flood_shock)
+        neighbourhoods, replicates, campaign_targets = [], [], []
+        self.random_streams, self.pixel_indices = [], []
+        network_parameters = dict(probability_of_network_connection=probability_of_network_connection,
+                                  number_of_edges=number_of_edges, number_of_nearest_neighbours=number_of_nearest_neighbours)
+        for seed in self.seeds:
+            streams = RandomStreams(seed, number_of_households, antithetic=antithetic)
+            x, y = generate_random_locations_within_map_domain(number_of_households, streams.generator('household_placement'),
+                                                                method=household_placement)
+            spatial_index = HouseholdSpatialIndex(x, y)
+            if network_backend == 'networkx':
+                G = generate_network(network, number_of_households, seed, spatial_index=spatial_index, **network_parameters)
+                neighbourhoods.append(neighbourhood_matrix(G, radius=radius, nodelist=list(G.nodes())))
+            else:
+                adjacency = generate_adjacency(network, number_of_households, streams.generator('network'),
+                                               spatial_index=spatial_index, **network_parameters)
+                neighbourhoods.append(adjacency_neighbourhood(adjacency, radius=radius))
+            campaign_targets.append(spatial_index.households_in_region(gov_campaign_region))
+            self.random_streams.append(streams)
+            self.pixel_indices.append(HouseholdPixelIndex(x, y))
+            depth = get_flood_depths(self.flood_map, x, y, band)
+            population = population_synthesizer.synthesize(number_of_households, seed, streams)
+            replicates.append({
+                'awareness': population.awareness,
+                'is_adapted': population.is_adapted,
+                'flood_depth_estimated': np.where(depth < 0, np.zeros_like(depth), depth),
+                'shock_random': streams.random('shock'),
+                'campaign_random': streams.random('awareness_campaign'),
+            })
+        state = {name: np.concatenate([replicate[name] for replicate in replicates]) for name in replicates[0]}
+        # the households the awareness campaign reaches in all replicates, None is all households
+        self.campaign_targets = None if campaign_targets[0] is None else np.concatenate(campaign_targets)
+
+        # The initial state of Households.__init__, for all replicates at once
+        size = len(self.seeds) * number_of_households
+        state['income_class'] = np.tile(income_class, len(self.seeds))
+        state['willingness'] = np.zeros(size, dtype=np.int64)
+        state['final_adaption'] = np.zeros(size, dtype=bool)
+        state['subsidy'] = np.zeros(size, dtype=np.int64)
+        state['adapted_friends_percentage'] = np.zeros(size, dtype=np.float64)
+        # Households that are adapted from the start bought the protection of their income class
+        buying = state['is_adapted'] & (state['income_class'] < len(PROTECTION_TYPES))
+        state['protection'] = np.where(buying, state['income_class'], NO_PROTECTION).astype(np.int8)
+        state['reduction'] = np.where(buying, PROTECTION_REDUCTIONS[np.minimum(state['income_class'], len(PROTECTION_TYPES) - 1)], 0.0)
+        state['flood_damage_estimated'] = calculate_flood_damage(state['flood_depth_estimated'], self.damage_curve)
+        state['initial_damage_estimated'] = state['flood_damage_estimated'].copy()
+        state['flood_depth_actual'] = np.zeros(size, dtype=band.dtype)
+        state['flood_damage_actual'] = calculate_flood_damage(state['flood_depth_actual'], self.damage_curve)
+
+        self.households = EnsembleHouseholds(self, state, sp.block_diag(neighbourhoods, format='csr'))
+        for field in HouseholdTotals.FIELDS:
+            self.household_totals.add(field, getattr(self.households, field).sum())
+        self.household_totals.count = size
+        self.model_vars = {name: [] for name in MODEL_METRICS}
+
+    def replicate_values(self, field):
+        """The values of a household variable as a (replicates x households) array (a view, not a copy)."""
+        return getattr(self.households, field).reshape(len(self.seeds), self.number_of_households)
+
+    def collect(self):
+        """Collect the model variables of every replicate."""
+        for name, field in MODEL_METRICS.items():
+            self.model_vars[name].append(self.replicate_values(field).sum(axis=1) / self.number_of_households)
+
+    def step(self):
+        """Advance all replicates by one step, like AdaptationModel.step with the vectorized engine."""
+        if self.gov_action_A_sub and self.steps == 0:
+            self.households.give_subsidies(1)
+        if self.gov_action_B_awa and self.steps == 2:
+            self.households.awareness_campaign(self.campaign_targets)
+        self.households.apply_adaptations()
+        if self.steps in self.flood_events:
+            self.apply_flood_shock(self.flood_events[self.steps])
+        self.collect()
+        self.households.step()
+        self.steps += 1
+
+    def apply_flood_shock(self, flood_map_choice):
+        """A flood in all replicates, like AdaptationModel.apply_flood_shock with rng='philox'."""
+        flood_map = flood_map_cache.get(flood_map_paths[flood_map_choice])
+        depths = None
+        if flood_map_choice != self.flood_map_choice:
+            # the depths on the other map, lowered by the protection of households that adapted (exposed_flood_depths)
+            depths = np.concatenate([pixel_index.depths(flood_map) for pixel_index in self.pixel_indices])
+            depths = np.where(depths < 0, np.zeros_like(depths), depths)
+            protection = np.where(self.households.final_adaption, self.households.reduction, 0)
+            depths = depths * (1 - protection).astype(depths.dtype)
+
+        if self.shock == 'zonal':
+            factors = []
+            for streams, pixel_index in zip(self.random_streams, self.pixel_indices):
+                zones, number_of_zones = pixel_index.zones(flood_map, self.shock_zone_size)
+                zone_random = streams.generator(f'shock_zones_{self.steps}').random(number_of_zones)
+                factors.append((0.8 + (1.2 - 0.8) * zone_random)[zones])
+            factors = np.concatenate(factors)
+        elif self.steps != min(self.flood_events):
+            # a later flood draws new factors (AdaptationModel.event_shock_factors)
+            factors = np.concatenate([0.8 + (1.2 - 0.8) * streams.random(f'shock_{self.steps}') for streams in self.random_streams])
+        else:
+            factors = None
+        self.households.apply_shock(factors=factors, depths=depths)
+
+    def run(self, steps):
+        """Advance all replicates by the given number of steps."""
+        for _ in range(steps):
+            self.step()
+
+    def get_model_vars_dataframe(self):
+        """The model variables with one row per replicate per collected step, with the Seed and Step of each row."""
+        number_of_steps = len(self.model_vars["percentage_adapted_households"])
+        data = {'Seed': np.tile(self.seeds, number_of_steps),
+                'Step': np.repeat(np.arange(number_of_steps), len(self.seeds))}
+        for name, values in self.model_vars.items():
+            data[name] = np.concatenate(values) if values else np.empty(0)
+        return pd.DataFrame(data)
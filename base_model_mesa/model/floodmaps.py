@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""
+Process-wide cache of the flood maps used by AdaptationModel.initialize_maps.
+
+Every model used to open the flood map GeoTIFF and decode the full band into its own array, so a batch run with
+100 seeds decoded the same map 100 times. The cache decodes each map once per process (or once per machine when
+shared memory is used) and hands every model the same read-only array. With window_bounds only the pixels covering
+those bounds (e.g. the model domain) are decoded, and with memmap_dir the decoded band is written once to an
+uncompressed .npy file that every process maps read-only, so a worker does not hold its own copy of the band.
+
+HouseholdPixelIndex looks up the pixel of every household once, so the flood depths of all households on any of the
+flood maps are one NumPy gather (e.g. for flood events from other maps than the one the households estimate their
+depth from, or for shocks that differ per zone of the map).
+"""
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing import shared_memory
+
+import numpy as np
+import rasterio as rs
+from rasterio.coords import BoundingBox
+from rasterio.windows import Window
+from rasterio.transform import TransformMethodsMixin, rowcol
+
+# Define paths to flood maps
+flood_map_paths = {
+    'harvey': r'../input_data/floodmaps/Harvey_depth_meters.tif',
+    '100yr': r'../input_data/floodmaps/100yr_storm_depth_meters.tif',
+    '500yr': r'../input_data/floodmaps/500yr_storm_depth_meters.tif'  # Example path for 500yr flood map
+}
+
+
+class FloodMap(TransformMethodsMixin):
+    """
+    A decoded flood map: the read-only band 1 with the transform and bounds of the GeoTIFF, or of the window of it
+    that was read.
+    Like an opened rasterio dataset it has index(x, y) and read(1), so it can be used wherever the model used the dataset.
+    """
+
+    def __init__(self, path, band, transform, bounds, crs, shared_memory_block=None, grid_offset=(0, 0), grid_shape=None):
+        self.path = path
+        self.band = band
+        self.transform = transform
+        self.bounds = bounds
+        self.crs = crs
+        self.grid_offset = grid_offset                          # (row, col) of the band in the full GeoTIFF
+        self.grid_shape = band.shape if grid_shape is None else grid_shape   # (height, width) of the full GeoTIFF
+        self._shared_memory_block = shared_memory_block         # keeps the shared memory mapped while the map is used
+
+    def read(self, index=1):
+        """Return the band, only band 1 is cached."""
+        if index != 1:
+            raise ValueError("Only band 1 of a flood map is cached")
+        return self.band
+
+
+class FloodMapCache:
+    """
+    Bounded LRU cache of flood maps, keyed by the path and modification time of the GeoTIFF.
+
+    Parameters
+    ----------
+    max_entries: number of flood maps kept, the least recently used map is dropped first
+    use_shared_memory: place the decoded band in multiprocessing.shared_memory, so that processes on the same
+                       machine (e.g. pool workers) map one copy instead of each decoding their own. Call preload in the
+                       parent process before starting the workers, and close(unlink=True) when the work is done.
+    window_bounds: (left, bottom, right, top), only the pixels covering these bounds are read instead of the full band,
+                   with one extra row and column before them for the band[row - 1, col - 1] lookup of get_flood_depth.
+                   The transform of a cached map is that of the window, so its depth lookups are the same.
+    memmap_dir: directory to write the decoded (windowed) band to as an uncompressed .npy file, which is then mapped
+                read-only. Processes using the same directory decode each map once and share its pages. The files
+                are named after the path, modification time and window of the map, so they are not reused when the
+                GeoTIFF changes.
+    shared_memory_timeout: seconds to wait for another process that is decoding a map into shared memory. When the
+                           band is not ready by then (e.g. that process died), the map is decoded locally instead.
+    """
+
+    def __init__(self, max_entries=3, use_shared_memory=False, window_bounds=None, memmap_dir=None,
+                 shared_memory_timeout=60):
+        self.max_entries = max_entries
+        self.use_shared_memory = use_shared_memory
+        self.window_bounds = window_bounds
+        self.memmap_dir = memmap_dir
+        self.shared_memory_timeout = shared_memory_timeout
+        self._entries = OrderedDict()
+        self._created_blocks = []                               # shared memory this process created and may unlink
+        self._lock = threading.Lock()
+
+    def _key(self, path):
+        path = os.path.abspath(path)
+        window_bounds = None if self.window_bounds is None else tuple(self.window_bounds)
+        # maps kept in another way are other entries, so changing the settings never returns a map of the old settings
+        storage = 'memmap' if self.memmap_dir is not None else 'shared_memory' if self.use_shared_memory else 'memory'
+        return path, os.stat(path).st_mtime_ns, window_bounds, storage
+
+    def get(self, path):
+        """Return the FloodMap of the GeoTIFF at path, decoding it only if it is not cached yet."""
+        key = self._key(path)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            flood_map = self._load(key)
+            self._entries[key] = flood_map
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return flood_map
+
+    def preload(self, *paths):
+        """Decode the given flood maps now, e.g. in the parent process before the pool workers start."""
+        for path in paths:
+            self.get(path)
+
+    def clear(self):
+        """Drop all cached flood maps."""
+        with self._lock:
+            self._entries.clear()
+
+    def close(self, unlink=False):
+        """Drop all cached maps and, with unlink=True, remove the shared memory blocks this process created."""
+        self.clear()
+        if unlink:
+            for block in self._created_blocks:
+                block.close()
+                block.unlink()
+            self._created_blocks = []
+
+    def _window(self, dataset):
+        """The window of whole pixels that covers window_bounds, None for the full band."""
+        if self.window_bounds is None:
+            return None
+        window = dataset.window(*self.window_bounds)
+        row_start = max(math.floor(window.row_off) - 1, 0)
+        col_start = max(math.floor(window.col_off) - 1, 0)
+        row_stop = min(math.ceil(window.row_off + window.height), dataset.height)
+        col_stop = min(math.ceil(window.col_off + window.width), dataset.width)
+        return Window(col_start, row_start, col_stop - col_start, row_stop - row_start)
+
+    def _load(self, key):
+        path = key[0]
+        if self.use_shared_memory and self.memmap_dir is not None:
+            raise ValueError("A flood map can be placed in shared memory or in a memory-mapped file, not both")
+        with rs.open(path) as dataset:
+            window = self._window(dataset)
+            if window is None:
+                transform, bounds = dataset.transform, dataset.bounds
+            else:
+                transform, bounds = dataset.window_transform(window), BoundingBox(*dataset.window_bounds(window))
+            block = None
+            if self.memmap_dir is not None:
+                band = self._read_into_memmap(key, dataset, window)
+            elif self.use_shared_memory:
+                band, block = self._read_into_shared_memory(key, dataset, window)
+            else:
+                band = dataset.read(1, window=window)
+            band.setflags(write=False)
+            grid_offset = (0, 0) if window is None else (window.row_off, window.col_off)
+            return FloodMap(path, band, transform, bounds, dataset.crs, block, grid_offset, dataset.shape)
+
+    def _read_into_memmap(self, key, dataset, window):
+        """
+        Map the .npy file of this flood map, or decode the band and write the file first. The file is written
+        under a temporary name and renamed, so other processes never map a partly written file.
+        """
+        file_path = os.path.join(self.memmap_dir, 'floodmap_' + hashlib.sha1(repr(key).encode()).hexdigest()[:20] + '.npy')
+        if not os.path.exists(file_path):
+            os.makedirs(self.memmap_dir, exist_ok=True)
+            temporary_path = f'{file_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(temporary_path, 'wb') as file:
+                np.save(file, dataset.read(1, window=window))
+            os.replace(temporary_path, file_path)
+        return np.load(file_path, mmap_mode='r')
+
+    def _read_into_shared_memory(self, key, dataset, window):
+        """
+        Attach to the shared memory block of this flood map, or create it and decode the band into it.
+        The first byte of the block is set once the band is complete, so processes that attach while another
+        process is still decoding wait for it, for at most shared_memory_timeout seconds. After that the band is
+        decoded into local memory, so a process that died while decoding does not block the others.
+        """
+        name = 'floodmap_' + hashlib.sha1(repr(key).encode()).hexdigest()[:20]
+        dtype = np.dtype(dataset.dtypes[0])
+        shape = (dataset.height, dataset.width) if window is None else (window.height, window.width)
+        offset = dtype.itemsize                                 # the ready flag, padded to keep the band aligned
+        try:
+            block = shared_memory.SharedMemory(name=name, create=True, size=offset + int(np.prod(shape)) * dtype.itemsize)
+        except FileExistsError:
+            block = shared_memory.SharedMemory(name=name)
+            try:
+                wait_until_ready(block, self.shared_memory_timeout)
+            except TimeoutError:
+                block.close()
+                return dataset.read(1, window=window), None
+            return np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=offset), block
+        band = None
+        try:
+            band = np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=offset)
+            dataset.read(1, out=band, window=window)
+        except BaseException:
+            # remove the unfinished block, so other processes decode the map themselves instead of waiting for it
+            band = None                                         # release the buffer, so the block can be closed
+            block.close()
+            block.unlink()
+            raise
+        block.buf[0] = 1
+        self._created_blocks.append(block)
+        return band, block
+
+
+def wait_until_ready(block, timeout, interval=0.01):
+    """Wait until the ready flag (the first byte) of a shared memory block is set, raise TimeoutError after timeout seconds."""
+    deadline = time.monotonic() + timeout
+    while block.buf[0] != 1:
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"Shared memory block '{block.name}' was not ready after {timeout} seconds")
+        time.sleep(interval)
+
+
+class HouseholdPixelIndex:
+    """
+    The (row, col) of every household on the flood maps, computed once for all households from the raster transform.
+    The flood maps share one grid, so the index is computed once per run; a map on another grid gets its own index
+    the first time it is used.
+
+    Parameters
+    ----------
+    x, y: arrays with the coordinates of the household locations, in schedule order
+    """
+
+    def __init__(self, x, y):
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self._pixels = {}                                       # (transform, shape) -> (rows, cols)
+
+    def __len__(self):
+        return len(self.x)
+
+    def pixels(self, flood_map):
+        """The row and column of every household in the band of flood_map, as used by get_flood_depth."""
+        band = flood_map.read(1)
+        key = (tuple(flood_map.transform), band.shape)
+        if key not in self._pixels:
+            rows, cols = rowcol(flood_map.transform, self.x, self.y)
+            # get_flood_depth reads band[row - 1, col - 1], the index keeps that offset
+            self._pixels[key] = (np.asarray(rows, dtype=np.intp) - 1, np.asarray(cols, dtype=np.intp) - 1)
+        return self._pixels[key]
+
+    def depths(self, flood_map):
+        """The flood depth of every household on flood_map, in the dtype of the band."""
+        rows, cols = self.pixels(flood_map)
+        return flood_map.read(1)[rows, cols]
+
+    def zones(self, flood_map, zone_size):
+        """
+        The zone of every household when the full GeoTIFF of flood_map is divided into square zones of
+        zone_size x zone_size pixels, numbered row by row, so the zones do not depend on the window that was read.
+        Returns the zones and the number of zones.
+        """
+        rows, cols = self.pixels(flood_map)
+        row_offset, col_offset = flood_map.grid_offset
+        height, width = flood_map.grid_shape
+        zones_per_row = -(-width // zone_size)
+        number_of_zones = -(-height // zone_size) * zones_per_row
+        # rows and cols of -1 (households on the first row or column of the full band) are the last ones, as in the band
+        rows, cols = (rows + row_offset) % height, (cols + col_offset) % width
+        return (rows // zone_size) * zones_per_row + cols // zone_size, number_of_zones
+
+
+# The cache shared by all models in this process
+flood_map_cache = FloodMapCache()
@@ -8,14 +8,23 @@ Functions get called by the Model and Agent class.
 import random
 import numpy as np
 import math
+from collections import namedtuple
+from functools import lru_cache
+import pandas as pd
+import shapely
 from shapely import contains_xy
 from shapely import prepare
+from rasterio.transform import rowcol
 import geopandas as gpd
 
+from geodata import load_geodata, triangulate_polygon, shapefile_path, floodplain_path, MODEL_EPSG
+
 def set_initial_values(input_data, parameter, seed):
     """
     Function to set the values based on the distribution shown in the input data for each parameter.
     The input data contains which percentage of households has a certain initial value.
+    To set the values of all households at once, read the distribution once with population.distribution_from_table
+    and give it to a PopulationSynthesizer (see population.py).
     
     Parameters
     ----------
@@ -65,34 +74,37 @@ def get_flood_map_data(flood_map):
     bound_b = flood_map.bounds.bottom
     return band, bound_l, bound_r, bound_t, bound_b
 
-shapefile_path = r'../input_data/model_domain/houston_model/houston_model.shp'
-floodplain_path = r'../input_data/floodplain/floodplain_area.shp'
+# Model area and floodplain setup, read from the preprocessed bundle when it is up to date (see geodata.py)
+geodata = load_geodata(shapefile_path, floodplain_path)
 
 # Model area setup
-map_domain_gdf = gpd.GeoDataFrame.from_file(shapefile_path)
-map_domain_gdf = map_domain_gdf.to_crs(epsg=26915)
+map_domain_polygon = geodata['map_domain_polygon']
+map_minx, map_miny, map_maxx, map_maxy = geodata['map_domain_bounds']
+map_domain_gdf = gpd.GeoDataFrame(geometry=[map_domain_polygon], crs=f'EPSG:{MODEL_EPSG}')
 map_domain_geoseries = map_domain_gdf['geometry']
-map_minx, map_miny, map_maxx, map_maxy = map_domain_geoseries.total_bounds
-map_domain_polygon = map_domain_geoseries[0]  # The geoseries contains only one polygon
 prepare(map_domain_polygon)
 
 # Floodplain setup
-floodplain_gdf = gpd.GeoDataFrame.from_file(floodplain_path)
-floodplain_gdf = floodplain_gdf.to_crs(epsg=26915)
+floodplain_multipolygon = geodata['floodplain_multipolygon']
+floodplain_gdf = gpd.GeoDataFrame(geometry=[floodplain_multipolygon], crs=f'EPSG:{MODEL_EPSG}')
 floodplain_geoseries = floodplain_gdf['geometry']
-floodplain_multipolygon = floodplain_geoseries[0]  # The geoseries contains only one multipolygon
 prepare(floodplain_multipolygon)
 
-def generate_random_location_within_map_domain(model_seed, agent_id):
+def generate_random_location_within_map_domain(model_seed, agent_id, rng=None):
     """
     Generate random location coordinates within the map domain polygon.
+    Without rng the location is drawn from random.Random(model_seed + agent_id), otherwise from rng
+    (e.g. the household's stream from RandomStreams.generator).
 
     Returns
     -------
     x, y: lists of location coordinates, longitude and latitude
     """
-    unique_seed = model_seed + agent_id                    #creates a unique seed so not all agents are placed on the same place on the map when there is a seed
-    local_random = random.Random(unique_seed)
+    if rng is None:
+        unique_seed = model_seed + agent_id                #creates a unique seed so not all agents are placed on the same place on the map when there is a seed
+        local_random = random.Random(unique_seed)
+    else:
+        local_random = rng
     while True:
         # generate random location coordinates within square area of map domain
         x = local_random.uniform(map_minx, map_maxx)                                   #only added local
@@ -101,6 +113,76 @@ def generate_random_location_within_map_domain(model_seed, agent_id):
         if contains_xy(map_domain_polygon, x, y):
             return x, y
 
+_map_domain_triangulation = geodata.get('map_domain_triangulation')   # from the bundle, otherwise computed on first use
+
+def get_map_domain_triangulation():
+    """Triangulation of map_domain_polygon, computed once per process."""
+    global _map_domain_triangulation
+    if _map_domain_triangulation is None:
+        _map_domain_triangulation = triangulate_polygon(map_domain_polygon)
+    return _map_domain_triangulation
+
+def generate_random_locations_within_map_domain(number_of_locations, seed, method='rejection', agent_ids=None, block_size=100_000,
+                                                streams=None):
+    """
+    Generate random location coordinates within the map domain polygon for many households at once.
+
+    Parameters
+    ----------
+    number_of_locations: number of locations to generate
+    seed: model seed, or a np.random.Generator to draw from (not used by "per_agent")
+    method: "rejection" draws candidate points in NumPy blocks within the bounds of the map domain and keeps the ones
+            inside the polygon (one vectorized contains_xy call per block),
+            "triangulation" samples points uniformly over the triangles of the polygon, so no point is rejected,
+            "per_agent" calls generate_random_location_within_map_domain for every agent, giving the same locations
+            as households placing themselves one by one
+    agent_ids: unique ids of the agents, only used by "per_agent", defaults to 0 .. number_of_locations - 1
+    block_size: maximum number of candidate points drawn at once for "rejection"
+    streams: only used by "per_agent", the RandomStreams of a model with rng='philox', each location is then drawn
+             from the 'location' stream of its agent
+
+    Returns
+    -------
+    x, y: arrays of location coordinates
+    """
+    if method == 'per_agent':
+        if agent_ids is None:
+            agent_ids = range(number_of_locations)
+        locations = [generate_random_location_within_map_domain(seed, agent_id,
+                                                                rng=None if streams is None else streams.generator('location', agent_id))
+                     for agent_id in agent_ids]
+        x, y = np.array(locations, dtype=np.float64).reshape(-1, 2).T
+        return x, y
+
+    rng = np.random.default_rng(seed)
+    if method == 'rejection':
+        acceptance = map_domain_polygon.area / ((map_maxx - map_minx) * (map_maxy - map_miny))
+        x_accepted, y_accepted = [], []
+        remaining = number_of_locations
+        while remaining > 0:
+            # draw a bit more than expected to be needed, so that usually one block is enough
+            candidates = min(block_size, int(remaining / acceptance * 1.1) + 16)
+            x = rng.uniform(map_minx, map_maxx, candidates)
+            y = rng.uniform(map_miny, map_maxy, candidates)
+            inside = contains_xy(map_domain_polygon, x, y)
+            x, y = x[inside][:remaining], y[inside][:remaining]
+            x_accepted.append(x)
+            y_accepted.append(y)
+            remaining -= len(x)
+        return np.concatenate(x_accepted), np.concatenate(y_accepted)
+    elif method == 'triangulation':
+        triangles, cumulative_area = get_map_domain_triangulation()
+        # choose triangles proportional to their area, then a uniform point within each triangle
+        chosen = triangles[np.searchsorted(cumulative_area, rng.random(number_of_locations), side='right')]
+        r1 = np.sqrt(rng.random(number_of_locations))
+        r2 = rng.random(number_of_locations)
+        points = ((1 - r1)[:, None] * chosen[:, 0] + (r1 * (1 - r2))[:, None] * chosen[:, 1]
+                  + (r1 * r2)[:, None] * chosen[:, 2])
+        return points[:, 0], points[:, 1]
+    else:
+        raise ValueError(f"Unknown placement method: '{method}'. "
+                         f"Currently implemented methods are: 'rejection', 'triangulation', and 'per_agent'")
+
 def get_flood_depth(corresponding_map, location, band):
     """ 
     To get the flood depth of a specific location within the model domain.
@@ -121,6 +203,24 @@ def get_flood_depth(corresponding_map, location, band):
     return depth
     
 
+def get_flood_depths(corresponding_map, x, y, band):
+    """
+    Array version of get_flood_depth: the flood depths at many locations at once.
+
+    Parameters
+    ----------
+    corresponding_map: flood map used
+    x, y: arrays with the coordinates of the household locations
+    band: band from the flood map
+
+    Returns
+    -------
+    depths: array of flood depths, in the dtype of the band
+    """
+    rows, cols = rowcol(corresponding_map.transform, np.asarray(x), np.asarray(y))
+    return band[np.asarray(rows) - 1, np.asarray(cols) - 1]
+
+
 def get_position_flood(bound_l, bound_r, bound_t, bound_b, img, seed):
     """ 
     To generater the position on flood map for a household.
@@ -142,23 +242,84 @@ def get_position_flood(bound_l, bound_r, bound_t, bound_b, img, seed):
     row, col = img.index(x, y)
     return x, y, row, col
 
-def calculate_basic_flood_damage(flood_depth):
+damage_function_path = r'../input_data/flood_depth-damage_function.xlsx'
+
+class DamageCurve(namedtuple('DamageCurve', ['depths', 'factors'])):
+    """Piecewise depth-damage table: damage factors at increasing flood depths, evaluated by linear interpolation."""
+
+@lru_cache(maxsize=8)
+def load_damage_curve(path=damage_function_path, sheet_name=0):
+    """
+    Load a depth-damage table from a spreadsheet with the water depth (m) in the first column and the damage factor
+    in the second column, like input_data/flood_depth-damage_function.xlsx. Rows that are not numbers are skipped.
+
+    Parameters
+    ----------
+    path: path of the spreadsheet
+    sheet_name: sheet with the table
+
+    Returns
+    -------
+    curve: DamageCurve with the depths sorted from low to high, loaded once per path and sheet
+    """
+    table = pd.read_excel(path, sheet_name=sheet_name, usecols=[0, 1])
+    table = table.apply(pd.to_numeric, errors='coerce').dropna()
+    table = table.sort_values(table.columns[0])
+    depths = table.iloc[:, 0].to_numpy(dtype=np.float64)
+    factors = table.iloc[:, 1].to_numpy(dtype=np.float64)
+    depths.setflags(write=False)                       # the cached curve is shared by all models
+    factors.setflags(write=False)
+    return DamageCurve(depths, factors)
+
+def calculate_flood_damage(flood_depth, curve=None):
+    """
+    To get flood damage for an array of flood depths.
+    Without a curve this is the function of calculate_basic_flood_damage: from de Moer, Huizinga (2017) with
+    logarithmic regression over it, no damage below 0.025 m and damage = 1 from 6 m.
+    With a DamageCurve the damage is interpolated linearly between the points of the table, there is no damage
+    below the lowest depth of the table and the damage of the highest depth above it.
+
+    Parameters
+    ----------
+    flood_depth : flood depths (a number or an array)
+    curve : DamageCurve to use instead of the logarithmic function
+
+    Returns
+    -------
+    flood_damage : array of damage factors between 0 and 1
+    """
+    flood_depth = np.asarray(flood_depth, dtype=np.float64)
+    if curve is not None:
+        return np.interp(flood_depth, curve.depths, curve.factors, left=0, right=curve.factors[-1])
+
+    flood_damage = np.zeros(flood_depth.shape)
+    flood_damage[flood_depth >= 6] = 1
+    in_range = (flood_depth >= 0.025) & (flood_depth < 6)
+    # see flood_damage.xlsx for function generation
+    flood_damage[in_range] = 0.1746 * np.log(flood_depth[in_range]) + 0.6483
+    return flood_damage
+
+def calculate_basic_flood_damage(flood_depth, curve=None):
     """
     To get flood damage based on flood depth of household
     from de Moer, Huizinga (2017) with logarithmic regression over it.
     If flood depth > 6m, damage = 1.
+    This is the single household version of calculate_flood_damage, arrays and curves are passed on to it.
     
     Parameters
     ----------
     flood_depth : flood depth as given by location within model domain
+    curve : DamageCurve to use instead of the logarithmic function
 
     Returns
     -------
     flood_damage : damage factor between 0 and 1
     """
+    if curve is not None or not isinstance(flood_depth, (int, float, np.number)):
+        flood_damage = calculate_flood_damage(flood_depth, curve)
+        return flood_damage.item() if flood_damage.ndim == 0 else flood_damage
 
-
-
+    # A single number, this is called once per household, so it stays in plain Python
     if flood_depth >= 6:
         flood_damage = 1
     elif flood_depth < 0.025:
@@ -167,7 +328,3 @@ def calculate_basic_flood_damage(flood_depth):
         # see flood_damage.xlsx for function generation
         flood_damage = 0.1746 * math.log(flood_depth) + 0.6483
     return flood_damage
-
-
-
-
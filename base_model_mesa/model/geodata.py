@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Loading of the model domain and floodplain geometries used by functions.py.
+
+Reading the shapefiles and reprojecting them to EPSG:26915 is slow and used to happen in every process that
+imported functions.py. Running this file once writes the reprojected geometries, their bounds and the sampling
+triangulation of the model domain into one binary bundle:
+
+    python geodata.py
+
+At import, functions.py loads the bundle instead. The bundle stores a fingerprint of the source files, so when
+a shapefile changes (or the bundle has an older version) it is ignored and the shapefiles are read as before.
+"""
+import hashlib
+import os
+import numpy as np
+import shapely
+import geopandas as gpd
+
+shapefile_path = r'../input_data/model_domain/houston_model/houston_model.shp'
+floodplain_path = r'../input_data/floodplain/floodplain_area.shp'
+bundle_path = r'../input_data/geodata_bundle.npz'
+
+BUNDLE_VERSION = 1                                   # increase when the content of the bundle changes
+MODEL_EPSG = 26915
+SHAPEFILE_PARTS = ('.shp', '.shx', '.dbf', '.prj')   # the files of a shapefile that determine the geometry
+
+
+def source_fingerprint(*paths):
+    """
+    Content fingerprint of the shapefiles the bundle is made from.
+
+    Parameters
+    ----------
+    paths: paths of the .shp files, the other parts of each shapefile are included as well
+
+    Returns
+    -------
+    fingerprint: sha256 hex digest of the names and contents of the files
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        base = os.path.splitext(path)[0]
+        for part in SHAPEFILE_PARTS:
+            part_path = base + part
+            if not os.path.exists(part_path):
+                continue
+            digest.update(os.path.basename(part_path).encode())
+            with open(part_path, 'rb') as file:
+                digest.update(file.read())
+    return digest.hexdigest()
+
+
+def triangulate_polygon(polygon):
+    """
+    Split a polygon into triangles that exactly cover it, used for sampling locations without rejection.
+
+    Parameters
+    ----------
+    polygon: shapely (Multi)Polygon
+
+    Returns
+    -------
+    triangles: array of shape (T, 3, 2) with the corner coordinates of each triangle
+    cumulative_area: cumulative share of the total area per triangle, the last value is 1
+    """
+    triangle_geoms = shapely.get_parts(shapely.constrained_delaunay_triangles(polygon))
+    triangles = np.stack([np.asarray(triangle.exterior.coords)[:3] for triangle in triangle_geoms])
+    a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+    area = 0.5 * np.abs((b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (c[:, 0] - a[:, 0]) * (b[:, 1] - a[:, 1]))
+    cumulative_area = np.cumsum(area) / area.sum()
+    cumulative_area[-1] = 1.0
+    return triangles, cumulative_area
+
+
+def read_shapefiles(shapefile_path=shapefile_path, floodplain_path=floodplain_path):
+    """
+    Read the model domain and floodplain shapefiles and reproject them to EPSG:26915.
+
+    Returns
+    -------
+    geodata: dict with the map domain polygon, the floodplain multipolygon and their bounds
+    """
+    map_domain_gdf = gpd.GeoDataFrame.from_file(shapefile_path).to_crs(epsg=MODEL_EPSG)
+    floodplain_gdf = gpd.GeoDataFrame.from_file(floodplain_path).to_crs(epsg=MODEL_EPSG)
+    return {
+        'map_domain_polygon': map_domain_gdf['geometry'][0],                # The geoseries contains only one polygon
+        'map_domain_bounds': np.asarray(map_domain_gdf['geometry'].total_bounds, dtype=np.float64),
+        'floodplain_multipolygon': floodplain_gdf['geometry'][0],           # The geoseries contains only one multipolygon
+        'floodplain_bounds': np.asarray(floodplain_gdf['geometry'].total_bounds, dtype=np.float64),
+    }
+
+
+def write_bundle(shapefile_path=shapefile_path, floodplain_path=floodplain_path, path=bundle_path):
+    """
+    Preprocessing step: write the reprojected geometries, their bounds and the triangulation of the map domain
+    into one bundle. The file is written next to its destination first and then moved, so processes that load
+    the bundle at the same time never see half a file.
+    """
+    geodata = read_shapefiles(shapefile_path, floodplain_path)
+    triangles, cumulative_area = triangulate_polygon(geodata['map_domain_polygon'])
+    temporary_path = f'{path}.{os.getpid()}.tmp'
+    with open(temporary_path, 'wb') as file:
+        np.savez(file,
+                 version=np.int64(BUNDLE_VERSION),
+                 fingerprint=np.str_(source_fingerprint(shapefile_path, floodplain_path)),
+                 map_domain_wkb=np.frombuffer(shapely.to_wkb(geodata['map_domain_polygon']), dtype=np.uint8),
+                 map_domain_bounds=geodata['map_domain_bounds'],
+                 floodplain_wkb=np.frombuffer(shapely.to_wkb(geodata['floodplain_multipolygon']), dtype=np.uint8),
+                 floodplain_bounds=geodata['floodplain_bounds'],
+                 triangles=triangles,
+                 cumulative_area=cumulative_area)
+    os.replace(temporary_path, path)
+
+
+def load_bundle(shapefile_path=shapefile_path, floodplain_path=floodplain_path, path=bundle_path):
+    """
+    Load the bundle written by write_bundle.
+
+    Returns
+    -------
+    geodata: dict like read_shapefiles, plus the map domain triangulation,
+             or None when there is no bundle or it is stale (other version or changed source files)
+    """
+    if not os.path.exists(path):
+        return None
+    with np.load(path, allow_pickle=False) as bundle:
+        if int(bundle['version']) != BUNDLE_VERSION:
+            return None
+        if str(bundle['fingerprint']) != source_fingerprint(shapefile_path, floodplain_path):
+            return None
+        return {
+            'map_domain_polygon': shapely.from_wkb(bundle['map_domain_wkb'].tobytes()),
+            'map_domain_bounds': bundle['map_domain_bounds'],
+            'floodplain_multipolygon': shapely.from_wkb(bundle['floodplain_wkb'].tobytes()),
+            'floodplain_bounds': bundle['floodplain_bounds'],
+            'map_domain_triangulation': (bundle['triangles'], bundle['cumulative_area']),
+        }
+
+
+def load_geodata(shapefile_path=shapefile_path, floodplain_path=floodplain_path, path=bundle_path):
+    """Load the geometries from the bundle, falling back to the shapefiles when the bundle is missing or stale."""
+    geodata = load_bundle(shapefile_path, floodplain_path, path)
+    if geodata is None:
+        geodata = read_shapefiles(shapefile_path, floodplain_path)
+    return geodata
+
+
+if __name__ == '__main__':
+    write_bundle()
+    print(f'Wrote {bundle_path}')
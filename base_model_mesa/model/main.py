@@ -1,52 +1,58 @@
+import os
 from model import AdaptationModel
+from rendering import NetworkRenderer
 import matplotlib.pyplot as plt
-import networkx as nx
+
+# Directory to save a snapshot of the figures to every time they are redrawn (domain_step_<step>.png and
+# network_step_<step>.png), e.g. r'../frames'. None only shows the figures.
+frame_directory = None
 
 # Initialize the Adaptation Model with 50 household agents.
 model = AdaptationModel(number_of_households=50, flood_map_choice="harvey",
                         network="watts_strogatz")  # flood_map_choice can be "harvey", "100yr", or "500yr"
 
-# Calculate positions of nodes for the network plot.
-# The spring_layout function positions nodes using a force-directed algorithm,
-# which helps visualize the structure of the social network.
-pos = nx.spring_layout(model.G)
-
-
-# Define a function to plot agents on the network.
-# This function takes a matplotlib axes object and the model as inputs.
-def plot_network(ax, model):
-    # Clear the current axes.
-    ax.clear()
-    # Determine the color of each node (agent) based on their adaptation status.
-    colors = ['blue' if agent.is_adapted else 'red' for agent in model.schedule.agents]
-    # Draw the network with node colors and labels.
-    nx.draw(model.G, pos, node_color=colors, with_labels=True, ax=ax)
-    # Set the title of the plot with the current step number.
-    ax.set_title(f"Social Network State at Step {model.schedule.steps}", fontsize=12)
-
+# Show the figures while the model runs, they are redrawn every 5 steps (and saved to frame_directory if it is set).
+plt.ion()
 
 # Generate the initial plots at step 0.
-# Plot the spatial distribution of agents. This is a function written in the model.py
-model.plot_model_domain_with_agents()
+# Plot the spatial distribution of agents. This is a method of the model in model.py, it returns a DomainRenderer
+# that has drawn the map and the households once, after which only the colours of the households are updated.
+domain_fig, domain_ax = plt.subplots(figsize=(10, 6))
+domain = model.plot_model_domain_with_agents(ax=domain_ax)
 
 # Plot the initial state of the social network.
-fig, ax = plt.subplots(figsize=(7, 7))
-plot_network(ax, model)
-plt.show()
-
-# Run the model for 20 steps and generate plots every 5 steps.
+# The positions of the nodes are computed once with the spring_layout function, which positions nodes using a
+# force-directed algorithm and helps visualize the structure of the social network. The edges are drawn once as well.
+network_fig, network_ax = plt.subplots(figsize=(7, 7))
+network = NetworkRenderer(model, ax=network_ax)
+plt.pause(0.1)
+
+# Save the figures of a step to frame_directory, if it is set.
+def save_frames(step):
+    if frame_directory is not None:
+        os.makedirs(frame_directory, exist_ok=True)
+        domain_fig.savefig(os.path.join(frame_directory, f'domain_step_{step}.png'))
+        network_fig.savefig(os.path.join(frame_directory, f'network_step_{step}.png'))
+
+save_frames(0)
+
+# Run the model for 20 steps and update the plots every 5 steps.
 for step in range(20):
     model.step()
 
-    # Every 5 steps, generate and display plots for both the spatial distribution and network.
-    # Note the first step is step 0, so the plots will be generated at steps 4, 9, 14, and 19, which are the 5th, 10th, 15th, and 20th steps.
+    # Every 5 steps, update the plots for both the spatial distribution and network.
+    # Note the first step is step 0, so the plots will be updated at steps 4, 9, 14, and 19, which are the 5th, 10th, 15th, and 20th steps.
     if (step + 1) % 5 == 0:
-        # Plot for the spatial map showing agent locations and adaptation status.
-        plt.figure(figsize=(10, 6))
-        model.plot_model_domain_with_agents()
+        # Recolour the agents on the spatial map by their adaptation status.
+        domain.update()
 
-        # Plot for the social network showing connections and adaptation statuses.
-        fig, ax = plt.subplots(figsize=(7, 7))
-        plot_network(ax, model)
-        plt.show()
+        # Recolour the nodes of the social network by their adaptation status.
+        network.update()
+        plt.pause(0.1)
 
+        # The figures are redrawn in place, a saved snapshot keeps this state.
+        save_frames(step + 1)
+
+# Keep the figures open at the end of the run.
+plt.ioff()
+plt.show()
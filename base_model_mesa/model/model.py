@@ -9,13 +9,46 @@ import geopandas as gpd
 import rasterio as rs
 import matplotlib.pyplot as plt
 import random
+import math
+import operator
+import numpy as np
 
 # Import the agent class(es) from agents.py
 from agents import Households
 from agents import Government
+from agents import HouseholdTotals
+from agents import make_decision_thresholds
 
-# Import functions from functions.py
-from functions import get_flood_map_data, calculate_basic_flood_damage
+# Import the vectorized household engine from engine.py
+from engine import VectorizedHouseholds, VectorizedActivation, INCOME_CLASSES
+
+# Import the columnar data collector from collector.py
+from collector import ColumnarDataCollector
+
+# Import the counter-based random streams from rng.py
+from rng import RandomStreams
+
+# Import the dirty-set scheduler from activation.py
+from activation import DirtySetActivation
+
+# Import the population synthesizer from population.py
+from population import PopulationSynthesizer
+
+# Import the spatial index of the household locations from spatial.py
+from spatial import HouseholdSpatialIndex, check_region
+
+# Import the renderer of the model domain from rendering.py
+from rendering import DomainRenderer
+
+# Import the per-phase profiler from profiling.py
+from profiling import PhaseProfiler
+
+# Import functions from functions.py and network.py
+from network import neighbourhood_matrix, generate_network
+from network import generate_adjacency, adjacency_neighbourhood, adjacency_to_networkx, CSRNetworkGrid
+from floodmaps import flood_map_cache, flood_map_paths, HouseholdPixelIndex
+from functions import get_flood_map_data, calculate_basic_flood_damage, generate_random_locations_within_map_domain
+from functions import load_damage_curve
 from functions import map_domain_gdf, floodplain_gdf
 
 
@@ -30,61 +63,211 @@ class AdaptationModel(Model):
     def __init__(self, 
                  seed = 1, #None            # seed set as 1 for now
                  number_of_households = 100, # number of household agents
+                 # Income classes, awareness and initial adaptation of the households, a PopulationSynthesizer (see population.py).
+                 # None is the income distribution of the report with the counts truncated to whole households
+                 population_synthesizer = None,
                  # Simplified argument for choosing flood map. Can currently be "harvey", "100yr", or "500yr".
                  flood_map_choice='harvey',
+                 # Depth-damage function. Can be "basic" (logarithmic function) or "table" (piecewise table from input_data/flood_depth-damage_function.xlsx)
+                 damage_curve = 'basic',
+                 # Floods that hit the households, a dict of step -> flood map choice. None is one flood on flood_map_choice at step 5.
+                 # Floods from other maps (e.g. {5: "100yr", 12: "500yr"} for a multi-hazard run) are read at the households' pixels
+                 flood_events = None,
+                 # How the actual flood depth varies around the flood map. Can be "household" (a random factor between 0.8 and 1.2
+                 # per household) or "zonal" (one factor per zone of shock_zone_size x shock_zone_size pixels of the flood map)
+                 shock = 'household',
+                 shock_zone_size = 50,
+                 # Random numbers. Can be "legacy" (random.Random(seed + unique_id) per household and purpose) or
+                 # "philox" (independent counter-based streams per purpose, drawn for all households at once, see rng.py)
+                 rng = 'legacy',
+                 # Only with rng="philox": use 1 - u for every uniform number u of the households, the antithetic partner of the same seed
+                 antithetic = False,
                  # ### network related parameters ###
                  # The social network structure that is used.
-                 # Can currently be "erdos_renyi", "barabasi_albert", "watts_strogatz", or "no_network"
+                 # Can currently be "erdos_renyi", "barabasi_albert", "watts_strogatz", "spatial_knn" (every household connected
+                 # to its number_of_nearest_neighbours geographically nearest households), or "no_network"
                  network = 'barabasi_albert',
                  # likeliness of edge being created between two nodes
                  probability_of_network_connection = 0.4,
                  # number of edges for BA network
                  number_of_edges = 3,
-                 # number of nearest neighbours for WS social network
+                 # number of nearest neighbours for WS and spatial_knn social networks
                  number_of_nearest_neighbours = 5,
+                 # How the network is stored. Can be "networkx" (networkx graph and mesa's NetworkGrid) or "csr" (sparse adjacency
+                 # matrix generated without networkx, for large numbers of households; other random graphs than networkx for the same seed)
+                 network_backend = 'networkx',
                  gov_action_A_sub = False,                        # Setting government actions, turn to True to turn on Government Subisdy
-                 gov_action_B_awa = False                         # Setting government actions, turn to True to turn on Government Awareness Campaign
+                 gov_action_B_awa = False,                        # Setting government actions, turn to True to turn on Government Awareness Campaign
+                 # The households the awareness campaign reaches. Can be "all", "floodplain" (only households inside the floodplain) or a shapely geometry
+                 gov_campaign_region = 'all',
+                 # Overrides of the thresholds of the decision to adapt, a dict like {"willingness": 4} (see DECISION_THRESHOLDS in agents.py)
+                 decision_thresholds = None,
+                 # How households are stepped. Can be "object" (Households.step per agent) or "vectorized" (all households at once in NumPy arrays).
+                 # With "vectorized" use collector="columnar": mesa's DataCollector reads the Households objects, which are then updated
+                 # from the arrays in a Python loop over all households before every collection
+                 engine = 'object',
+                 # Which households the object engine steps. Can be "simultaneous" (all households every step) or "dirty"
+                 # (only households whose inputs changed since they were last stepped, with the same results, see activation.py)
+                 activation = 'simultaneous',
+                 # How households are placed on the map. Can be "per_agent" (each household draws its own location),
+                 # "rejection" (all at once in NumPy blocks) or "triangulation" (all at once, without rejection)
+                 household_placement = 'per_agent',
+                 # ### data collection parameters ###
+                 # Can be "mesa" (mesa's DataCollector) or "columnar" (typed NumPy columns, see collector.py)
+                 collector = 'mesa',
+                 # Only for the columnar collector: steps at which agent data is collected (None is every step),
+                 # number of households to collect agent data for (None is all), and the Parquet file to write agent data to
+                 agent_collection_steps = None,
+                 agent_sample = None,
+                 agent_output_path = None,
+                 # Debug mode: compare the running totals behind the model reporters with a full scan of the households
+                 check_reporters = False,
+                 # Per-phase profiling of step, see profiling.py. Can be None (off), "time" (wall time and calls per phase)
+                 # or "memory" (also the memory allocated per phase, traced with tracemalloc, which slows the run down)
+                 profile = None,
+                 # Only with profiling: JSON lines file the records of every step are appended to
+                 profile_log_path = None
                  ):
         
         super().__init__(seed = seed)
 
 
-        Households._income_classes_initialized = False            # Need to reset at every model run, otherwise with the batch runner, where the kernel is not reset, households won't get an income class
-        Households._income_class_list = []                        # Needed for the class function to operate properly in the batch runner
-        Households._total_households = number_of_households       # Aware that this not fantastic programming, but after trying to debug for multiple hours this was the solution to continue to the next steps.
-
-
         # defining the variables and setting the values
         self.number_of_households = number_of_households          # Total number of household agents
         self.seed = seed
 
+        # running totals over the households for the model reporters, with check_reporters they are compared with a full scan
+        self.household_totals = HouseholdTotals()
+        self.check_reporters = check_reporters
+        self.households = None                                    # set to the vectorized engine below, when it is used
+        self.input_listener = None                                # set to the scheduler below with activation='dirty'
+
+        if rng == 'legacy':
+            self.random_streams = None
+        elif rng == 'philox':
+            self.random_streams = RandomStreams(seed, number_of_households, antithetic=antithetic)
+        else:
+            raise ValueError(f"Unknown rng: '{rng}'. "
+                             f"Currently implemented rngs are: 'legacy' and 'philox'")
+        if antithetic and self.random_streams is None:
+            raise ValueError("antithetic=True is only implemented for rng='philox'")
+
+        # The attributes of all households, drawn at once and owned by this model, so models can be created in parallel threads
+        if population_synthesizer is None:
+            population_synthesizer = PopulationSynthesizer()
+        self.population = population_synthesizer.synthesize(number_of_households, seed, self.random_streams)
+
+        # place all households at once, "per_agent" draws the same locations as households placing themselves
+        if household_placement == 'per_agent':
+            x, y = generate_random_locations_within_map_domain(number_of_households, seed, method='per_agent', streams=self.random_streams)
+        else:
+            placement_seed = seed if self.random_streams is None else self.random_streams.generator('household_placement')
+            x, y = generate_random_locations_within_map_domain(number_of_households, placement_seed, method=household_placement)
+        # The spatial index of the household locations, built once, for the floodplain, regional government actions and spatial_knn networks
+        self.spatial_index = HouseholdSpatialIndex(x, y)
+
         # network
         self.network = network # Type of network to be created
         self.probability_of_network_connection = probability_of_network_connection
         self.number_of_edges = number_of_edges
         self.number_of_nearest_neighbours = number_of_nearest_neighbours
 
-        # generating the graph according to the network used and the network parameters specified
-        self.G = self.initialize_network()
-        # create grid out of network graph
-        self.grid = NetworkGrid(self.G)
+        if network_backend == 'networkx':
+            # generating the graph according to the network used and the network parameters specified
+            self._G = self.initialize_network()
+            self.adjacency = None
+            # create grid out of network graph
+            self.grid = NetworkGrid(self._G)
+            # The network does not change during a run, so neighbourhoods are computed once per radius (see get_neighbourhood_matrix)
+            self.node_list = list(self._G.nodes())
+            self.node_index = {node: i for i, node in enumerate(self.node_list)}
+        elif network_backend == 'csr':
+            # the nodes are 0 to number_of_households - 1, in this order, and model.G is only built when it is used
+            network_seed = seed if self.random_streams is None else self.random_streams.generator('network')
+            self.adjacency = generate_adjacency(network, number_of_households, network_seed,
+                                                probability_of_network_connection=probability_of_network_connection,
+                                                number_of_edges=number_of_edges,
+                                                number_of_nearest_neighbours=number_of_nearest_neighbours,
+                                                spatial_index=self.spatial_index)
+            self._G = None
+            self.grid = CSRNetworkGrid(self.adjacency)
+            self.node_list = range(number_of_households)
+            self.node_index = self.node_list                      # node i is at position i
+        else:
+            raise ValueError(f"Unknown network backend: '{network_backend}'. "
+                             f"Currently implemented network backends are: 'networkx' and 'csr'")
+        self.network_backend = network_backend
+        self._neighbourhood_matrices = {}
 
         # Initialize maps
         self.initialize_maps(flood_map_choice)
 
+        # Depth-damage function, None is the basic logarithmic function
+        if damage_curve == 'basic':
+            self.damage_curve = None
+        elif damage_curve == 'table':
+            self.damage_curve = load_damage_curve()
+        else:
+            raise ValueError(f"Unknown damage curve: '{damage_curve}'. "
+                             f"Currently implemented damage curves are: 'basic' and 'table'")
+
+        # Floods and shocks, the flood maps are validated here so that a wrong choice fails before the households are created
+        if flood_events is None:
+            flood_events = {5: flood_map_choice}
+        for step, event_map_choice in flood_events.items():
+            if event_map_choice not in flood_map_paths.keys():
+                raise ValueError(f"Unknown flood map choice of the flood at step {step}: '{event_map_choice}'. "
+                                 f"Currently implemented choices are: {list(flood_map_paths.keys())}")
+        self.flood_events = dict(flood_events)
+        if shock not in ('household', 'zonal'):
+            raise ValueError(f"Unknown shock: '{shock}'. "
+                             f"Currently implemented shocks are: 'household' and 'zonal'")
+        self.shock = shock
+        self.shock_zone_size = shock_zone_size
+
         # set schedule for agents
         # self.schedule = RandomActivation(self)  # Schedule for activating agents
-        self.schedule = SimultaneousActivation(self)              #changed so that agents make the choice on willingness with the same information. With RandomActivation some agents would make the choice later, giving them an advantage.
+        if activation not in ('simultaneous', 'dirty'):
+            raise ValueError(f"Unknown activation: '{activation}'. "
+                             f"Currently implemented activations are: 'simultaneous' and 'dirty'")
+        if engine == 'object' and activation == 'dirty':
+            self.schedule = DirtySetActivation(self)              # same order as SimultaneousActivation, but only households with changed inputs
+        elif engine == 'object':
+            self.schedule = SimultaneousActivation(self)          #changed so that agents make the choice on willingness with the same information. With RandomActivation some agents would make the choice later, giving them an advantage.
+        elif activation == 'dirty':
+            raise ValueError("activation='dirty' is only implemented for engine='object'")
+        elif engine == 'vectorized':
+            self.schedule = VectorizedActivation(self)            # steps all households at once through self.households
+        else:
+            raise ValueError(f"Unknown engine: '{engine}'. "
+                             f"Currently implemented engines are: 'object' and 'vectorized'")
+        self.engine = engine
 
         self.gov_action_A_sub = gov_action_A_sub
         self.gov_action_B_awa = gov_action_B_awa
+        check_region(gov_campaign_region)
+        self.gov_campaign_region = gov_campaign_region
+        self.decision_thresholds = make_decision_thresholds(decision_thresholds)
+
+        # The pixel of every household on the flood maps, looked up once, so the flood depths are one gather for any flood map
+        self.pixel_index = HouseholdPixelIndex(x, y)
+        flood_depths = self.pixel_index.depths(self.flood_map)
+        in_floodplain = self.spatial_index.in_floodplain.tolist()
 
         # create households through initiating a household on each node of the network graph
-        for i, node in enumerate(self.G.nodes()):
-            household = Households(unique_id=i, model=self)
+        for i, (node, location, flood_depth) in enumerate(zip(self.node_list, zip(x, y), flood_depths)):
+            household = Households(unique_id=i, model=self, location=location, flood_depth=flood_depth, in_floodplain=in_floodplain[i])
             self.schedule.add(household)
             self.grid.place_agent(agent=household, node_id=node)
 
+        # With dirty-set activation the households report changes of the inputs of their step to the scheduler
+        if isinstance(self.schedule, DirtySetActivation):
+            self.input_listener = self.schedule.mark_changed
+
+        # With the vectorized engine the household state lives in arrays, the Households objects are kept in sync for data collection and plotting
+        if engine == 'vectorized':
+            self.households = VectorizedHouseholds(self)
+
         # Data collection setup to collect data
         model_metrics = {
                         "percentage_adapted_households": self.total_adapted_households,                                         # Metrics that will be measured in for the final results
@@ -105,147 +288,268 @@ class AdaptationModel(Model):
 
                         }
         #set up the data collector 
-        self.datacollector = DataCollector(model_reporters=model_metrics, agent_reporters=agent_metrics)
+        if collector == 'mesa':
+            # attrgetters instead of attribute names, mesa wraps attribute names in local functions that cannot be pickled (see snapshot.py)
+            self.datacollector = DataCollector(model_reporters=model_metrics,
+                                               agent_reporters={name: operator.attrgetter(attribute) for name, attribute in agent_metrics.items()})
+        elif collector == 'columnar':
+            self.datacollector = ColumnarDataCollector(model_reporters=model_metrics, agent_reporters=agent_metrics,
+                                                       agent_dtypes={"IsAdapted": bool},
+                                                       categories={"IncomeClass": INCOME_CLASSES},
+                                                       agent_steps=agent_collection_steps, agent_sample=agent_sample,
+                                                       sample_seed=seed, output_path=agent_output_path)
+        else:
+            raise ValueError(f"Unknown collector: '{collector}'. "
+                             f"Currently implemented collectors are: 'mesa' and 'columnar'")
+        self.collector = collector
 
         # The Government agent is not associated with any node in the network
         self.government = Government(unique_id="gov", model=self)                                    # not adding the Government agent to the schedule, as this would disrupt the model. Using the Agent by calling it in model step works fine for this model.
 
+        # Profiling wraps the phases of this model only when it is on, so there is no overhead when it is off
+        if profile is None:
+            self.profiler = None
+        elif profile in ('time', 'memory'):
+            self.profiler = PhaseProfiler(memory=profile == 'memory', log_path=profile_log_path)
+            self.profiler.instrument(self)
+        else:
+            raise ValueError(f"Unknown profile: '{profile}'. "
+                             f"Currently implemented profiles are: None, 'time' and 'memory'")
+
+
+
+
+    # Pickling support for snapshots (see snapshot.py). The flood map band is not pickled, a restored model takes it
+    # from the flood map cache, and the seed is passed to mesa's Model.__new__ so that it does not draw a new one.
+    def __getnewargs_ex__(self):
+        return (), {'seed': self._seed}
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['flood_map'] = state['flood_map'].path
+        del state['band_flood_img']
+        return state
 
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.flood_map = flood_map_cache.get(self.flood_map)
+        self.band_flood_img = self.flood_map.read(1)
+
+    # End of a run: the columnar collector completes its Parquet file (agent_output_path). Also usable as
+    # `with AdaptationModel(...) as model:`, run_sweep closes every model it ran.
+    def close(self):
+        """Close the data collection of this run, mesa's DataCollector needs no closing."""
+        if self.collector == 'columnar':
+            self.datacollector.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
     def initialize_network(self):
         """
         Initialize and return the social network graph based on the provided network type using pattern matching.
         """
         # i need to add something here such as total_nodes, so I can change all the networks, and use allof them
-        if self.network == 'erdos_renyi':
-            return nx.erdos_renyi_graph(n=self.number_of_households,
-                                        p=self.number_of_nearest_neighbours / self.number_of_households,
-                                        seed=self.seed)
-        elif self.network == 'barabasi_albert':
-            return nx.barabasi_albert_graph(n=self.number_of_households,
-                                            m=self.number_of_edges,
-                                            seed=self.seed)
-        elif self.network == 'watts_strogatz':
-            return nx.watts_strogatz_graph(n=self.number_of_households,
-                                        k=self.number_of_nearest_neighbours,
-                                        p=self.probability_of_network_connection,
-                                        seed=self.seed)
-        elif self.network == 'no_network':
-            G = nx.Graph()
-            G.add_nodes_from(range(self.number_of_households))
-            return G
-        else:
-            raise ValueError(f"Unknown network type: '{self.network}'. "
-                            f"Currently implemented network types are: "
-                            f"'erdos_renyi', 'barabasi_albert', 'watts_strogatz', and 'no_network'")
+        return generate_network(self.network, self.number_of_households, self.seed,
+                                probability_of_network_connection=self.probability_of_network_connection,
+                                number_of_edges=self.number_of_edges,
+                                number_of_nearest_neighbours=self.number_of_nearest_neighbours,
+                                spatial_index=self.spatial_index)
+
 
+    @property
+    def G(self):
+        """The social network as a networkx graph, with network_backend='csr' it is built from the adjacency matrix when first used."""
+        if self._G is None:
+            self._G = adjacency_to_networkx(self.adjacency)
+        return self._G
+
+    def get_neighbourhood_matrix(self, radius):
+        """
+        Return the radius-r neighbourhood of every node of the network as a CSR sparse matrix, with rows and
+        columns in the order of self.node_list. The matrix is built once per radius and reused every step.
+        """
+        if radius not in self._neighbourhood_matrices:
+            if self.adjacency is not None:
+                self._neighbourhood_matrices[radius] = adjacency_neighbourhood(self.adjacency, radius=radius)
+            else:
+                self._neighbourhood_matrices[radius] = neighbourhood_matrix(self.G, radius=radius, nodelist=self.node_list)
+        return self._neighbourhood_matrices[radius]
 
     def initialize_maps(self, flood_map_choice):
         """
         Initialize and set up the flood map related data based on the provided flood map choice.
         """
-        # Define paths to flood maps
-        flood_map_paths = {
-            'harvey': r'../input_data/floodmaps/Harvey_depth_meters.tif',
-            '100yr': r'../input_data/floodmaps/100yr_storm_depth_meters.tif',
-            '500yr': r'../input_data/floodmaps/500yr_storm_depth_meters.tif'  # Example path for 500yr flood map
-        }
-
         # Throw a ValueError if the flood map choice is not in the dictionary
         if flood_map_choice not in flood_map_paths.keys():
             raise ValueError(f"Unknown flood map choice: '{flood_map_choice}'. "
                              f"Currently implemented choices are: {list(flood_map_paths.keys())}")
 
         # Choose the appropriate flood map based on the input choice
+        self.flood_map_choice = flood_map_choice
         flood_map_path = flood_map_paths[flood_map_choice]
 
-        # Loading and setting up the flood map
-        self.flood_map = rs.open(flood_map_path)
+        # Loading and setting up the flood map, each map is decoded once per process and shared read-only between models
+        self.flood_map = flood_map_cache.get(flood_map_path)
         self.band_flood_img, self.bound_left, self.bound_right, self.bound_top, self.bound_bottom = get_flood_map_data(
             self.flood_map)
 
+    def scan_household_totals(self):
+        """Compute the household totals with a full scan, from the engine arrays or the Households objects."""
+        if self.households is not None:
+            return {field: getattr(self.households, field).sum() for field in HouseholdTotals.FIELDS}
+        #BE CAREFUL THAT YOU MAY HAVE DIFFERENT AGENT TYPES SO YOU NEED TO FIRST CHECK IF THE AGENT IS ACTUALLY A HOUSEHOLD AGENT USING "ISINSTANCE"
+        households = [agent for agent in self.schedule.agents if isinstance(agent, Households)]
+        return {field: sum(getattr(agent, field) for agent in households) for field in HouseholdTotals.FIELDS}
+
+    def check_household_totals(self):
+        """Raise an error if a running total differs from a full scan (only called when check_reporters is on)."""
+        for field, scanned in self.scan_household_totals().items():
+            running = self.household_totals.sums[field]
+            if not math.isclose(running, scanned, rel_tol=1e-9, abs_tol=1e-9):
+                raise RuntimeError(f"Running total of '{field}' is {running}, but a full scan gives {scanned}")
+
     def total_adapted_households(self):
         """Return the total number of households that have adapted."""
-        #BE CAREFUL THAT YOU MAY HAVE DIFFERENT AGENT TYPES SO YOU NEED TO FIRST CHECK IF THE AGENT IS ACTUALLY A HOUSEHOLD AGENT USING "ISINSTANCE"
-        adapted_count = sum([1 for agent in self.schedule.agents if isinstance(agent, Households) and agent.is_adapted])
-        percentage_adapted_count = adapted_count / self.number_of_households
-        return percentage_adapted_count
+        if self.check_reporters:
+            self.check_household_totals()
+        return self.household_totals.sums['is_adapted'] / self.number_of_households
 
     def calculate_average_initial_flood_damage_estimated(self):
         """Calculates average initial flood damge estimated, so that this can be used in the result analysis"""
-        average_initial_flood_damage_estimated = sum(agent.initial_damage_estimated for agent in self.schedule.agents)
-        num_agents = self.schedule.get_agent_count()
-        return average_initial_flood_damage_estimated / num_agents if num_agents > 0 else 0
+        return self.household_totals.mean('initial_damage_estimated')
 
     def calculate_average_flood_damage_actual(self):
         """Returns the average damage households"""
-        average_flood_damage_actual = sum(agent.flood_damage_actual for agent in self.schedule.agents)
-        num_agents = self.schedule.get_agent_count()
-        return average_flood_damage_actual / num_agents if num_agents > 0 else 0
+        return self.household_totals.mean('flood_damage_actual')
 
     def calculate_average_flood_damage_estimated(self):
          """Returns the average damage estimated households"""
-         average_flood_damage_estimated = sum(agent.flood_damage_estimated for agent in self.schedule.agents)
-         num_agents = self.schedule.get_agent_count()
-         return average_flood_damage_estimated / num_agents if num_agents > 0 else 0
-
-
-    def plot_model_domain_with_agents(self, ax=None):
-        if ax is None:
-            fig, ax = plt.subplots()
-        # Plot the model domain
-        map_domain_gdf.plot(ax=ax, color='lightgrey')
-        # Plot the floodplain
-        floodplain_gdf.plot(ax=ax, color='lightblue', edgecolor='k', alpha=0.5)
-
-        # Collect agent locations and statuses
-        for agent in self.schedule.agents:
-            color = 'blue' if agent.is_adapted else 'red'
-            ax.scatter(agent.location.x, agent.location.y, color=color, s=10,
-                       label=color.capitalize() if not ax.collections else "")
-            ax.annotate(str(agent.unique_id), (agent.location.x, agent.location.y), textcoords="offset points",
-                        xytext=(0, 1), ha='center', fontsize=9)
-        # Create legend with unique entries
-        handles, labels = ax.get_legend_handles_labels()
-        by_label = dict(zip(labels, handles))
-        ax.legend(by_label.values(), by_label.keys(), title="Red: not adapted, Blue: adapted")
-
-        # Customize plot with titles and labels
-        ax.set_title(f'Model Domain with Agents at Step {self.schedule.steps}')
-        ax.set_xlabel('Longitude')
-        ax.set_ylabel('Latitude')
+         return self.household_totals.mean('flood_damage_estimated')
+
+
+    def plot_model_domain_with_agents(self, ax=None, density_threshold=5000):
+        """
+        Plot the model domain and floodplain with the households, red when not adapted and blue when adapted.
+        All households are drawn as one collection (see rendering.py), above density_threshold households as the
+        share of adapted households per grid cell. Call update() on the returned renderer to redraw the colours
+        in a later step.
+        """
+        return DomainRenderer(self, ax=ax, density_threshold=density_threshold)
 
 
     def step(self):
         """
         introducing a shock: 
-        at time step 5, there will be a global flooding.
+        at time step 5, there will be a global flooding (the floods and their steps can be set with flood_events).
         This will result in actual flood depth. Here, we assume it is a random number
         between 0.5 and 1.2 of the estimated flood depth. In your model, you can replace this
         with a more sound procedure (e.g., you can devide the floop map into zones and 
         assume local flooding instead of global flooding). The actual flood depth can be 
-        estimated differently
+        estimated differently (shock='zonal' gives every zone of the flood map its own factor)
         """
 
         self.government.step()                                               # This way Government does not have to be added to the scheduler, as that results in model problem which are out of my programming level.
                                                                              # Because this is simpel it makes it an RBB
+        self.apply_adaptations()
+        if self.schedule.steps in self.flood_events:                          # by default the flood on the model's flood map after 5 years
+            self.apply_flood_shock(self.flood_events[self.schedule.steps])
+
+        # mesa's DataCollector reads the Households objects, so with the vectorized engine they are updated from the arrays
+        # once per step, right before the collection. The columnar collector reads the arrays directly. In both cases the
+        # Households objects of the vectorized engine can be behind the arrays; call self.households.sync_agents() before
+        # inspecting them.
+        if self.households is not None and self.collector == 'mesa':
+            self.households.sync_agents()
+
+        # Collect data and advance the model by one step
+        self.datacollector.collect(self)
+        self.schedule.step()
+
+    def apply_adaptations(self):
+        """Lower the estimated flood depth and damage of the households that adapted and did not apply it yet."""
+        if self.households is not None:                                      # The vectorized engine does this for all households at once
+            self.households.apply_adaptations()
+            return
+
         for agent in self.schedule.agents:                                   # Each step, the model checks if the agent is adapapted, if it is, it lowers the flood depth estimated and the flood damge estimated
             if agent.is_adapted and not agent.final_adaption:                # This results in a lower flood depth actual and eventually a lowre flood damge actual
                 agent.flood_depth_estimated *= (1 - agent.reduction)         # This means that investing in good floodadaptions lowers the damages.
-                agent.flood_damage_estimated = calculate_basic_flood_damage(flood_depth=agent.flood_depth_estimated)   # Calculate flood_damage_estimated based on the new flood_depth_estimated
+                agent.flood_damage_estimated = calculate_basic_flood_damage(flood_depth=agent.flood_depth_estimated, curve=self.damage_curve)   # Calculate flood_damage_estimated based on the new flood_depth_estimated
                 agent.final_adaption = True
             else:
                 continue
 
-        if self.schedule.steps == 5:                                          # 5 years
-            for agent in self.schedule.agents:
+    def exposed_flood_depths(self, flood_map):
+        """
+        The flood depth of every household (in schedule order) on flood_map, where negative depths are 0 and
+        the depth is lowered by the protection of households that adapted, like the estimated flood depth.
+        """
+        depths = self.pixel_index.depths(flood_map)
+        depths = np.where(depths < 0, np.zeros_like(depths), depths)
+        if self.households is not None:
+            final_adaption, reduction = self.households.final_adaption, self.households.reduction
+        else:
+            final_adaption = np.array([agent.final_adaption for agent in self.schedule.agents], dtype=bool)
+            reduction = np.array([agent.reduction for agent in self.schedule.agents], dtype=np.float64)
+        return depths * (1 - np.where(final_adaption, reduction, 0)).astype(depths.dtype)
+
+    def zonal_shock_factors(self, flood_map):
+        """One random factor between 0.8 and 1.2 per zone of flood_map, for every household (in schedule order) the factor of its zone."""
+        zones, number_of_zones = self.pixel_index.zones(flood_map, self.shock_zone_size)
+        if self.random_streams is None:
+            zone_random = np.random.default_rng([self.seed, self.schedule.steps]).random(number_of_zones)
+        else:
+            zone_random = self.random_streams.generator(f'shock_zones_{self.schedule.steps}').random(number_of_zones)
+        return (0.8 + (1.2 - 0.8) * zone_random)[zones]
 
+    def event_shock_factors(self):
+        """
+        One random factor between 0.8 and 1.2 per household (in schedule order) for a flood at this step. The first
+        flood of flood_events uses the draws of earlier versions instead (see apply_flood_shock), so every later flood
+        gets its own draws instead of repeating the factors of the first.
+        """
+        if self.random_streams is None:
+            # [seed, step] are the zones of this step (see zonal_shock_factors), the extra 1 makes these draws independent
+            household_random = np.random.default_rng([self.seed, self.schedule.steps, 1]).random(self.number_of_households)
+        else:
+            household_random = self.random_streams.random(f'shock_{self.schedule.steps}')
+        return 0.8 + (1.2 - 0.8) * household_random
+
+    def apply_flood_shock(self, flood_map_choice=None):
+        """
+        A flood: the actual flood depth and damage of every household. A flood on the model's own flood map (the default)
+        is a factor times the estimated flood depth, a flood on another map a factor times exposed_flood_depths on that map.
+        """
+        if flood_map_choice is None:
+            flood_map_choice = self.flood_map_choice
+        flood_map = flood_map_cache.get(flood_map_paths[flood_map_choice])
+        depths = None if flood_map_choice == self.flood_map_choice else self.exposed_flood_depths(flood_map)
+        if self.shock == 'zonal':
+            factors = self.zonal_shock_factors(flood_map)
+        elif self.schedule.steps != min(self.flood_events, default=self.schedule.steps):
+            factors = self.event_shock_factors()                             # a later flood draws new factors
+        else:
+            factors = None                                                   # None is the random factor per household of earlier versions
+
+        if self.households is not None:                                      # The vectorized engine does this for all households at once
+            self.households.apply_shock(factors=factors, depths=depths)
+            return
+
+        factors = None if factors is None else factors.tolist()
+        for i, agent in enumerate(self.schedule.agents):
+
+            if factors is not None:
+                shock_factor = factors[i]
+            elif self.random_streams is None:
                 unique_seed = self.seed + agent.unique_id
                 local_random = random.Random(unique_seed)
-                agent.flood_depth_actual = local_random.uniform(0.8, 1.2) * agent.flood_depth_estimated            # Calculates the actual flood depth as a random number between 0.8 and 1.2 times the estimated flood depth
-                agent.flood_damage_actual = calculate_basic_flood_damage(agent.flood_depth_actual)                       # Calculates the actual flood damage given the actual flood depth
-
-        # Collect data and advance the model by one step
-        self.datacollector.collect(self)
-        self.schedule.step()
+                shock_factor = local_random.uniform(0.8, 1.2)
+            else:
+                shock_factor = 0.8 + (1.2 - 0.8) * self.random_streams.agent_random('shock', agent.unique_id)
+            flood_depth = agent.flood_depth_estimated if depths is None else depths[i]
+            agent.flood_depth_actual = shock_factor * flood_depth            # Calculates the actual flood depth as a random number between 0.8 and 1.2 times the flood depth
+            agent.flood_damage_actual = calculate_basic_flood_damage(agent.flood_depth_actual, curve=self.damage_curve)                      # Calculates the actual flood damage given the actual flood depth
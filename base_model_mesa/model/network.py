@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+"""
+Functions for the social network of the Flood Adaptation Model.
+
+The network does not change after AdaptationModel.initialize_network, so neighbourhoods can be
+computed once and stored as sparse matrices instead of being searched again every step.
+
+With AdaptationModel(network_backend='csr') the network is generated directly as a sparse CSR adjacency matrix
+(generate_adjacency), in time and memory linear in the number of edges, and the households are placed on a
+CSRNetworkGrid instead of mesa's NetworkGrid. These generators draw other random graphs than networkx does for the
+same seed, with the same distributions. A networkx graph is only built when it is asked for (e.g. for plotting).
+"""
+import numpy as np
+import networkx as nx
+import scipy.sparse as sp
+
+
+def generate_network(network, number_of_nodes, seed, probability_of_network_connection=0.4, number_of_edges=3,
+                     number_of_nearest_neighbours=5, spatial_index=None):
+    """
+    Generate the social network graph of the given type, as in AdaptationModel.initialize_network.
+
+    Parameters
+    ----------
+    network: "erdos_renyi", "barabasi_albert", "watts_strogatz", "spatial_knn" or "no_network"
+    number_of_nodes: number of households
+    seed: seed of the graph generator
+    probability_of_network_connection, number_of_edges, number_of_nearest_neighbours: the network parameters of AdaptationModel
+    spatial_index: HouseholdSpatialIndex of the household locations (see spatial.py), only needed for "spatial_knn",
+                   which connects every household to its number_of_nearest_neighbours geographically nearest households
+
+    Returns
+    -------
+    G: networkx graph with nodes 0 to number_of_nodes - 1
+    """
+    if network == 'erdos_renyi':
+        return nx.erdos_renyi_graph(n=number_of_nodes,
+                                    p=number_of_nearest_neighbours / number_of_nodes,
+                                    seed=seed)
+    elif network == 'barabasi_albert':
+        return nx.barabasi_albert_graph(n=number_of_nodes,
+                                        m=number_of_edges,
+                                        seed=seed)
+    elif network == 'watts_strogatz':
+        return nx.watts_strogatz_graph(n=number_of_nodes,
+                                       k=number_of_nearest_neighbours,
+                                       p=probability_of_network_connection,
+                                       seed=seed)
+    elif network == 'spatial_knn':
+        rows, cols = _spatial_knn_edges(number_of_nodes, number_of_nearest_neighbours, spatial_index)
+        G = nx.Graph()
+        G.add_nodes_from(range(number_of_nodes))
+        G.add_edges_from(zip(rows.tolist(), cols.tolist()))
+        return G
+    elif network == 'no_network':
+        G = nx.Graph()
+        G.add_nodes_from(range(number_of_nodes))
+        return G
+    else:
+        raise ValueError(f"Unknown network type: '{network}'. "
+                         f"Currently implemented network types are: "
+                         f"'erdos_renyi', 'barabasi_albert', 'watts_strogatz', 'spatial_knn', and 'no_network'")
+
+
+def neighbourhood_matrix(G, radius=1, nodelist=None, dtype=np.int32):
+    """
+    Build the radius-r neighbourhood of every node as a CSR sparse matrix.
+    Entry (i, j) is 1 if node j can be reached from node i in at most `radius` edges,
+    each neighbour is counted once and the node itself is not part of its neighbourhood.
+    This gives the same nodes as NetworkGrid.get_neighborhood(node, include_center=False, radius=radius).
+
+    Parameters
+    ----------
+    G: networkx graph of the social network
+    radius: maximum number of edges between a node and its neighbours
+    nodelist: order of the rows and columns, defaults to the order of G.nodes()
+    dtype: dtype of the matrix entries, so that a mat-vec with a 0/1 vector counts neighbours
+
+    Returns
+    -------
+    neighbourhood: scipy.sparse.csr_matrix of shape (n, n) with sorted indices
+    """
+    if nodelist is None:
+        nodelist = list(G.nodes())
+    adjacency = sp.csr_matrix(nx.to_scipy_sparse_array(G, nodelist=nodelist, dtype=bool, format='csr'))
+    return adjacency_neighbourhood(adjacency, radius=radius, dtype=dtype)
+
+
+def adjacency_neighbourhood(adjacency, radius=1, dtype=np.int32):
+    """
+    neighbourhood_matrix for a network given as a sparse adjacency matrix (e.g. from generate_adjacency).
+
+    Parameters
+    ----------
+    adjacency: scipy.sparse matrix of shape (n, n), nonzero where two nodes are connected
+    radius: maximum number of edges between a node and its neighbours
+    dtype: dtype of the matrix entries
+
+    Returns
+    -------
+    neighbourhood: scipy.sparse.csr_matrix of shape (n, n) with sorted indices
+    """
+    adjacency = sp.csr_matrix(adjacency, dtype=bool)
+    neighbourhood = adjacency.copy()
+    frontier = adjacency
+    for _ in range(radius - 1):
+        # Boolean sparse products only mark reachability, so duplicate paths do not add up
+        frontier = frontier @ adjacency
+        neighbourhood = neighbourhood + frontier
+    # Drop the centre node and store the remaining neighbours as ones
+    neighbourhood = neighbourhood.tocoo()
+    off_diagonal = neighbourhood.row != neighbourhood.col
+    rows, cols = neighbourhood.row[off_diagonal], neighbourhood.col[off_diagonal]
+    neighbourhood = sp.csr_matrix((np.ones(len(rows), dtype=dtype), (rows, cols)), shape=adjacency.shape)
+    neighbourhood.sort_indices()
+    return neighbourhood
+
+
+def _pair_from_index(index):
+    """The pair (i, j) with i < j at the given position in the order (0, 1), (0, 2), (1, 2), (0, 3), ... of all pairs."""
+    j = np.floor((1 + np.sqrt(1 + 8 * index.astype(np.float64))) / 2).astype(np.int64)
+    # correct the rounding of the square root for very large indices
+    j -= (j * (j - 1) // 2 > index)
+    j += ((j + 1) * j // 2 <= index)
+    i = index - j * (j - 1) // 2
+    return i, j
+
+
+def _erdos_renyi_edges(n, p, rng):
+    """
+    Every pair of nodes is connected with probability p. Instead of testing all n(n-1)/2 pairs, the gaps between
+    connected pairs are drawn from the geometric distribution, so the time is linear in the number of edges.
+    """
+    total = n * (n - 1) // 2
+    if p <= 0 or total == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    if p >= 1:
+        return _pair_from_index(np.arange(total, dtype=np.int64))
+    blocks = []
+    last = -1
+    block_size = int(total * p + 5 * np.sqrt(total * p)) + 16
+    while True:
+        positions = last + np.cumsum(rng.geometric(p, size=block_size))
+        blocks.append(positions[positions < total])
+        if positions[-1] >= total:
+            break
+        last = positions[-1]
+    return _pair_from_index(np.concatenate(blocks))
+
+
+def _barabasi_albert_edges(n, m, rng):
+    """
+    Preferential attachment as in nx.barabasi_albert_graph: a star graph of m + 1 nodes, then every new node
+    connects to m distinct nodes, picked with a probability proportional to their degree.
+    """
+    if m < 1 or m >= n:
+        raise ValueError(f"Barabasi-Albert network must have m >= 1 and m < n, m = {m}, n = {n}")
+    sources = np.repeat(np.arange(m + 1, n, dtype=np.int64), m)
+    targets = np.empty(len(sources), dtype=np.int64)
+    # every node appears in repeated_nodes once per edge it has, so a uniform pick from it is proportional to degree
+    repeated_nodes = [0] * m + list(range(1, m + 1))
+    uniforms = iter(())
+    for position, source in enumerate(range(m + 1, n)):
+        chosen = set()
+        while len(chosen) < m:
+            uniform = next(uniforms, None)
+            if uniform is None:                               # draw the random numbers in blocks
+                uniforms = iter(rng.random(1 << 16).tolist())
+                uniform = next(uniforms)
+            chosen.add(repeated_nodes[int(uniform * len(repeated_nodes))])
+        chosen = list(chosen)
+        targets[position * m:(position + 1) * m] = chosen
+        repeated_nodes.extend(chosen)
+        repeated_nodes.extend([source] * m)
+    star = np.arange(1, m + 1, dtype=np.int64)
+    return np.concatenate([np.zeros(m, dtype=np.int64), sources]), np.concatenate([star, targets])
+
+
+def _watts_strogatz_edges(n, k, p, rng, max_attempts=100):
+    """
+    A ring lattice where every node is connected to its k // 2 nearest neighbours on both sides, then every edge
+    (u, v) is rewired to (u, w) with probability p, with w uniform and without self-loops or multiple edges.
+    Unlike nx.watts_strogatz_graph all edges are rewired at once; rewirings that would give a self-loop or a
+    multiple edge are drawn again, and after max_attempts such an edge is not rewired.
+    """
+    if k > n:
+        raise ValueError("k>n, choose smaller k or larger n")
+    if k == n:                                              # the complete graph, as in networkx
+        return _pair_from_index(np.arange(n * (n - 1) // 2, dtype=np.int64))
+    nodes = np.arange(n, dtype=np.int64)
+    u = np.tile(nodes, k // 2)
+    v = (u + np.repeat(np.arange(1, k // 2 + 1, dtype=np.int64), n)) % n
+    rewired_v = v.copy()
+    pending = np.flatnonzero(rng.random(len(u)) < p)
+    for _ in range(max_attempts):
+        if len(pending) == 0:
+            break
+        rewired_v[pending] = rng.integers(0, n, size=len(pending))
+        is_pending = np.zeros(len(u), dtype=bool)
+        is_pending[pending] = True
+        keys = np.minimum(u, rewired_v) * n + np.maximum(u, rewired_v)
+        # edges that are not rewired come first among equal keys, so every later duplicate is a rewired edge
+        order = np.lexsort((is_pending, keys))
+        duplicate = np.zeros(len(u), dtype=bool)
+        duplicate[order[1:]] = keys[order[1:]] == keys[order[:-1]]
+        pending = np.flatnonzero(is_pending & (duplicate | (rewired_v == u)))
+    rewired_v[pending] = v[pending]
+    keys = np.unique(np.minimum(u, rewired_v) * n + np.maximum(u, rewired_v))
+    return keys // n, keys % n
+
+
+def _spatial_knn_edges(n, k, spatial_index):
+    """
+    Every household is connected to its k geographically nearest households, found with the KD-tree of the spatial
+    index in O(n log n). There is nothing random about it, the network only depends on the household locations.
+    """
+    if spatial_index is None or len(spatial_index) != n:
+        raise ValueError("The spatial_knn network needs the spatial index of the locations of all households")
+    return spatial_index.nearest_neighbour_edges(k)
+
+
+def generate_adjacency(network, number_of_nodes, seed, probability_of_network_connection=0.4, number_of_edges=3,
+                       number_of_nearest_neighbours=5, spatial_index=None):
+    """
+    Generate the social network as a symmetric CSR adjacency matrix, without building a networkx graph.
+    Same parameters as generate_network, seed can also be a np.random.Generator.
+
+    Returns
+    -------
+    adjacency: scipy.sparse.csr_matrix of shape (number_of_nodes, number_of_nodes) with boolean entries and sorted indices
+    """
+    rng = np.random.default_rng(seed)
+    n = number_of_nodes
+    if network == 'erdos_renyi':
+        rows, cols = _erdos_renyi_edges(n, number_of_nearest_neighbours / n, rng)
+    elif network == 'barabasi_albert':
+        rows, cols = _barabasi_albert_edges(n, number_of_edges, rng)
+    elif network == 'watts_strogatz':
+        rows, cols = _watts_strogatz_edges(n, number_of_nearest_neighbours, probability_of_network_connection, rng)
+    elif network == 'spatial_knn':
+        rows, cols = _spatial_knn_edges(n, number_of_nearest_neighbours, spatial_index)
+    elif network == 'no_network':
+        rows, cols = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    else:
+        raise ValueError(f"Unknown network type: '{network}'. "
+                         f"Currently implemented network types are: "
+                         f"'erdos_renyi', 'barabasi_albert', 'watts_strogatz', 'spatial_knn', and 'no_network'")
+    # every edge is stored in both directions
+    adjacency = sp.csr_matrix((np.ones(2 * len(rows), dtype=bool), (np.concatenate([rows, cols]), np.concatenate([cols, rows]))),
+                              shape=(n, n))
+    adjacency.sort_indices()
+    return adjacency
+
+
+def adjacency_to_networkx(adjacency):
+    """The networkx graph of an adjacency matrix, with nodes 0 to n - 1 (only needed for plotting and analysis)."""
+    G = nx.from_scipy_sparse_array(adjacency)
+    G.add_nodes_from(range(adjacency.shape[0]))
+    return G
+
+
+class CSRNetworkGrid:
+    """
+    Replacement for mesa's NetworkGrid on a CSR adjacency matrix, for models with network_backend='csr'.
+    The agents on a node are kept in a list per node, the network itself is only the adjacency matrix.
+
+    Parameters
+    ----------
+    adjacency: symmetric scipy.sparse.csr_matrix with the nodes 0 to n - 1
+    """
+
+    def __init__(self, adjacency):
+        self.adjacency = adjacency
+        self._contents = [None] * adjacency.shape[0]        # the list of agents on each node, None while it is empty
+
+    def place_agent(self, agent, node_id):
+        """Place an agent on a node."""
+        if self._contents[node_id] is None:
+            self._contents[node_id] = []
+        self._contents[node_id].append(agent)
+        agent.pos = node_id
+
+    def remove_agent(self, agent):
+        """Remove an agent from its node."""
+        self._contents[agent.pos].remove(agent)
+        agent.pos = None
+
+    def is_cell_empty(self, node_id):
+        return not self._contents[node_id]
+
+    def get_neighborhood(self, node_id, include_center=False, radius=1):
+        """The nodes within radius edges of node_id, sorted, like NetworkGrid.get_neighborhood."""
+        indptr, indices = self.adjacency.indptr, self.adjacency.indices
+        reached = {node_id}
+        frontier = [node_id]
+        for _ in range(radius):
+            frontier = [neighbour for node in frontier for neighbour in indices[indptr[node]:indptr[node + 1]].tolist()
+                        if neighbour not in reached]
+            reached.update(frontier)
+        if not include_center:
+            reached.discard(node_id)
+        return sorted(reached)
+
+    def get_cell_list_contents(self, cell_list):
+        """All agents on the given nodes."""
+        return [agent for node in cell_list for agent in (self._contents[node] or ())]
+
+    def get_neighbors(self, node_id, include_center=False, radius=1):
+        """All agents on the nodes within radius edges of node_id."""
+        return self.get_cell_list_contents(self.get_neighborhood(node_id, include_center, radius))
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Population synthesis: the income class, awareness and initial adaptation of all households, drawn at once.
+
+Households used to take their income class from a list kept on the Households class, which every AdaptationModel
+reset when it was created, so two models could not be built at the same time in one process. The model now owns its
+population: PopulationSynthesizer.synthesize draws the attributes of all households in one pass from the distribution
+tables and returns them as arrays indexed by unique id. The synthesizer has no state, so it can be used by several
+models at once, e.g. from a thread pool.
+
+The default synthesizer gives the same households as before: the income classes of the report with the counts
+truncated to whole households (the households that are left get the 'default' class) and, with rng='legacy',
+awareness and initial adaptation from the first number of random.Random(seed + unique_id).
+"""
+import random
+from collections import namedtuple
+
+import numpy as np
+
+# Income classes and their share of the households, based on literature, see report. Values have been rounded.
+INCOME_DISTRIBUTION = {
+    'lower': 0.20,
+    'lower-middle': 0.15,
+    'middle': 0.30,
+    'upper-middle': 0.30,
+    'upper': 0.05,
+}
+APPORTIONMENTS = ('truncate', 'largest_remainder')
+
+# The attributes of all households, element i belongs to the household with unique id i
+Population = namedtuple('Population', ['income_class', 'awareness', 'is_adapted'])
+
+# Mersenne Twister (MT19937) as seeded by random.Random(seed) for a seed below 2**32, see first_random
+MT_SIZE = 624
+MT_SHIFT = 397
+MT_MATRIX = np.uint32(0x9908b0df)
+MT_UPPER_MASK = np.uint32(0x80000000)
+MT_LOWER_MASK = np.uint32(0x7fffffff)
+LEGACY_DRAWS_CHUNK = 16384              # seeds per chunk of first_random, the states of a chunk take 40 MB
+LEGACY_DRAWS_VECTORIZED_MINIMUM = 2000  # below this many households the Python loop over random.Random is faster
+
+
+def _initial_state():
+    """The state init_genrand(19650218) that init_by_array starts from, the same for every seed."""
+    state = [19650218]
+    for i in range(1, MT_SIZE):
+        state.append((1812433253 * (state[-1] ^ (state[-1] >> 30)) + i) & 0xffffffff)
+    return np.array(state, dtype=np.uint32)
+
+
+def _temper(y):
+    y = y ^ (y >> np.uint32(11))
+    y = y ^ ((y << np.uint32(7)) & np.uint32(0x9d2c5680))
+    y = y ^ ((y << np.uint32(15)) & np.uint32(0xefc60000))
+    return y ^ (y >> np.uint32(18))
+
+
+def first_random(seeds):
+    """
+    The first number of random.Random(seed) for every seed in [0, 2**32), bit for bit, computed for all seeds at once.
+
+    random.Random(seed) seeds MT19937 with init_by_array([seed]): two passes over the 624 words of the state, where
+    every word depends on the word before it. The passes run word by word, each for all seeds at once (uint32
+    arithmetic wraps like the C code). random() then takes the first two outputs of the twisted state, which only
+    need the words 0, 1, 2, 397 and 398.
+
+    Parameters
+    ----------
+    seeds: integer array of seeds, each at least 0 and below 2**32
+
+    Returns
+    -------
+    draws: array of the first random() of every seed
+    """
+    seeds = np.asarray(seeds, dtype=np.uint32)
+    state = np.repeat(_initial_state()[:, None], len(seeds), axis=1)
+    i = 1
+    for _ in range(MT_SIZE):                                       # with a key of one word, the key index is always 0
+        previous = state[i - 1]
+        state[i] = (state[i] ^ ((previous ^ (previous >> np.uint32(30))) * np.uint32(1664525))) + seeds
+        i += 1
+        if i >= MT_SIZE:
+            state[0] = state[MT_SIZE - 1]
+            i = 1
+    for _ in range(MT_SIZE - 1):
+        previous = state[i - 1]
+        state[i] = (state[i] ^ ((previous ^ (previous >> np.uint32(30))) * np.uint32(1566083941))) - np.uint32(i)
+        i += 1
+        if i >= MT_SIZE:
+            state[0] = state[MT_SIZE - 1]
+            i = 1
+    state[0] = MT_UPPER_MASK
+
+    outputs = []
+    for k in (0, 1):
+        y = (state[k] & MT_UPPER_MASK) | (state[k + 1] & MT_LOWER_MASK)
+        y = state[k + MT_SHIFT] ^ (y >> np.uint32(1)) ^ np.where(y & np.uint32(1), MT_MATRIX, np.uint32(0))
+        outputs.append(_temper(y))
+    # random() combines 27 and 26 bits of the two outputs into a 53-bit float
+    a, b = outputs[0] >> np.uint32(5), outputs[1] >> np.uint32(6)
+    return (a.astype(np.float64) * 67108864.0 + b) / 9007199254740992.0
+
+
+def distribution_from_table(input_data, parameter):
+    """
+    The distribution of a parameter in a table with the columns parameter, value and value_for_input (the cumulative
+    percentage of households up to and including the value), as used by functions.set_initial_values.
+
+    Returns
+    -------
+    distribution: dict of value to its share of the households
+    """
+    parameter_data = input_data.loc[input_data.parameter == parameter]
+    cumulative = np.asarray(parameter_data['value_for_input'], dtype=np.float64)
+    shares = np.diff(cumulative, prepend=0) / 100
+    return dict(zip(parameter_data['value'].tolist(), shares.tolist()))
+
+
+class PopulationSynthesizer:
+    """
+    Parameters
+    ----------
+    income_distribution: dict of income class to its share of the households
+    apportionment: how the shares become numbers of households. "truncate" rounds every count down, the households
+                   that are left get the 'default' income class (as in earlier versions), "largest_remainder" gives
+                   the households that are left to the classes with the largest remainders, so every household gets
+                   a class and the counts add up to the number of households
+    awareness_range: awareness is uniform between these values
+    initial_adaptation_threshold: a household is adapted from the start when its draw is above this value
+    """
+
+    def __init__(self, income_distribution=None, apportionment='truncate', awareness_range=(0.2, 1),
+                 initial_adaptation_threshold=0.90):
+        if apportionment not in APPORTIONMENTS:
+            raise ValueError(f"Unknown apportionment: '{apportionment}'. "
+                             f"Currently implemented apportionments are: {list(APPORTIONMENTS)}")
+        self.income_distribution = dict(INCOME_DISTRIBUTION if income_distribution is None else income_distribution)
+        self.apportionment = apportionment
+        self.awareness_range = tuple(awareness_range)
+        self.initial_adaptation_threshold = initial_adaptation_threshold
+
+    def __repr__(self):
+        # the repr is part of the keys of cached initializations and stored results, so it shows all settings
+        return (f"PopulationSynthesizer(income_distribution={self.income_distribution!r}, "
+                f"apportionment={self.apportionment!r}, awareness_range={self.awareness_range!r}, "
+                f"initial_adaptation_threshold={self.initial_adaptation_threshold!r})")
+
+    def income_class_counts(self, number_of_households):
+        """The number of households per income class."""
+        classes = list(self.income_distribution)
+        shares = np.array([self.income_distribution[income_class] for income_class in classes], dtype=np.float64)
+        if self.apportionment == 'truncate':
+            counts = [int(share * number_of_households) for share in shares.tolist()]
+        else:
+            quotas = shares / shares.sum() * number_of_households
+            counts = np.floor(quotas).astype(np.int64)
+            remainders = quotas - counts
+            left = number_of_households - counts.sum()
+            counts[np.argsort(-remainders, kind='stable')[:left]] += 1
+            counts = counts.tolist()
+        return dict(zip(classes, counts))
+
+    def income_classes(self, number_of_households):
+        """
+        The income class of every household unique id. The classes are handed out from the last class of the
+        distribution to the first, like the list that Households used to pop from.
+        """
+        income_classes = []
+        for income_class, count in self.income_class_counts(number_of_households).items():
+            income_classes.extend([income_class] * count)
+        income_classes.reverse()
+        income_classes.extend(['default'] * (number_of_households - len(income_classes)))
+        return income_classes[:number_of_households]
+
+    @staticmethod
+    def legacy_draws(number_of_households, seed):
+        """
+        The first number of random.Random(seed + unique_id) of every household, the draws of rng='legacy'.
+        Many households are drawn with first_random in chunks; few households, and seeds that random.Random does not
+        seed with a single 32-bit word, use random.Random itself.
+        """
+        if (isinstance(seed, int) and not isinstance(seed, bool)
+                and number_of_households >= LEGACY_DRAWS_VECTORIZED_MINIMUM
+                and -2 ** 32 < seed and seed + number_of_households <= 2 ** 32):
+            # random.Random seeds with the absolute value of an integer
+            seeds = np.abs(np.arange(number_of_households, dtype=np.int64) + int(seed))
+            return np.concatenate([first_random(seeds[start:start + LEGACY_DRAWS_CHUNK])
+                                   for start in range(0, number_of_households, LEGACY_DRAWS_CHUNK)])
+        return np.array([random.Random(seed + unique_id).random() for unique_id in range(number_of_households)])
+
+    def synthesize(self, number_of_households, seed, streams=None):
+        """
+        The attributes of all households.
+
+        Parameters
+        ----------
+        number_of_households: number of households
+        seed: model seed, used for the legacy draws when there are no streams
+        streams: the RandomStreams of a model with rng='philox' (see rng.py), None for rng='legacy'
+
+        Returns
+        -------
+        population: Population with the income class (a list), awareness and is_adapted (arrays) per unique id
+        """
+        if streams is None:
+            # with rng='legacy' awareness and initial adaptation both come from the same first number
+            awareness_draw = adaptation_draw = self.legacy_draws(number_of_households, seed)
+        else:
+            awareness_draw = streams.random('awareness')[:number_of_households]
+            adaptation_draw = streams.random('initial_adaptation')[:number_of_households]
+        low, high = self.awareness_range
+        return Population(income_class=self.income_classes(number_of_households),
+                          awareness=low + (high - low) * awareness_draw,
+                          is_adapted=adaptation_draw > self.initial_adaptation_threshold)
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in per-phase instrumentation of AdaptationModel.step.
+
+With AdaptationModel(profile='time') every phase of a step (the government, applying the adaptations, the flood
+shock, the data collection and the schedule with its step and advance of all households) is timed and counted, and
+with profile='memory' the memory allocated in each phase is traced with tracemalloc as well. The phases are measured
+by wrapping the methods of this one model instance, so a model without profiling runs exactly the same code as before.
+
+The measurements are kept as one record per phase per step (see PhaseProfiler.get_dataframe), and can be appended
+to a JSON lines log as every step ends.
+"""
+import json
+import time
+import tracemalloc
+from functools import wraps
+
+import pandas as pd
+
+
+class PhaseProfiler:
+    """
+    Parameters
+    ----------
+    memory: also trace the memory allocated per phase, tracemalloc makes the run itself considerably slower
+    log_path: JSON lines file each step's records are appended to, None only keeps them in memory
+    """
+
+    def __init__(self, memory=False, log_path=None):
+        self.memory = memory
+        self.log_path = log_path
+        self.records = []                   # one dict per phase per finished step
+        self._step = None                   # the step being measured
+        self._step_records = {}             # phase name to its record in the step being measured
+        self._open_phases = []              # memory measurements of the phases that are running, outermost first
+        self._measure_memory = memory       # turned off by stop, the memory columns are kept
+        self._started_tracing = memory and not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start()
+
+    def _enter_memory(self):
+        # A nested phase resets the peak, so the peak reached so far is first passed on to the phases around it
+        current, peak = tracemalloc.get_traced_memory()
+        for frame in self._open_phases:
+            frame['peak'] = max(frame['peak'], peak)
+        tracemalloc.reset_peak()
+        frame = {'start': current, 'peak': current}
+        self._open_phases.append(frame)
+        return frame
+
+    def _exit_memory(self):
+        current, peak = tracemalloc.get_traced_memory()
+        for frame in self._open_phases:
+            frame['peak'] = max(frame['peak'], peak)
+        frame = self._open_phases.pop()
+        return current - frame['start'], frame['peak'] - frame['start']
+
+    def _record(self, phase, seconds, allocated, peak):
+        record = self._step_records.get(phase)
+        if record is None:
+            record = {'step': self._step, 'phase': phase, 'time': 0.0, 'calls': 0}
+            if self.memory:
+                record.update(allocated=0, peak=0)
+            self._step_records[phase] = record
+        record['time'] += seconds
+        record['calls'] += 1
+        if self.memory:
+            record['allocated'] += allocated        # bytes still allocated when the phase ends
+            record['peak'] = max(record['peak'], peak)  # highest memory above the start of the phase
+
+    def measure(self, phase, function):
+        """Return function wrapped so that every call is measured as the given phase."""
+        @wraps(function)
+        def measured(*args, **kwargs):
+            if self._measure_memory:
+                self._enter_memory()
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - start
+                allocated, peak = self._exit_memory() if self._measure_memory else (0, 0)
+                self._record(phase, seconds, allocated, peak)
+        return measured
+
+    def measure_step(self, model, step_function):
+        """Return model.step wrapped so that it measures the whole step and stores the records of its phases."""
+        measured = self.measure('step', step_function)
+
+        @wraps(step_function)
+        def step(*args, **kwargs):
+            self._step = model.schedule.steps
+            self._step_records = {}
+            try:
+                return measured(*args, **kwargs)
+            finally:
+                self._end_step()
+        return step
+
+    def _end_step(self):
+        records = list(self._step_records.values())
+        self.records.extend(records)
+        if self.log_path is not None:
+            with open(self.log_path, 'a') as file:
+                for record in records:
+                    file.write(json.dumps(record) + '\n')
+
+    def instrument(self, model):
+        """Wrap the phases of this model instance (other instances and the classes are not changed)."""
+        model.government.step = self.measure('government', model.government.step)
+        model.apply_adaptations = self.measure('adaptations', model.apply_adaptations)
+        model.apply_flood_shock = self.measure('flood_shock', model.apply_flood_shock)
+        model.datacollector.collect = self.measure('collect', model.datacollector.collect)
+        model.schedule.step = self.measure('schedule', model.schedule.step)
+        if model.households is not None:
+            model.households.step = self.measure('schedule.households', model.households.step)
+            model.households.sync_agents = self.measure('sync_agents', model.households.sync_agents)
+        else:
+            # SimultaneousActivation calls do_each('step') and do_each('advance'), measured as separate phases
+            do_each = model.schedule.do_each
+            measured_do_each = {}
+
+            def measured(method, *args, **kwargs):
+                if method not in measured_do_each:
+                    measured_do_each[method] = self.measure(f'schedule.{method}', do_each)
+                return measured_do_each[method](method, *args, **kwargs)
+            model.schedule.do_each = measured
+        model.step = self.measure_step(model, model.step)
+
+    def stop(self):
+        """
+        Stop measuring memory, and stop tracemalloc if this profiler started it, as it slows down everything else in
+        the process. Time and calls are still measured.
+        """
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        self._measure_memory = False
+
+    def get_dataframe(self):
+        """
+        The records as a DataFrame with one row per phase per step: the wall time in seconds, the number of calls
+        and, with memory tracing, the bytes allocated and the peak in bytes above the start of the phase.
+        """
+        columns = ['step', 'phase', 'time', 'calls'] + (['allocated', 'peak'] if self.memory else [])
+        return pd.DataFrame(self.records, columns=columns)
+
+    def summary(self):
+        """Total time, calls and allocated memory per phase over all steps."""
+        dataframe = self.get_dataframe()
+        aggregations = {'time': 'sum', 'calls': 'sum'}
+        if self.memory:
+            aggregations.update(allocated='sum', peak='max')
+        return dataframe.groupby('phase', sort=False).agg(aggregations)
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Fast plotting of the model domain with the households and of the social network.
+
+The renderers draw everything that does not change during a run once: the model domain and floodplain (whose
+outlines are converted to matplotlib paths once per process), the household locations, the network layout and its
+edges. All households are a single collection, so a new frame only sets the colour of every household to its
+adaptation status. Above density_threshold households the map shows the share of adapted households per grid cell
+instead of single points.
+
+    renderer = DomainRenderer(model)
+    for step in range(20):
+        model.step()
+        renderer.update()
+"""
+from functools import lru_cache
+
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.lines import Line2D
+from matplotlib.patches import PathPatch
+from matplotlib.path import Path
+from shapely.geometry.polygon import orient
+import networkx as nx
+
+from functions import map_domain_polygon, floodplain_multipolygon
+
+ADAPTED_COLOUR = 'blue'
+NOT_ADAPTED_COLOUR = 'red'
+
+
+def polygon_path(geometry):
+    """A matplotlib Path of a shapely (Multi)Polygon, with the holes oriented so that they stay empty when filled."""
+    polygons = getattr(geometry, 'geoms', [geometry])
+    rings = []
+    for polygon in polygons:
+        polygon = orient(polygon, sign=1.0)                    # counter-clockwise exterior, clockwise holes
+        rings.append(Path(np.asarray(polygon.exterior.coords), closed=True))
+        rings.extend(Path(np.asarray(interior.coords), closed=True) for interior in polygon.interiors)
+    return Path.make_compound_path(*rings)
+
+
+@lru_cache(maxsize=None)
+def basemap_paths():
+    """The paths of the model domain and the floodplain, converted once per process."""
+    return polygon_path(map_domain_polygon), polygon_path(floodplain_multipolygon)
+
+
+def draw_basemap(ax):
+    """Draw the model domain and floodplain like the GeoDataFrame plots of plot_model_domain_with_agents."""
+    map_domain_path, floodplain_path = basemap_paths()
+    ax.add_patch(PathPatch(map_domain_path, facecolor='lightgrey', edgecolor='none'))
+    ax.add_patch(PathPatch(floodplain_path, facecolor='lightblue', edgecolor='k', alpha=0.5))
+    ax.autoscale_view()
+    ax.set_aspect('equal')
+
+
+def household_adaptation(model):
+    """Adaptation status of all households in schedule order, from the engine arrays when the model has them."""
+    if model.households is not None:
+        return model.households.is_adapted
+    return np.fromiter((agent.is_adapted for agent in model.schedule.agents), dtype=bool, count=len(model.schedule.agents))
+
+
+class DomainRenderer:
+    """
+    The model domain with the households, coloured by adaptation status.
+
+    Parameters
+    ----------
+    model: the AdaptationModel
+    ax: matplotlib axes to draw on, a new figure when None
+    density_threshold: above this number of households, the share of adapted households per grid cell is drawn
+    bins: number of grid cells along each axis in density mode
+    annotation_limit: households are labelled with their unique id up to this number of households
+    """
+
+    def __init__(self, model, ax=None, density_threshold=5000, bins=200, annotation_limit=200):
+        if ax is None:
+            _, ax = plt.subplots()
+        self.model = model
+        self.ax = ax
+        agents = model.schedule.agents
+        self.x = np.array([agent.location.x for agent in agents])
+        self.y = np.array([agent.location.y for agent in agents])
+        self.density = len(agents) > density_threshold
+
+        draw_basemap(ax)
+        adapted = household_adaptation(model)
+        if self.density:
+            self._x_edges = np.linspace(self.x.min(), self.x.max(), bins + 1)
+            self._y_edges = np.linspace(self.y.min(), self.y.max(), bins + 1)
+            self._counts, _, _ = np.histogram2d(self.x, self.y, bins=(self._x_edges, self._y_edges))
+            self.artist = ax.imshow(self._adapted_share(adapted), origin='lower', cmap='bwr_r', vmin=0, vmax=1,
+                                    extent=(self._x_edges[0], self._x_edges[-1], self._y_edges[0], self._y_edges[-1]),
+                                    interpolation='nearest', zorder=2)
+            plt.colorbar(self.artist, ax=ax, label='Share of adapted households')
+        else:
+            self.artist = ax.scatter(self.x, self.y, c=self._colours(adapted), s=10, zorder=2)
+            if len(agents) <= annotation_limit:
+                for agent, x, y in zip(agents, self.x.tolist(), self.y.tolist()):
+                    ax.annotate(str(agent.unique_id), (x, y), textcoords="offset points", xytext=(0, 1), ha='center', fontsize=9)
+            handles = [Line2D([], [], marker='o', linestyle='', color=colour, label=colour.capitalize())
+                       for colour in (NOT_ADAPTED_COLOUR, ADAPTED_COLOUR)]
+            ax.legend(handles=handles, title="Red: not adapted, Blue: adapted")
+        ax.set_xlabel('Longitude')
+        ax.set_ylabel('Latitude')
+        self._set_title()
+
+    @staticmethod
+    def _colours(adapted):
+        return np.where(adapted, ADAPTED_COLOUR, NOT_ADAPTED_COLOUR)
+
+    def _adapted_share(self, adapted):
+        adapted_counts, _, _ = np.histogram2d(self.x[adapted], self.y[adapted], bins=(self._x_edges, self._y_edges))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            share = adapted_counts / self._counts
+        return np.ma.masked_invalid(share).T                       # imshow has the rows along y
+
+    def _set_title(self):
+        self.ax.set_title(f'Model Domain with Agents at Step {self.model.schedule.steps}')
+
+    def update(self):
+        """Recolour the households with their current adaptation status."""
+        adapted = household_adaptation(self.model)
+        if self.density:
+            self.artist.set_data(self._adapted_share(adapted))
+        else:
+            self.artist.set_facecolor(self._colours(adapted))
+        self._set_title()
+
+
+class NetworkRenderer:
+    """
+    The social network, coloured by adaptation status. The layout is computed once and the edges are drawn once.
+
+    Parameters
+    ----------
+    model: the AdaptationModel
+    ax: matplotlib axes to draw on, a new figure when None
+    pos: node positions, nx.spring_layout(model.G, seed=layout_seed) when None
+    layout_seed: seed of the spring layout, so that the layout does not change between runs
+    label_limit: nodes are labelled up to this number of nodes
+    """
+
+    def __init__(self, model, ax=None, pos=None, layout_seed=None, label_limit=200):
+        if ax is None:
+            _, ax = plt.subplots(figsize=(7, 7))
+        self.model = model
+        self.ax = ax
+        G = model.G
+        self.pos = nx.spring_layout(G, seed=layout_seed) if pos is None else pos
+        # node order of the colours: the node of every household, in schedule order
+        self.nodes = [agent.pos for agent in model.schedule.agents]
+        nx.draw_networkx_edges(G, self.pos, ax=ax)
+        self.artist = nx.draw_networkx_nodes(G, self.pos, nodelist=self.nodes,
+                                             node_color=DomainRenderer._colours(household_adaptation(model)), ax=ax)
+        if G.number_of_nodes() <= label_limit:
+            nx.draw_networkx_labels(G, self.pos, ax=ax)
+        ax.set_axis_off()
+        self._set_title()
+
+    def _set_title(self):
+        self.ax.set_title(f"Social Network State at Step {self.model.schedule.steps}", fontsize=12)
+
+    def update(self):
+        """Recolour the nodes with the current adaptation status of their households."""
+        self.artist.set_facecolor(DomainRenderer._colours(household_adaptation(self.model)))
+        self._set_title()
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk results store for parameter sweeps, in a local SQLite database.
+
+run_sweep(results_path=...) writes the model (and agent) data of every run to the store in one transaction as soon as
+the run is done, so an interrupted sweep keeps all finished runs. Every run is keyed by all parameters of the model
+(the sweep parameters completed with the defaults of the model class) and the step settings of the sweep, and a
+re-launched sweep skips the runs that are already stored.
+
+The model data has a column per parameter (including the defaults) and per reporter, so runs can be selected by
+parameter in SQL:
+
+    store = ResultsStore('results.sqlite')
+    df = store.get_model_data(network='barabasi_albert', gov_action_A_sub=True)
+"""
+import hashlib
+import inspect
+import json
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from population import PopulationSynthesizer
+
+
+def model_parameters(model_cls, kwargs):
+    """All parameters of model_cls.__init__ for these kwargs, the missing ones filled in with their defaults."""
+    signature = inspect.signature(model_cls.__init__)
+    bound = signature.bind_partial(None, **kwargs)           # None stands in for self
+    bound.apply_defaults()
+    parameters = dict(bound.arguments)
+    parameters.pop(next(iter(signature.parameters)))
+    return parameters
+
+
+def _to_json(value):
+    """
+    JSON of a parameter value. Ranges and tuples become lists, shapely geometries the SHA-256 of their WKB (their repr
+    is cut short for long geometries) and a PopulationSynthesizer its settings. Other objects have no stable encoding
+    and raise a TypeError, so two different values can never get the same key.
+    """
+    if isinstance(value, dict):
+        return {str(key): _to_json(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, range)):
+        return [_to_json(item) for item in value]
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.generic):                          # NumPy scalars
+        return value.item()
+    if isinstance(value, shapely.Geometry):
+        return {'geometry_wkb_sha256': hashlib.sha256(shapely.to_wkb(value)).hexdigest()}
+    if isinstance(value, PopulationSynthesizer):
+        return {'PopulationSynthesizer': _to_json(vars(value))}
+    raise TypeError(f"Parameter value {value!r} of type {type(value).__name__} has no stable encoding for the results store")
+
+
+def run_key(model_cls, kwargs, **settings):
+    """
+    The key of a run: canonical JSON of all model parameters (see model_parameters) and the sweep settings
+    (e.g. max_steps), so equal runs get the same key however their parameters were given.
+    """
+    parameters = _to_json(model_parameters(model_cls, kwargs))
+    return json.dumps({'model': model_cls.__name__, 'parameters': parameters, 'settings': _to_json(settings)},
+                      sort_keys=True)
+
+
+def _column_value(value):
+    """A value as stored in a column, values SQLite has no type for are stored as JSON."""
+    if value is None or isinstance(value, (bool, int, float, str, bytes)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    return json.dumps(_to_json(value), sort_keys=True)
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+class ResultsStore:
+    """
+    Parameters
+    ----------
+    path: the SQLite database file, created when it does not exist
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            # the columns of each run are kept, because the tables have the columns of all runs in the store
+            self.connection.execute("CREATE TABLE IF NOT EXISTS runs (run_key TEXT PRIMARY KEY, parameters TEXT, "
+                                    "has_agent_data INTEGER, model_columns TEXT, agent_columns TEXT)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS model_data (run_key TEXT)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS agent_data (run_key TEXT)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS model_data_run_key ON model_data (run_key)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS agent_data_run_key ON agent_data (run_key)")
+        self._columns = {table: self._table_columns(table) for table in ('model_data', 'agent_data')}
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _table_columns(self, table):
+        return [row[1] for row in self.connection.execute(f"PRAGMA table_info({table})")]
+
+    def _add_columns(self, table, rows):
+        """
+        Add the columns of rows that the table does not have yet (new parameters or reporters). Returns the added
+        columns, the caller adds them to self._columns once the transaction is committed.
+        """
+        added = []
+        for row in rows:
+            for column in row:
+                if column not in self._columns[table] and column not in added:
+                    self.connection.execute(f"ALTER TABLE {table} ADD COLUMN {_quote(column)}")
+                    added.append(column)
+        return added
+
+    def _insert(self, table, key, rows):
+        """Insert the rows of one run, returns the columns that were added to the table for them."""
+        if not rows:
+            return []
+        added = self._add_columns(table, rows)
+        columns = ['run_key'] + list(rows[0].keys())
+        statement = (f"INSERT INTO {table} ({', '.join(_quote(column) for column in columns)}) "
+                     f"VALUES ({', '.join('?' * len(columns))})")
+        self.connection.executemany(statement, [[key] + [_column_value(row[column]) for column in columns[1:]]
+                                                for row in rows])
+        return added
+
+    def completed(self, need_agent_data=False):
+        """The keys of the stored runs, with need_agent_data only those that were stored with their agent data."""
+        query = "SELECT run_key FROM runs" + (" WHERE has_agent_data" if need_agent_data else "")
+        return {row[0] for row in self.connection.execute(query)}
+
+    def add_run(self, key, parameters, model_rows, agent_rows=None):
+        """
+        Store the model (and agent) data of one run in one transaction, so a run is either stored completely or not
+        at all. A run that is stored again (e.g. now with its agent data) replaces the stored one.
+        The model data also gets a column for every parameter that is not in its rows (e.g. the defaults of a sweep
+        that did not vary them), so all runs can be selected on every parameter. get_model_rows returns the rows
+        as they were given.
+        """
+        model_columns = list(model_rows[0]) if model_rows else []
+        parameter_columns = {name: value for name, value in parameters.items() if name not in model_columns}
+        with self.connection:
+            for table in ('runs', 'model_data', 'agent_data'):
+                self.connection.execute(f"DELETE FROM {table} WHERE run_key = ?", (key,))
+            self.connection.execute("INSERT INTO runs VALUES (?, ?, ?, ?, ?)",
+                                    (key, json.dumps(_to_json(parameters), sort_keys=True), agent_rows is not None,
+                                     json.dumps(model_columns), json.dumps(list(agent_rows[0]) if agent_rows else [])))
+            added = {'model_data': self._insert('model_data', key, [{**row, **parameter_columns} for row in model_rows]),
+                     'agent_data': self._insert('agent_data', key, agent_rows or [])}
+        # only after the commit: a failed transaction is rolled back together with the columns it added
+        for table, columns in added.items():
+            self._columns[table].extend(columns)
+
+    def _get_rows(self, table, key):
+        row = self.connection.execute(f"SELECT {table.split('_')[0]}_columns FROM runs WHERE run_key = ?", (key,)).fetchone()
+        if row is None:
+            raise KeyError(f"No run stored with key {key}")
+        columns = json.loads(row[0])
+        if not columns:
+            return []
+        cursor = self.connection.execute(f"SELECT {', '.join(_quote(column) for column in columns)} FROM {table} "
+                                         f"WHERE run_key = ? ORDER BY rowid", (key,))
+        return [dict(zip(columns, values)) for values in cursor]
+
+    def get_model_rows(self, key):
+        """The stored model data of one run as a list of dicts with the columns of that run, in the order it was stored."""
+        return self._get_rows('model_data', key)
+
+    def get_agent_rows(self, key):
+        """The stored agent data of one run as a list of dicts, like get_model_rows."""
+        return self._get_rows('agent_data', key)
+
+    def _select(self, table, filters):
+        """A DataFrame of the rows of table where every column in filters has the value (or one of the values) given."""
+        conditions, values = [], []
+        for column, value in filters.items():
+            if column not in self._columns[table]:
+                raise ValueError(f"Unknown column: '{column}'. The stored columns are: {self._columns[table]}")
+            if isinstance(value, (list, tuple, set, range)):
+                conditions.append(f"{_quote(column)} IN ({', '.join('?' * len(value))})")
+                values.extend(_column_value(item) for item in value)
+            else:
+                conditions.append(f"{_quote(column)} = ?")
+                values.append(_column_value(value))
+        query = f"SELECT * FROM {table}" + (" WHERE " + " AND ".join(conditions) if conditions else "") + " ORDER BY rowid"
+        return pd.read_sql_query(query, self.connection, params=values)
+
+    def get_model_data(self, **filters):
+        """
+        The model data of all stored runs with the given parameter values, e.g. get_model_data(seed=range(10)).
+        A list, tuple, set or range selects any of its values.
+        """
+        return self._select('model_data', filters)
+
+    def get_agent_data(self, **filters):
+        """The agent data of the stored runs, filtered on its own columns (e.g. run_key, Step or AgentID)."""
+        return self._select('agent_data', filters)
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Counter-based random number streams for the Flood Adaptation Model.
+
+With rng='legacy' every household creates random.Random(seed + unique_id) objects, and the shock and the awareness
+campaign create more of them. All of these start from the same seed, so a household's awareness, initial adaptation,
+shock and campaign draws are the same number, and every object carries a Mersenne Twister state of a few kilobytes.
+
+With rng='philox' the model owns one RandomStreams object instead. Each purpose (e.g. 'awareness' or 'shock') gets
+its own Philox key derived from the model seed, so the purposes are independent. Within a purpose, the household with
+unique id i gets the i-th number of the stream, so all households can be drawn at once, and a single household's
+number can be computed without drawing the others, because Philox is counter-based.
+
+The streams only depend on the seed, the purpose and the unique id, not on the other parameters of the model, so
+policy scenarios with the same seed get common random numbers: every household draws the same numbers for the same
+purpose in every scenario. With antithetic=True every uniform number u of the per-household streams becomes 1 - u,
+so the models with the same seed with and without antithetic form an antithetic pair (see comparison.py).
+"""
+import zlib
+
+import numpy as np
+
+
+class RandomStreams:
+    """
+    Parameters
+    ----------
+    seed: model seed
+    size: number of households, the bulk draws have one number per household unique id
+    antithetic: give 1 - u instead of u from random and agent_random, the generators (e.g. for the locations and the
+                network) are not changed, so both models of an antithetic pair have the same households and network
+    """
+
+    def __init__(self, seed, size, antithetic=False):
+        self.seed = seed
+        self.size = size
+        self.antithetic = antithetic
+        self._draws = {}
+
+    def _key(self, purpose, agent_id=None):
+        """Philox key for a purpose (and optionally one agent), derived from the seed."""
+        entropy = [self.seed, zlib.crc32(purpose.encode())]
+        if agent_id is not None:
+            entropy.append(agent_id)
+        return np.random.SeedSequence(entropy).generate_state(2, dtype=np.uint64)
+
+    def random(self, purpose):
+        """
+        One uniform number in [0, 1) per household for this purpose, drawn at once and kept for later use.
+        Element i belongs to the household with unique id i.
+        """
+        if purpose not in self._draws:
+            draws = np.random.Generator(np.random.Philox(key=self._key(purpose))).random(self.size)
+            if self.antithetic:
+                draws = 1 - draws
+            draws.setflags(write=False)
+            self._draws[purpose] = draws
+        return self._draws[purpose]
+
+    def agent_random(self, purpose, agent_id):
+        """The number random(purpose)[agent_id], computed for this household only by jumping to its counter."""
+        if purpose in self._draws:
+            return float(self._draws[purpose][agent_id])
+        bit_generator = np.random.Philox(key=self._key(purpose))
+        bit_generator.advance(agent_id // 4)              # every Philox counter gives four 64-bit numbers
+        if agent_id % 4:
+            bit_generator.random_raw(agent_id % 4)
+        draw = float(np.random.Generator(bit_generator).random())
+        return 1 - draw if self.antithetic else draw
+
+    def generator(self, purpose, agent_id=None):
+        """
+        An independent np.random.Generator for a purpose, or for one household and purpose, for uses that need
+        an unknown number of draws (like rejection sampling of a location).
+        """
+        return np.random.Generator(np.random.Philox(key=self._key(purpose, agent_id)))
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Global sensitivity analysis of the AdaptationModel.
+
+A parameter space declares the range of every parameter that is varied: model parameters (e.g.
+probability_of_network_connection or network) and the decision thresholds of the households (the names in
+DECISION_THRESHOLDS in agents.py, e.g. willingness or damage_high):
+
+    space = {'willingness': ('uniform', 2, 4), 'awareness_high': ('uniform', 0.6, 0.95),
+             'probability_of_network_connection': ('uniform', 0.1, 0.6), 'network': ('choice', ['erdos_renyi', 'watts_strogatz'])}
+
+The space is sampled with a Latin hypercube (sample_latin_hypercube, analysed with partial rank correlations) or with
+Saltelli's Sobol scheme (sample_sobol, analysed with first-order and total Sobol indices). Every sample is run for a
+number of seeds with run_sweep, in parallel and with share_initialization: the decision thresholds are not used
+before the first step, so samples that only differ in thresholds fork one cached initialization per seed
+(see snapshot.py) instead of building the network, households and flood depths again.
+
+    samples, outputs, indices = run_sensitivity(AdaptationModel, space, method='sobol', number_of_samples=64,
+                                                seeds=range(3), number_processes=4)
+"""
+import numpy as np
+import pandas as pd
+from scipy.stats import qmc, rankdata
+
+from agents import DECISION_THRESHOLDS
+from sweep import run_sweep
+
+DISTRIBUTIONS = ('uniform', 'integer', 'choice')
+
+
+def check_space(space):
+    """Raise an error for a parameter space that cannot be sampled."""
+    for name, specification in space.items():
+        if specification[0] not in DISTRIBUTIONS:
+            raise ValueError(f"Unknown distribution of '{name}': '{specification[0]}'. "
+                             f"Currently implemented distributions are: {list(DISTRIBUTIONS)}")
+
+
+def scale(space, unit_sample):
+    """
+    The parameter values of points in the unit hypercube, one column per parameter of space.
+
+    Parameters
+    ----------
+    space: dict of parameter name to ('uniform', low, high), ('integer', low, high) (both included) or ('choice', values)
+    unit_sample: array (samples x parameters) of numbers in [0, 1)
+
+    Returns
+    -------
+    samples: DataFrame with a column of values per parameter
+    """
+    columns = {}
+    for column, (name, specification) in zip(unit_sample.T, space.items()):
+        distribution = specification[0]
+        if distribution == 'uniform':
+            low, high = specification[1], specification[2]
+            columns[name] = low + (high - low) * column
+        elif distribution == 'integer':
+            low, high = specification[1], specification[2]
+            columns[name] = np.minimum(low + np.floor(column * (high - low + 1)), high).astype(np.int64)
+        else:
+            values = list(specification[1])
+            columns[name] = [values[index] for index in np.minimum((column * len(values)).astype(np.int64), len(values) - 1)]
+    return pd.DataFrame(columns)
+
+
+def sample_latin_hypercube(space, number_of_samples, seed=None):
+    """A Latin hypercube sample of the parameter space, a DataFrame with one row per sample."""
+    check_space(space)
+    return scale(space, qmc.LatinHypercube(d=len(space), seed=seed).random(number_of_samples))
+
+
+def sample_sobol(space, number_of_samples, seed=None):
+    """
+    Saltelli's sample for Sobol indices: the matrices A and B of number_of_samples points (a power of 2) and, for every
+    parameter i, the matrix AB_i that is A with column i from B. number_of_samples * (parameters + 2) rows in total,
+    the column Matrix tells which matrix a row belongs to.
+    """
+    check_space(space)
+    dimensions = len(space)
+    base = qmc.Sobol(d=2 * dimensions, scramble=True, seed=seed).random(number_of_samples)
+    A, B = base[:, :dimensions], base[:, dimensions:]
+    matrices, names = [A, B], ['A', 'B']
+    for i, name in enumerate(space):
+        AB = A.copy()
+        AB[:, i] = B[:, i]
+        matrices.append(AB)
+        names.append(f'AB_{name}')
+    samples = scale(space, np.concatenate(matrices))
+    samples.insert(0, 'Matrix', np.repeat(names, number_of_samples))
+    return samples
+
+
+def sample_kwargs(sample, parameters=None):
+    """The model kwargs of one sample (a dict of parameter name to value), the thresholds go into decision_thresholds."""
+    kwargs = dict(parameters or {})
+    thresholds = dict(kwargs.get('decision_thresholds') or {})
+    for name, value in sample.items():
+        if name == 'Matrix':
+            continue
+        if hasattr(value, 'item'):                           # NumPy scalars from the sample DataFrame
+            value = value.item()
+        if name in DECISION_THRESHOLDS:
+            thresholds[name] = value
+        else:
+            kwargs[name] = value
+    if thresholds:
+        kwargs['decision_thresholds'] = thresholds
+    return kwargs
+
+
+def evaluate(model_cls, samples, parameters=None, seeds=range(3), max_steps=5,
+             reporters=("percentage_adapted_households",), step=None, **sweep_kwargs):
+    """
+    Run every sample for every seed and average the reporters over the seeds.
+
+    Parameters
+    ----------
+    model_cls: the model class, e.g. AdaptationModel
+    samples: DataFrame from sample_latin_hypercube or sample_sobol
+    parameters: model kwargs shared by all samples
+    seeds: the seeds every sample is run with
+    max_steps: as in run_sweep
+    reporters: the model reporters to evaluate
+    step: the step at which the reporters are evaluated, None is the last collected step
+    sweep_kwargs: passed on to run_sweep, e.g. number_processes and chunksize
+
+    Returns
+    -------
+    outputs: DataFrame with one row per sample and a column per reporter
+    """
+    seeds = list(seeds)
+    runs = [{**sample_kwargs(sample, parameters), 'seed': seed}
+            for sample in samples.to_dict('records') for seed in seeds]
+    sweep_kwargs.setdefault('share_initialization', True)
+    # without step only the first and last step are kept, so the memory does not grow with the number of steps
+    data_collection_period = max_steps + 1 if step is None else 1
+    rows = run_sweep(model_cls, runs, max_steps=max_steps, data_collection_period=data_collection_period, **sweep_kwargs)
+    data = pd.DataFrame(rows)
+    last_step = data.groupby('RunId')['Step'].transform('max')
+    data = data[data['Step'] == (last_step if step is None else step)]
+    data = data.assign(Sample=data['RunId'] // len(seeds))
+    return data.groupby('Sample')[list(reporters)].mean().reindex(range(len(samples)))
+
+
+def partial_rank_correlations(samples, outputs):
+    """
+    Partial rank correlation coefficients (PRCC) of every numeric parameter with every output: the correlation of the
+    ranks of a parameter and an output after removing the linear effect of the ranks of the other parameters.
+    """
+    parameters = [name for name in samples.columns if name != 'Matrix' and pd.api.types.is_numeric_dtype(samples[name])]
+    ranks = np.column_stack([rankdata(samples[name]) for name in parameters])
+    records = []
+    for output in outputs.columns:
+        output_ranks = rankdata(outputs[output])
+        for i, name in enumerate(parameters):
+            others = np.column_stack([np.ones(len(ranks)), np.delete(ranks, i, axis=1)])
+            residual_parameter = ranks[:, i] - others @ np.linalg.lstsq(others, ranks[:, i], rcond=None)[0]
+            residual_output = output_ranks - others @ np.linalg.lstsq(others, output_ranks, rcond=None)[0]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                prcc = np.corrcoef(residual_parameter, residual_output)[0, 1]
+            records.append({'Output': output, 'Parameter': name, 'PRCC': prcc})
+    return pd.DataFrame(records)
+
+
+def sobol_indices(space, samples, outputs):
+    """
+    First-order (Saltelli 2010) and total (Jansen) Sobol indices of every parameter for every output, from the outputs
+    of a sample_sobol sample.
+    """
+    records = []
+    for output in outputs.columns:
+        values = outputs[output].to_numpy(dtype=np.float64)
+        f_A, f_B = values[samples['Matrix'] == 'A'], values[samples['Matrix'] == 'B']
+        variance = np.var(np.concatenate([f_A, f_B]), ddof=1)
+        for name in space:
+            f_AB = values[samples['Matrix'] == f'AB_{name}']
+            with np.errstate(invalid='ignore', divide='ignore'):
+                first_order = np.mean(f_B * (f_AB - f_A)) / variance
+                total = 0.5 * np.mean((f_A - f_AB) ** 2) / variance
+            records.append({'Output': output, 'Parameter': name, 'S1': first_order, 'ST': total})
+    return pd.DataFrame(records)
+
+
+def run_sensitivity(model_cls, space, method='sobol', number_of_samples=64, seed=None, **evaluate_kwargs):
+    """
+    Sample the parameter space, evaluate the samples and compute the sensitivity indices.
+
+    Parameters
+    ----------
+    model_cls: the model class, e.g. AdaptationModel
+    space: the parameter space, see scale
+    method: "sobol" (Sobol indices) or "latin_hypercube" (partial rank correlations)
+    number_of_samples: number of samples, for "sobol" the size of the matrices A and B (a power of 2)
+    seed: seed of the sampling
+    evaluate_kwargs: passed on to evaluate, e.g. parameters, seeds, reporters and number_processes
+
+    Returns
+    -------
+    samples, outputs, indices: DataFrames
+    """
+    if method == 'sobol':
+        samples = sample_sobol(space, number_of_samples, seed)
+        outputs = evaluate(model_cls, samples, **evaluate_kwargs)
+        return samples, outputs, sobol_indices(space, samples, outputs)
+    elif method == 'latin_hypercube':
+        samples = sample_latin_hypercube(space, number_of_samples, seed)
+        outputs = evaluate(model_cls, samples, **evaluate_kwargs)
+        return samples, outputs, partial_rank_correlations(samples, outputs)
+    raise ValueError(f"Unknown sensitivity method: '{method}'. "
+                     f"Currently implemented methods are: 'sobol' and 'latin_hypercube'")
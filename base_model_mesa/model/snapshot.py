@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Snapshots of AdaptationModel: fork many policy scenarios from one initialization, and checkpoint running models.
+
+For a given seed, number of households, network and flood map, everything AdaptationModel.__init__ does (the
+network, household placement, floodplain test, flood map lookup and income classes) is the same for every policy
+scenario, only gov_action_A_sub and gov_action_B_awa differ, and they are not used before the first step (neither
+are the decision_thresholds, which a fork can change as well, e.g. for a sensitivity analysis). So the
+initialized model can be built once, stored as a snapshot, and every scenario forked from it:
+
+    data = snapshot(AdaptationModel(seed=1))
+    model = fork(data, gov_action_A_sub=True)
+
+A snapshot is the pickled model, compressed with zlib. The flood map is not part of it, a restored model gets its
+band from the flood map cache (see floodmaps.py). The same snapshots checkpoint a model in the middle of a run, and
+the resumed model continues exactly as the original would have:
+
+    save_checkpoint(model, 'run.ckpt')
+    model = load_checkpoint('run.ckpt')
+"""
+import os
+import pickle
+import zlib
+from collections import OrderedDict
+
+SNAPSHOT_VERSION = 1                                         # increase when the content of a snapshot changes
+POLICY_PARAMETERS = ('gov_action_A_sub', 'gov_action_B_awa', 'gov_campaign_region', 'decision_thresholds')  # the parameters a fork can change
+
+
+def snapshot(model, compression_level=1):
+    """
+    Serialize a model, with its households, network, schedule, random state and collected data.
+
+    Parameters
+    ----------
+    model: the AdaptationModel to serialize (created without profile, the profiler wraps methods that cannot be pickled)
+    compression_level: zlib level, 0 is fastest and largest
+
+    Returns
+    -------
+    data: bytes
+    """
+    if getattr(model, 'profiler', None) is not None:
+        raise ValueError("Models with profiling cannot be snapshot, create the model with profile=None")
+    payload = zlib.compress(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL), compression_level)
+    return pickle.dumps((SNAPSHOT_VERSION, payload), protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def restore(data):
+    """Recreate the model stored with snapshot, as an independent copy."""
+    version, payload = pickle.loads(data)
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(f"Snapshot version {version} cannot be restored, the current version is {SNAPSHOT_VERSION}")
+    return pickle.loads(zlib.decompress(payload))
+
+
+def fork(data, **policy):
+    """
+    Restore a snapshot of an initialized model with other policy parameters.
+
+    Parameters
+    ----------
+    data: bytes from snapshot, taken before the first step
+    policy: gov_action_A_sub, gov_action_B_awa, gov_campaign_region and/or decision_thresholds
+
+    Returns
+    -------
+    model: a new model, as if it was created with these policy parameters
+    """
+    for name in policy:
+        if name not in POLICY_PARAMETERS:
+            raise ValueError(f"Unknown policy parameter: '{name}'. "
+                             f"Currently implemented policy parameters are: {list(POLICY_PARAMETERS)}")
+    model = restore(data)
+    if policy and model.schedule.steps != 0:
+        raise ValueError("Policy parameters can only be changed in a snapshot taken before the first step")
+    for name, value in policy.items():
+        if name == 'gov_campaign_region':
+            from spatial import check_region
+            check_region(value)
+        if name == 'decision_thresholds':
+            from agents import make_decision_thresholds   # the model module is loaded by restore already
+            model.decision_thresholds = make_decision_thresholds(value)
+            continue
+        setattr(model, name, value)
+        setattr(model.government, name, value)                # the Government copies the parameters when it is created
+    return model
+
+
+def save_checkpoint(model, path, compression_level=1):
+    """
+    Write a snapshot of a (running) model to a file. The file is written next to its destination first and then
+    moved, so an interrupted run never leaves half a checkpoint.
+    """
+    temporary_path = f'{path}.{os.getpid()}.tmp'
+    with open(temporary_path, 'wb') as file:
+        file.write(snapshot(model, compression_level))
+    os.replace(temporary_path, path)
+
+
+def load_checkpoint(path):
+    """Restore the model written by save_checkpoint, to continue its run."""
+    with open(path, 'rb') as file:
+        return restore(file.read())
+
+
+class InitializationCache:
+    """
+    Bounded LRU cache of snapshots of initialized models, keyed by the model class and all parameters except the
+    policy parameters. Models created through the cache are forks of the cached snapshot.
+
+    Parameters
+    ----------
+    max_entries: number of snapshots kept, the least recently used snapshot is dropped first
+    """
+
+    def __init__(self, max_entries=8):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def create(self, model_cls, kwargs):
+        """
+        Return model_cls(**kwargs), forked from the cached initialization when the same model without the policy
+        parameters was created before. Models with profiling are created directly.
+        """
+        if kwargs.get('profile') is not None:
+            return model_cls(**kwargs)
+        policy = {name: value for name, value in kwargs.items() if name in POLICY_PARAMETERS}
+        initialization = {name: value for name, value in kwargs.items() if name not in POLICY_PARAMETERS}
+        key = (model_cls.__module__, model_cls.__qualname__, repr(sorted(initialization.items())))
+        if key in self._entries:
+            self._entries.move_to_end(key)
+        else:
+            self._entries[key] = snapshot(model_cls(**initialization))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return fork(self._entries[key], **policy)
+
+    def clear(self):
+        """Drop all cached snapshots."""
+        self._entries.clear()
+
+
+# The cache shared by all models created in this process through it
+initialization_cache = InitializationCache()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Spatial index over the locations of the households.
+
+The households do not move, so the model builds one KD-tree over all household coordinates when they are placed
+(in O(n log n)) and answers every spatial question with it instead of testing the households one by one:
+
+- which households are inside a region (e.g. the floodplain, for Households.in_floodplain and for awareness campaigns
+  of the Government that only target the floodplain, see AdaptationModel(gov_campaign_region=...)),
+- which households are within a distance of a point,
+- the k geographically nearest neighbours of every household, for AdaptationModel(network='spatial_knn').
+"""
+import numpy as np
+from scipy.spatial import cKDTree
+from shapely import contains_xy
+
+from functions import floodplain_multipolygon
+
+# The named regions of households_in_region, a shapely geometry can be given as well
+REGIONS = ('all', 'floodplain')
+
+
+def check_region(region):
+    """Raise an error for a region that is neither a named region nor a shapely geometry."""
+    if isinstance(region, str) and region not in REGIONS:
+        raise ValueError(f"Unknown region: '{region}'. "
+                         f"Currently implemented regions are: {list(REGIONS)} or a shapely geometry")
+
+
+class HouseholdSpatialIndex:
+    """
+    Parameters
+    ----------
+    x, y: coordinates of the households, element i belongs to the household with unique id i
+    """
+
+    def __init__(self, x, y):
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.tree = cKDTree(np.column_stack([self.x, self.y]))
+        self._in_floodplain = None
+
+    def __len__(self):
+        return len(self.x)
+
+    def within(self, geometry):
+        """
+        Boolean array telling for every household whether it is inside the geometry. Only the households in the
+        bounding box of the geometry (found with the tree) are tested against the geometry itself.
+        """
+        inside = np.zeros(len(self), dtype=bool)
+        if len(self) == 0 or geometry.is_empty:
+            return inside
+        minx, miny, maxx, maxy = geometry.bounds
+        centre = ((minx + maxx) / 2, (miny + maxy) / 2)
+        half_size = max(maxx - minx, maxy - miny) / 2
+        # a square (p=inf) around the bounding box, with a margin for the rounding of the centre
+        candidates = np.array(self.tree.query_ball_point(centre, half_size * (1 + 1e-9) + 1e-9, p=np.inf), dtype=np.int64)
+        if len(candidates):
+            inside[candidates] = contains_xy(geometry, self.x[candidates], self.y[candidates])
+        return inside
+
+    @property
+    def in_floodplain(self):
+        """Boolean array telling for every household whether it is inside the floodplain, computed once."""
+        if self._in_floodplain is None:
+            self._in_floodplain = self.within(floodplain_multipolygon)
+        return self._in_floodplain
+
+    def households_in_region(self, region):
+        """
+        The households in a region: "all" (None, meaning every household), "floodplain" or a shapely geometry
+        (a boolean array per unique id).
+        """
+        check_region(region)
+        if isinstance(region, str):
+            return None if region == 'all' else self.in_floodplain
+        return self.within(region)
+
+    def within_distance(self, x, y, distance):
+        """The unique ids of the households within distance (in metres) of the point (x, y), sorted."""
+        return np.array(sorted(self.tree.query_ball_point((x, y), distance)), dtype=np.int64)
+
+    def nearest_neighbours(self, k):
+        """
+        The k nearest other households of every household, an array (households x k) of unique ids ordered by
+        distance. k is capped at the number of other households.
+        """
+        n = len(self)
+        k = min(k, n - 1)
+        if k <= 0:
+            return np.empty((n, 0), dtype=np.int64)
+        _, neighbours = self.tree.query(np.column_stack([self.x, self.y]), k=k + 1)
+        neighbours = neighbours.reshape(n, k + 1).astype(np.int64)
+        # drop the household itself, or the farthest neighbour when households at the same location hide it
+        keep = neighbours != np.arange(n)[:, None]
+        keep[keep.all(axis=1), -1] = False
+        return neighbours[keep].reshape(n, k)
+
+    def nearest_neighbour_edges(self, k):
+        """
+        The edges (i, j) with i < j between every household and its k nearest neighbours, each edge once.
+        A household can have more than k friends, when it is one of the k nearest of other households.
+        """
+        n = len(self)
+        neighbours = self.nearest_neighbours(k)
+        sources = np.repeat(np.arange(n, dtype=np.int64), neighbours.shape[1])
+        targets = neighbours.ravel()
+        keys = np.unique(np.minimum(sources, targets) * n + np.maximum(sources, targets))
+        return keys // n, keys % n
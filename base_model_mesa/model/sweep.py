@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel, deterministic parameter sweeps of the AdaptationModel.
+
+run_sweep replaces mesa's batch_run for the sweeps in demo.ipynb (seeds x gov_action_A_sub x gov_action_B_awa x
+networks). Runs are spread over a process pool in chunks, every worker loads the geodata and flood maps once when it
+starts, and the results of each run are written to disk as soon as it is done. By default it returns one row per run
+and collected step; with merge_agent_data=True it returns the rows of batch_run (one per agent and step).
+
+Every run only depends on its own parameters (including the seed), and results are handed out and written in run
+order, so the output is bit-identical to a serial run whatever the number of workers or the order in which runs finish.
+"""
+import csv
+import itertools
+import multiprocessing
+from functools import partial
+
+from floodmaps import FloodMapCache, flood_map_cache, flood_map_paths
+from snapshot import initialization_cache
+from results import ResultsStore, model_parameters, run_key
+
+
+def make_parameter_grid(parameters):
+    """
+    All combinations of the parameter values, following the rules of mesa's batch_run:
+    strings, dicts (e.g. decision_thresholds) and other non-iterable values are single values, other iterables are
+    swept over.
+
+    Parameters
+    ----------
+    parameters: dict of parameter name to a value or an iterable of values, or a list of dicts with the kwargs of
+                every run (e.g. the samples of a sensitivity analysis), which is returned as it is
+
+    Returns
+    -------
+    kwargs_list: list of dicts with the model kwargs of every run
+    """
+    if isinstance(parameters, list):
+        return [dict(kwargs) for kwargs in parameters]
+    parameter_list = []
+    for parameter, values in parameters.items():
+        if isinstance(values, (str, dict)):
+            parameter_list.append([(parameter, values)])
+            continue
+        try:
+            parameter_list.append([(parameter, value) for value in values])
+        except TypeError:
+            parameter_list.append([(parameter, values)])
+    return [dict(kwargs) for kwargs in itertools.product(*parameter_list)]
+
+
+def run_model(model_cls, run_id, kwargs, max_steps, data_collection_period, collect_agents=False,
+              share_initialization=False, iteration=0):
+    """
+    Run one model and return its model (and agent) data, for the same steps as mesa's batch_run.
+    With share_initialization the model is forked from the initialization cache (see snapshot.py).
+
+    Returns
+    -------
+    model_rows: list of dicts with RunId, iteration, Step, the parameters and the model reporters per collected step
+    agent_rows: list of dicts with RunId, iteration, Step, AgentID and the agent reporters, empty unless collect_agents
+                is True (merge_rows combines both into the rows of batch_run)
+    """
+    model = initialization_cache.create(model_cls, kwargs) if share_initialization else model_cls(**kwargs)
+    while model.running and model.schedule.steps <= max_steps:
+        model.step()
+    close = getattr(model, 'close', None)                   # e.g. completes the Parquet file of the columnar collector
+    if close is not None:
+        close()
+
+    steps = list(range(0, model.schedule.steps, data_collection_period))
+    if not steps or steps[-1] != model.schedule.steps - 1:
+        steps.append(model.schedule.steps - 1)
+
+    datacollector = model.datacollector
+    model_rows, agent_rows = [], []
+    for step in steps:
+        model_data = {reporter: values[step] for reporter, values in datacollector.model_vars.items()}
+        model_rows.append({"RunId": run_id, "iteration": iteration, "Step": step, **kwargs, **model_data})
+    if collect_agents:
+        # works for both mesa's DataCollector and the ColumnarDataCollector
+        agent_data = datacollector.get_agent_vars_dataframe().reset_index()
+        agent_data = agent_data[agent_data['Step'].isin(steps)]
+        agent_data.insert(0, 'RunId', run_id)
+        agent_data.insert(1, 'iteration', iteration)
+        agent_rows = agent_data.astype(object).to_dict('records')
+    return model_rows, agent_rows
+
+
+def merge_rows(model_rows, agent_rows):
+    """
+    The rows of mesa's batch_run: one row per agent and collected step with the model data of that step, or only the
+    model data for steps without agent data.
+    """
+    agent_rows_per_step = {}
+    for agent_row in agent_rows:
+        agent_data = {name: value for name, value in agent_row.items() if name not in ("RunId", "iteration", "Step")}
+        agent_rows_per_step.setdefault(agent_row["Step"], []).append(agent_data)
+    rows = []
+    for model_row in model_rows:
+        step_agent_rows = agent_rows_per_step.get(model_row["Step"])
+        if step_agent_rows:
+            rows.extend({**model_row, **agent_data} for agent_data in step_agent_rows)
+        else:
+            rows.append(model_row)
+    return rows
+
+
+def _run_item(run, model_cls, max_steps, data_collection_period, collect_agents, share_initialization):
+    """Run one (run_id, iteration, kwargs) item, in a worker or in this process."""
+    run_id, iteration, kwargs = run
+    return run_model(model_cls, run_id, kwargs, max_steps, data_collection_period, collect_agents,
+                     share_initialization, iteration)
+
+
+def _flood_map_window_bounds(clip_flood_maps):
+    """The bounds of the model domain when the flood maps are clipped to it, else None."""
+    if not clip_flood_maps:
+        return None
+    import functions
+    return functions.map_minx, functions.map_miny, functions.map_maxx, functions.map_maxy
+
+
+def _warm_up_worker(flood_map_choices, use_shared_memory, clip_flood_maps=False, flood_map_memmap_dir=None):
+    """Pool initializer: load the geodata and flood maps once per worker, before the first run."""
+    import functions  # noqa: F401  (loads the geodata bundle or shapefiles at import)
+    flood_map_cache.use_shared_memory = use_shared_memory
+    flood_map_cache.window_bounds = _flood_map_window_bounds(clip_flood_maps)
+    flood_map_cache.memmap_dir = flood_map_memmap_dir
+    flood_map_cache.preload(*[flood_map_paths[choice] for choice in flood_map_choices])
+
+
+def _flood_map_choices(runs):
+    """The flood maps the runs use: their flood_map_choice and the maps of their flood_events."""
+    choices = set()
+    for _, _, kwargs in runs:
+        choices.add(kwargs.get('flood_map_choice', 'harvey'))
+        choices.update((kwargs.get('flood_events') or {}).values())
+    return sorted(choices)
+
+
+class _RowWriter:
+    """
+    Appends rows to a CSV file. The header has the given fieldnames (e.g. all swept parameters, also those of runs
+    that do not set them) followed by the other columns of the first row, and rows without a column leave it empty.
+    A row with a column that is not in the header yet widens the header, and the rows written so far are rewritten.
+    """
+
+    def __init__(self, path, fieldnames=()):
+        self.path = path
+        self.file = open(path, 'w', newline='')
+        self.fieldnames = list(fieldnames)
+        self.writer = None
+
+    def _start(self, fieldnames):
+        self.fieldnames = fieldnames
+        self.writer = csv.DictWriter(self.file, fieldnames=fieldnames, restval='')
+        self.writer.writeheader()
+
+    def _widen(self, row):
+        self.file.close()
+        with open(self.path, newline='') as file:
+            written_rows = list(csv.DictReader(file))
+        self.file = open(self.path, 'w', newline='')
+        self._start(self.fieldnames + [name for name in row if name not in self.fieldnames])
+        self.writer.writerows(written_rows)
+
+    def write(self, rows):
+        for row in rows:
+            if self.writer is None:
+                self._start(self.fieldnames + [name for name in row if name not in self.fieldnames])
+            elif not row.keys() <= set(self.fieldnames):
+                self._widen(row)
+            self.writer.writerow(row)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def run_sweep(model_cls, parameters, max_steps=1000, data_collection_period=1, number_processes=1, chunksize=1,
+              maxtasksperchild=None, output_path=None, agent_output_path=None, use_shared_memory=False,
+              share_initialization=False, clip_flood_maps=False, flood_map_memmap_dir=None, results_path=None,
+              store_agent_data=False, statistics=None, keep_results=True, iterations=1, merge_agent_data=False):
+    """
+    Run a parameter sweep, in parallel when number_processes is not 1.
+
+    Parameters
+    ----------
+    model_cls: the model class, e.g. AdaptationModel
+    parameters: dict of parameter name to a value or an iterable of values, like in batch_run, or a list of the kwargs
+                of every run (see make_parameter_grid)
+    max_steps, data_collection_period: as in batch_run
+    number_processes: number of worker processes, None uses all CPUs and 1 runs in this process
+    chunksize: number of runs sent to a worker at once, larger chunks mean less overhead for many short runs
+    maxtasksperchild: restart a worker after this many chunks, to bound its memory use
+    output_path: CSV file the model data of each run is appended to as soon as the run is done, with a column for
+                 every parameter of the sweep (empty for runs that do not set it)
+    agent_output_path: CSV file for the agent data, agent data is only collected when this is given
+    use_shared_memory: decode each flood map once into shared memory for all workers, instead of once per worker
+    share_initialization: initialize each model once per process and fork the policy scenarios
+                          (gov_action_A_sub, gov_action_B_awa) from it. The policy parameters vary fastest when they
+                          come last in parameters, so give a chunksize that is a multiple of the number of scenarios
+                          to keep the scenarios of one model in the same worker.
+    clip_flood_maps: only read the pixels of the flood maps that cover the model domain
+    flood_map_memmap_dir: directory where the decoded flood maps are written once as .npy files that all workers map
+                          read-only (see FloodMapCache), instead of every worker decoding its own copy
+    results_path: SQLite database (see results.py) every run is stored in as soon as it is done. Runs that are already
+                  stored with the same parameters, max_steps and data_collection_period are not run again, so an
+                  interrupted sweep continues where it stopped when it is started again.
+    store_agent_data: also collect the agent data of every run and store it in results_path
+    statistics: an EnsembleStatistics (see aggregation.py) the model data of every run is added to
+    keep_results: keep the model data of all runs to return it, with statistics this can be turned off so that the
+                  memory does not grow with the number of runs
+    iterations: number of runs of every parameter combination, as in batch_run (the runs of a combination only
+                differ when the model is not seeded)
+    merge_agent_data: return the rows of batch_run, one row per agent and collected step with the model data of that
+                      step (see merge_rows), instead of one row per collected step
+
+    Returns
+    -------
+    results: list of dicts with the data of all runs, in run order (empty when keep_results is False). Like batch_run
+             every row has RunId, iteration and Step, but the default data_collection_period is 1 instead of -1 and
+             the agent data is only in the rows with merge_agent_data.
+    """
+    runs = [(iteration, kwargs) for iteration in range(iterations) for kwargs in make_parameter_grid(parameters)]
+    runs = [(run_id, iteration, kwargs) for run_id, (iteration, kwargs) in enumerate(runs)]
+    flood_map_choices = _flood_map_choices(runs)
+    collect_agents = agent_output_path is not None or store_agent_data or merge_agent_data
+
+    store = ResultsStore(results_path) if results_path is not None else None
+    keys = [run_key(model_cls, kwargs, max_steps=max_steps, data_collection_period=data_collection_period,
+                    iteration=iteration)
+            for _, iteration, kwargs in runs]
+    # runs that were stored by an earlier sweep (with their agent data when it is collected) are skipped
+    stored = store.completed(need_agent_data=collect_agents) if store is not None else set()
+    pending_runs = [run for run, key in zip(runs, keys) if key not in stored]
+
+    run_item = partial(_run_item, model_cls=model_cls, max_steps=max_steps,
+                       data_collection_period=data_collection_period, collect_agents=collect_agents,
+                       share_initialization=share_initialization)
+
+    parameter_names = list(dict.fromkeys(name for _, _, kwargs in runs for name in kwargs))
+    model_writer = (_RowWriter(output_path, ["RunId", "iteration", "Step"] + parameter_names)
+                    if output_path is not None else None)
+    agent_writer = _RowWriter(agent_output_path) if agent_output_path is not None else None
+    shared_cache = None
+    pool = None
+    results = []
+    # a serial sweep warms up the cache of this process, its settings are put back afterwards (the flood maps
+    # decoded with other settings are kept under other keys, see FloodMapCache)
+    cache_settings = (flood_map_cache.use_shared_memory, flood_map_cache.window_bounds, flood_map_cache.memmap_dir)
+    try:
+        if number_processes == 1:
+            _warm_up_worker(flood_map_choices, False, clip_flood_maps, flood_map_memmap_dir)
+            outputs = map(run_item, pending_runs)
+        else:
+            if use_shared_memory or flood_map_memmap_dir is not None:
+                # decode the maps into shared memory or the memory-mapped files once, the workers attach to these
+                shared_cache = FloodMapCache(use_shared_memory=use_shared_memory,
+                                             window_bounds=_flood_map_window_bounds(clip_flood_maps),
+                                             memmap_dir=flood_map_memmap_dir)
+                shared_cache.preload(*[flood_map_paths[choice] for choice in flood_map_choices])
+            pool = multiprocessing.Pool(number_processes, initializer=_warm_up_worker,
+                                        initargs=(flood_map_choices, use_shared_memory, clip_flood_maps,
+                                                  flood_map_memmap_dir),
+                                        maxtasksperchild=maxtasksperchild)
+            # imap hands out the results in run order, so the files do not depend on which worker finishes first
+            outputs = pool.imap(run_item, pending_runs, chunksize=chunksize)
+        for (run_id, iteration, kwargs), key in zip(runs, keys):
+            if key in stored:
+                model_rows, agent_rows = _stored_rows(store, key, run_id, iteration, kwargs, collect_agents)
+            else:
+                model_rows, agent_rows = next(outputs)
+                if store is not None:
+                    store.add_run(key, model_parameters(model_cls, kwargs), model_rows, agent_rows if collect_agents else None)
+            if keep_results:
+                results.extend(merge_rows(model_rows, agent_rows) if merge_agent_data else model_rows)
+            if statistics is not None:
+                statistics.add_rows(model_rows)
+            if model_writer is not None:
+                model_writer.write(model_rows)
+            if agent_writer is not None:
+                agent_writer.write(agent_rows)
+    finally:
+        flood_map_cache.use_shared_memory, flood_map_cache.window_bounds, flood_map_cache.memmap_dir = cache_settings
+        if pool is not None:
+            pool.terminate()
+        for writer in (model_writer, agent_writer):
+            if writer is not None:
+                writer.close()
+        if shared_cache is not None:
+            shared_cache.close(unlink=True)
+        if store is not None:
+            store.close()
+    return results
+
+
+def _stored_rows(store, key, run_id, iteration, kwargs, collect_agents):
+    """The rows of a stored run, with the run id and parameter values of this sweep (SQLite stores booleans as 0 and 1)."""
+    model_rows = [{**row, "RunId": run_id, "iteration": iteration, **kwargs} for row in store.get_model_rows(key)]
+    agent_rows = ([{**row, "RunId": run_id, "iteration": iteration} for row in store.get_agent_rows(key)]
+                  if collect_agents else [])
+    return model_rows, agent_rows
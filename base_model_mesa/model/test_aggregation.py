@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""The streaming statistics match the statistics of the kept runs, and the KLL sketch stays within its rank error."""
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from aggregation import EnsembleStatistics, QuantileSketch, RunningMoments
+from ensemble import AdaptationEnsemble
+from model import AdaptationModel
+from sweep import run_sweep
+
+QUANTILES = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
+
+
+def rank_errors(values, estimates, quantiles):
+    """The difference between the rank (as a share of the values) of every estimate and its quantile."""
+    ranks = np.searchsorted(np.sort(values), estimates) / len(values)
+    return np.abs(ranks - np.asarray(quantiles))
+
+
+def test_quantile_sketch_is_exact_up_to_k_values():
+    values = np.random.default_rng(1).standard_normal(150)
+    sketch = QuantileSketch(k=200)
+    sketch.add(values)
+    assert sketch.count == 150
+    assert len(sketch.levels) == 1
+    expected = np.sort(values)[np.ceil(np.asarray(QUANTILES) * 150).astype(int) - 1]
+    np.testing.assert_array_equal(sketch.quantiles(QUANTILES), expected)
+
+
+def test_quantile_sketch_rank_error():
+    values = np.random.default_rng(0).standard_normal(100000)
+    sketch = QuantileSketch(k=200)
+    for chunk in np.array_split(values, 1000):
+        sketch.add(chunk)
+    assert sketch.count == len(values)
+    assert sum(len(items) for items in sketch.levels) < 1000        # O(k) values are kept
+    assert rank_errors(values, sketch.quantiles(QUANTILES), QUANTILES).max() < 0.02
+
+
+def test_merged_quantile_sketches_rank_error():
+    values = np.random.default_rng(2).exponential(size=60000)
+    sketches = [QuantileSketch(k=200, seed=seed) for seed in range(3)]
+    for sketch, part in zip(sketches, np.array_split(values, 3)):
+        for chunk in np.array_split(part, 50):
+            sketch.add(chunk)
+    merged = sketches[0]
+    merged.merge(sketches[1])
+    merged.merge(pickle.loads(pickle.dumps(sketches[2])))
+    assert merged.count == len(values)
+    assert rank_errors(values, merged.quantiles(QUANTILES), QUANTILES).max() < 0.02
+
+
+def test_empty_quantile_sketch():
+    assert np.isnan(QuantileSketch().quantiles([0.5])).all()
+
+
+def test_running_moments():
+    values = np.random.default_rng(3).standard_normal((2, 500))
+    moments, other = RunningMoments(), RunningMoments()
+    for value in values[0, :250]:
+        moments.add(0, value)
+    moments.add(0, values[0, 250:])
+    other.add(1, values[1])
+    moments.merge(other)
+    np.testing.assert_array_equal(moments.count, [500, 500])
+    np.testing.assert_allclose(moments.mean, values.mean(axis=1))
+    np.testing.assert_allclose(moments.variance(), values.var(axis=1, ddof=1))
+
+
+def test_ensemble_statistics_match_kept_runs():
+    parameters = dict(seed=range(12), number_of_households=60, gov_action_A_sub=[False, True], gov_action_B_awa=True)
+    statistics = EnsembleStatistics(by=['gov_action_A_sub'])
+    rows = run_sweep(AdaptationModel, parameters, max_steps=5, statistics=statistics)
+    reporter = "Average flood damage actual"
+    expected = pd.DataFrame(rows).groupby(['gov_action_A_sub', 'Step'])[reporter].agg(['mean', 'var', 'count'])
+    result = statistics.get_dataframe()
+    result = result[result['Reporter'] == reporter].set_index(['gov_action_A_sub', 'Step'])
+    np.testing.assert_allclose(result['Mean'], expected['mean'])
+    np.testing.assert_allclose(result['Variance'], expected['var'])
+    assert (result['Count'] == expected['count']).all()
+    assert statistics.runs == {(False,): 12, (True,): 12}
+
+    # statistics of two halves of the runs, merged, are the statistics of all runs
+    halves = EnsembleStatistics(by=['gov_action_A_sub']), EnsembleStatistics(by=['gov_action_A_sub'])
+    for index, (_, run_rows) in enumerate(pd.DataFrame(rows).groupby('RunId')):
+        halves[index % 2].add_rows(run_rows.to_dict('records'))
+    merged = pickle.loads(pickle.dumps(halves[0]))
+    merged.merge(halves[1])
+    merged_result = merged.get_dataframe()
+    np.testing.assert_allclose(merged_result['Mean'], statistics.get_dataframe()['Mean'])
+    np.testing.assert_allclose(merged_result['Variance'], statistics.get_dataframe()['Variance'])
+
+    with pytest.raises(ValueError):
+        merged.merge(EnsembleStatistics(by=['gov_action_B_awa']))
+
+
+def test_ensemble_statistics_of_an_ensemble():
+    ensemble = AdaptationEnsemble(seeds=range(20), number_of_households=60)
+    ensemble.run(5)
+    statistics = EnsembleStatistics(by=['gov_action_A_sub'])
+    statistics.add_ensemble(ensemble)
+    result = statistics.get_dataframe()
+    expected = ensemble.get_model_vars_dataframe().groupby('Step')["percentage_adapted_households"].mean()
+    result = result[result['Reporter'] == "percentage_adapted_households"]
+    np.testing.assert_allclose(result['Mean'], expected)
+    assert (result['Count'] == 20).all()
+    assert statistics.runs == {(False,): 20}
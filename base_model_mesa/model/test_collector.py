@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""The columnar collector gives the data of mesa's DataCollector, also when it is sampled or written to Parquet."""
+import gc
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from model import AdaptationModel
+
+STEPS = 8
+
+
+def run(**kwargs):
+    model = AdaptationModel(number_of_households=60, seed=4, **kwargs)
+    for _ in range(STEPS):
+        model.step()
+    return model
+
+
+def test_columnar_data_matches_mesa_data():
+    mesa = run().datacollector
+    columnar = run(collector='columnar').datacollector
+    pd.testing.assert_frame_equal(columnar.get_model_vars_dataframe(), mesa.get_model_vars_dataframe(), check_dtype=False)
+    expected = mesa.get_agent_vars_dataframe()
+    agent_vars = columnar.get_agent_vars_dataframe()
+    assert list(agent_vars.index) == list(expected.index)
+    for name in expected:
+        np.testing.assert_array_equal(agent_vars[name].astype(expected[name].dtype).to_numpy(), expected[name].to_numpy())
+
+
+def test_sampled_households_at_chosen_steps():
+    expected = run().datacollector.get_agent_vars_dataframe()
+    agent_vars = run(collector='columnar', agent_collection_steps=[0, 5], agent_sample=15).datacollector.get_agent_vars_dataframe()
+    assert sorted(set(agent_vars.index.get_level_values('Step'))) == [0, 5]
+    assert len(agent_vars) == 2 * 15
+    assert set(agent_vars.loc[0].index) == set(agent_vars.loc[5].index)
+    assert (agent_vars['FloodDepthEstimated'] == expected.loc[agent_vars.index, 'FloodDepthEstimated']).all()
+
+
+@pytest.mark.parametrize('close', ['close', 'with', 'garbage_collected'])
+def test_parquet_file_is_complete_at_the_end_of_the_run(tmp_path, close):
+    path = tmp_path / 'agents.parquet'
+    expected = run(collector='columnar').datacollector.get_agent_vars_dataframe()
+    if close == 'with':
+        with AdaptationModel(number_of_households=60, seed=4, collector='columnar', agent_output_path=path) as model:
+            for _ in range(STEPS):
+                model.step()
+    else:
+        model = run(collector='columnar', agent_output_path=path)
+        if close == 'close':
+            model.close()
+        del model
+        gc.collect()
+    pd.testing.assert_frame_equal(pd.read_parquet(path).set_index(['Step', 'AgentID']), expected)
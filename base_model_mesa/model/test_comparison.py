@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+"""Policy comparison with common random numbers."""
+import numpy as np
+
+from comparison import compare_policies
+from model import AdaptationModel
+
+
+def test_policy_effects():
+    effects = compare_policies(AdaptationModel, {'baseline': {}, 'awareness': {'gov_action_B_awa': True}},
+                               seeds=range(6), parameters={'number_of_households': 60}, max_steps=4, antithetic=True)
+    assert len(effects) == 2 * 5
+    assert (effects['Seeds'] == 6).all()
+
+    # the baseline against itself: no effect and no variance of the difference, so the reduction is undefined
+    same = effects[effects['Policy'] == 'baseline']
+    assert (same['Effect'] == 0).all() and (same['StandardError'] == 0).all()
+    assert same['VarianceReduction'].isna().all()
+
+    awareness = effects[effects['Policy'] == 'awareness']
+    assert np.isfinite(awareness['Effect']).all()
+    assert not np.isinf(awareness['VarianceReduction']).any()
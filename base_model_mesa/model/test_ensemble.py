@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Every replicate of an ensemble gives the model variables of a single vectorized model with rng='philox' and the same
+seed. The model reporters are sums over all households, which are added up in another order, so they are compared up
+to rounding.
+"""
+import numpy as np
+import pytest
+
+from ensemble import AdaptationEnsemble
+from model import AdaptationModel
+
+STEPS = 8
+POLICY = dict(gov_action_A_sub=True, gov_action_B_awa=True)
+
+
+def single_model_vars(steps=STEPS, **kwargs):
+    # the ensemble draws its random numbers and places its households like a vectorized model with rng='philox'
+    model = AdaptationModel(rng='philox', engine='vectorized', household_placement='triangulation', **kwargs)
+    for _ in range(steps):
+        model.step()
+    return model.datacollector.get_model_vars_dataframe().astype(float)
+
+
+def assert_replicates_match(ensemble, seeds, **kwargs):
+    ensemble_vars = ensemble.get_model_vars_dataframe()
+    assert sorted(set(ensemble_vars['Seed'])) == sorted(seeds)
+    for seed in seeds:
+        expected = single_model_vars(seed=seed, **kwargs)
+        replicate = ensemble_vars[ensemble_vars['Seed'] == seed].drop(columns=['Seed', 'Step'])
+        assert list(replicate.columns) == list(expected.columns)
+        np.testing.assert_allclose(replicate.values, expected.values, rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize('policy', [{}, POLICY])
+@pytest.mark.parametrize('network', ['barabasi_albert', 'watts_strogatz'])
+def test_ensemble_matches_single_models(network, policy):
+    ensemble = AdaptationEnsemble(seeds=[1, 2, 5], number_of_households=100, network=network, **policy)
+    ensemble.run(STEPS)
+    assert_replicates_match(ensemble, [1, 2, 5], number_of_households=100, network=network, **policy)
+
+
+def test_ensemble_matches_single_models_with_flood_events():
+    flood_events = {2: 'harvey', 6: '100yr'}
+    ensemble = AdaptationEnsemble(seeds=[4, 7], number_of_households=80, flood_events=flood_events, **POLICY)
+    ensemble.run(STEPS)
+    assert_replicates_match(ensemble, [4, 7], number_of_households=80, flood_events=flood_events, **POLICY)
+
+
+def test_ensemble_matches_single_models_with_zonal_shocks():
+    ensemble = AdaptationEnsemble(seeds=[3, 8], number_of_households=80, shock='zonal', shock_zone_size=10)
+    ensemble.run(STEPS)
+    assert_replicates_match(ensemble, [3, 8], number_of_households=80, shock='zonal', shock_zone_size=10)
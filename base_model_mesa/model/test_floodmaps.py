@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+The flood map cache decodes every map once and gives the same depths however (and how much of) the map is kept, and the
+pixel index gives the depths of get_flood_depth for all households at once.
+"""
+import hashlib
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+import rasterio as rs
+from shapely.geometry import Point
+
+import functions
+from floodmaps import FloodMapCache, HouseholdPixelIndex, flood_map_paths
+from functions import generate_random_locations_within_map_domain, get_flood_depth
+from model import AdaptationModel
+from sweep import run_sweep
+
+PATH = flood_map_paths['harvey']
+
+
+def test_cached_maps_are_shared_and_read_only():
+    cache = FloodMapCache()
+    flood_map = cache.get(PATH)
+    assert cache.get(PATH) is flood_map
+    assert not flood_map.band.flags.writeable
+    with rs.open(PATH) as dataset:
+        np.testing.assert_array_equal(flood_map.read(1), dataset.read(1))
+        assert flood_map.index(*dataset.xy(10, 20)) == dataset.index(*dataset.xy(10, 20))
+
+
+def test_least_recently_used_map_is_dropped():
+    cache = FloodMapCache(max_entries=2)
+    harvey = cache.get(flood_map_paths['harvey'])
+    cache.get(flood_map_paths['100yr'])
+    cache.get(flood_map_paths['harvey'])
+    cache.get(flood_map_paths['500yr'])
+    assert [key[0] for key in cache._entries] == [os.path.abspath(flood_map_paths[choice]) for choice in ['harvey', '500yr']]
+    assert cache.get(flood_map_paths['harvey']) is harvey
+
+
+def test_shared_memory_gives_the_same_band():
+    band = FloodMapCache().get(PATH).band
+    creator, attached = FloodMapCache(use_shared_memory=True), FloodMapCache(use_shared_memory=True)
+    try:
+        shared = creator.get(PATH)
+        other = attached.get(PATH)
+        assert shared._shared_memory_block is not None and other._shared_memory_block is not None
+        np.testing.assert_array_equal(shared.band, band)
+        np.testing.assert_array_equal(other.band, band)
+    finally:
+        attached.close()
+        creator.close(unlink=True)
+
+
+def test_shared_memory_that_is_never_ready_is_decoded_locally():
+    cache = FloodMapCache(use_shared_memory=True, shared_memory_timeout=0.2)
+    # the block of a process that died while decoding the map: it exists, but its ready flag is never set
+    name = 'floodmap_' + hashlib.sha1(repr(cache._key(PATH)).encode()).hexdigest()[:20]
+    unfinished = shared_memory.SharedMemory(name=name, create=True, size=16)
+    try:
+        flood_map = cache.get(PATH)
+    finally:
+        unfinished.close()
+        unfinished.unlink()
+    assert flood_map._shared_memory_block is None
+    np.testing.assert_array_equal(flood_map.band, FloodMapCache().get(PATH).band)
+
+
+def test_pixel_index_gives_the_depths_of_get_flood_depth():
+    x, y = generate_random_locations_within_map_domain(300, seed=1)
+    index = HouseholdPixelIndex(x, y)
+    for choice in ['harvey', '500yr']:
+        flood_map = FloodMapCache().get(flood_map_paths[choice])
+        expected = [get_flood_depth(flood_map, Point(x_i, y_i), flood_map.band) for x_i, y_i in zip(x, y)]
+        np.testing.assert_array_equal(index.depths(flood_map), expected)
+    assert len(index._pixels) == 1                          # the maps share one grid, so the pixels are looked up once
+
+
+def test_households_in_one_zone_get_one_shock_factor():
+    model = AdaptationModel(number_of_households=200, seed=3, shock='zonal', shock_zone_size=8)
+    zones, number_of_zones = model.pixel_index.zones(model.flood_map, 8)
+    assert zones.max() < number_of_zones
+    factors = model.zonal_shock_factors(model.flood_map)
+    assert ((factors >= 0.8) & (factors <= 1.2)).all()
+    for zone in np.unique(zones):
+        assert len(set(factors[zones == zone].tolist())) == 1
+
+
+def test_every_flood_event_floods_its_own_map():
+    model = AdaptationModel(number_of_households=100, seed=2, flood_events={2: '100yr', 5: '500yr'})
+    actual_depths = []
+    for _ in range(6):
+        model.step()
+        actual_depths.append([agent.flood_depth_actual for agent in model.schedule.agents])
+    # no flood before step 2, the flood of step 5 changes the actual depths again
+    assert not any(actual_depths[1]) and any(actual_depths[2])
+    assert actual_depths[3] == actual_depths[4] != actual_depths[5]
+    # the exposure of the households at the flood, as the adaptations of its step are applied in the next one
+    exposed = model.exposed_flood_depths(FloodMapCache().get(flood_map_paths['500yr']))
+    ratios = np.array(actual_depths[5])[exposed > 0] / exposed[exposed > 0]
+    assert ((ratios >= 0.8 - 1e-6) & (ratios <= 1.2 + 1e-6)).all()
+
+
+def test_windowed_map_gives_the_depths_and_zones_of_the_full_map():
+    x, y = generate_random_locations_within_map_domain(300, seed=2)
+    full = FloodMapCache().get(PATH)
+    window = FloodMapCache(window_bounds=(functions.map_minx, functions.map_miny,
+                                          functions.map_maxx, functions.map_maxy)).get(PATH)
+    assert window.band.size < full.band.size
+    np.testing.assert_array_equal(HouseholdPixelIndex(x, y).depths(window), HouseholdPixelIndex(x, y).depths(full))
+    assert [get_flood_depth(window, Point(x_i, y_i), window.band) for x_i, y_i in zip(x, y)] == \
+        [get_flood_depth(full, Point(x_i, y_i), full.band) for x_i, y_i in zip(x, y)]
+    np.testing.assert_array_equal(HouseholdPixelIndex(x, y).zones(window, 7)[0], HouseholdPixelIndex(x, y).zones(full, 7)[0])
+
+
+def test_memmap_files_are_written_once_per_map_and_window(tmp_path):
+    band = FloodMapCache().get(PATH).band
+    memmapped = FloodMapCache(memmap_dir=tmp_path).get(PATH)
+    assert isinstance(memmapped.band, np.memmap) and not memmapped.band.flags.writeable
+    np.testing.assert_array_equal(memmapped.band, band)
+    FloodMapCache(memmap_dir=tmp_path).get(PATH)                       # another process maps the same file
+    assert len(list(tmp_path.glob('*.npy'))) == 1
+    FloodMapCache(memmap_dir=tmp_path, window_bounds=(functions.map_minx, functions.map_miny,
+                                                      functions.map_maxx, functions.map_maxy)).get(PATH)
+    assert len(list(tmp_path.glob('*.npy'))) == 2
+
+
+def test_sweep_on_clipped_memmapped_maps_gives_the_same_rows(tmp_path):
+    parameters = {"number_of_households": 50, "seed": range(2), "flood_map_choice": ["harvey", "500yr"]}
+    expected = run_sweep(AdaptationModel, parameters, max_steps=6)
+    assert run_sweep(AdaptationModel, parameters, max_steps=6, number_processes=2, clip_flood_maps=True,
+                     flood_map_memmap_dir=tmp_path) == expected
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""Household placement within the map domain and the depth-damage functions."""
+import numpy as np
+import pytest
+from shapely import contains_xy
+from shapely.geometry import box
+
+import functions
+from functions import generate_random_location_within_map_domain, generate_random_locations_within_map_domain
+
+
+@pytest.mark.parametrize('method', ['rejection', 'triangulation', 'per_agent'])
+def test_locations_are_inside_the_map_domain(method):
+    x, y = generate_random_locations_within_map_domain(500, seed=3, method=method)
+    assert len(x) == len(y) == 500
+    assert contains_xy(functions.map_domain_polygon, x, y).all()
+    # the same seed gives the same locations
+    x_again, y_again = generate_random_locations_within_map_domain(500, seed=3, method=method)
+    np.testing.assert_array_equal(x, x_again)
+    np.testing.assert_array_equal(y, y_again)
+
+
+def test_per_agent_locations_match_households_placing_themselves():
+    x, y = generate_random_locations_within_map_domain(20, seed=7, method='per_agent', agent_ids=range(5, 25))
+    expected = [generate_random_location_within_map_domain(7, agent_id) for agent_id in range(5, 25)]
+    np.testing.assert_array_equal(np.column_stack([x, y]), np.array(expected))
+
+
+@pytest.mark.parametrize('method', ['rejection', 'triangulation'])
+def test_bulk_locations_are_uniform_over_the_domain(method):
+    # the share of locations in the left half of the bounds is the share of the domain area there
+    x, _ = generate_random_locations_within_map_domain(20000, seed=0, method=method, block_size=5000)
+    middle = (functions.map_minx + functions.map_maxx) / 2
+    left = functions.map_domain_polygon.intersection(
+        box(functions.map_minx, functions.map_miny, middle, functions.map_maxy))
+    assert np.mean(x < middle) == pytest.approx(left.area / functions.map_domain_polygon.area, abs=0.02)
+
+
+def test_unknown_placement_method():
+    with pytest.raises(ValueError):
+        generate_random_locations_within_map_domain(10, seed=1, method='grid')
+
+
+def test_array_damage_matches_the_damage_of_single_households():
+    depths = np.array([-1.0, 0.0, 0.02, 0.025, 0.3, 1.0, 2.7, 5.99, 6.0, 9.0])
+    expected = [functions.calculate_basic_flood_damage(float(depth)) for depth in depths]
+    np.testing.assert_allclose(functions.calculate_flood_damage(depths), expected, rtol=1e-12)
+    assert functions.calculate_basic_flood_damage(2.7) == pytest.approx(expected[6])
+
+
+def test_damage_table_is_interpolated():
+    curve = functions.DamageCurve(np.array([0.0, 1.0, 3.0]), np.array([0.0, 0.4, 0.8]))
+    np.testing.assert_allclose(functions.calculate_flood_damage([-1.0, 0.5, 2.0, 3.0, 7.0], curve),
+                               [0.0, 0.2, 0.6, 0.8, 0.8])
+    assert functions.calculate_basic_flood_damage(0.5, curve) == pytest.approx(0.2)
+    table = functions.load_damage_curve()
+    assert np.all(np.diff(table.depths) >= 0) and not table.factors.flags.writeable
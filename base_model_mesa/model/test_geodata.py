@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""The geodata bundle gives the geometries of the shapefiles and is ignored when it is stale."""
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+import geodata
+from geodata import load_bundle, load_geodata, read_shapefiles, write_bundle
+
+
+@pytest.fixture
+def shapefiles(tmp_path):
+    """Copies of the (synthetic) shapefiles, so the test can change them."""
+    paths = []
+    for source in (geodata.shapefile_path, geodata.floodplain_path):
+        base = os.path.splitext(source)[0]
+        for part in geodata.SHAPEFILE_PARTS + ('.cpg',):
+            if os.path.exists(base + part):
+                shutil.copy(base + part, tmp_path)
+        paths.append(str(tmp_path / os.path.basename(source)))
+    return paths
+
+
+def test_bundle_round_trip_matches_shapefiles(shapefiles, tmp_path):
+    bundle_path = str(tmp_path / 'bundle.npz')
+    write_bundle(*shapefiles, path=bundle_path)
+    bundle = load_bundle(*shapefiles, path=bundle_path)
+    expected = read_shapefiles(*shapefiles)
+    assert bundle['map_domain_polygon'].equals_exact(expected['map_domain_polygon'], 0)
+    assert bundle['floodplain_multipolygon'].equals_exact(expected['floodplain_multipolygon'], 0)
+    np.testing.assert_array_equal(bundle['map_domain_bounds'], expected['map_domain_bounds'])
+    np.testing.assert_array_equal(bundle['floodplain_bounds'], expected['floodplain_bounds'])
+    triangles, cumulative_area = bundle['map_domain_triangulation']
+    assert cumulative_area[-1] == 1.0 and len(triangles) == len(cumulative_area)
+
+
+def test_changed_shapefile_falls_back_to_the_shapefiles(shapefiles, tmp_path, monkeypatch):
+    bundle_path = str(tmp_path / 'bundle.npz')
+    write_bundle(*shapefiles, path=bundle_path)
+    with open(os.path.splitext(shapefiles[1])[0] + '.dbf', 'ab') as file:
+        file.write(b' ')
+    assert load_bundle(*shapefiles, path=bundle_path) is None
+
+    read = []
+    monkeypatch.setattr(geodata, 'read_shapefiles', lambda *paths: read.append(paths) or {'from': 'shapefiles'})
+    assert load_geodata(*shapefiles, path=bundle_path) == {'from': 'shapefiles'}
+    assert read == [tuple(shapefiles)]
+
+
+def test_bundle_of_another_version_is_ignored(shapefiles, tmp_path, monkeypatch):
+    bundle_path = str(tmp_path / 'bundle.npz')
+    write_bundle(*shapefiles, path=bundle_path)
+    monkeypatch.setattr(geodata, 'BUNDLE_VERSION', geodata.BUNDLE_VERSION + 1)
+    assert load_bundle(*shapefiles, path=bundle_path) is None
+
+
+def test_missing_bundle_reads_the_shapefiles(shapefiles, tmp_path):
+    assert load_bundle(*shapefiles, path=str(tmp_path / 'missing.npz')) is None
+    loaded = load_geodata(*shapefiles, path=str(tmp_path / 'missing.npz'))
+    assert loaded['map_domain_polygon'].equals(read_shapefiles(*shapefiles)['map_domain_polygon'])
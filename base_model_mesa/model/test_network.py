@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""The neighbourhood matrices and the generated social networks."""
+import networkx as nx
+import numpy as np
+import pytest
+from mesa.space import NetworkGrid
+
+from model import AdaptationModel
+from network import (CSRNetworkGrid, _pair_from_index, adjacency_neighbourhood, adjacency_to_networkx, generate_adjacency,
+                     neighbourhood_matrix)
+
+GRAPHS = {'erdos_renyi': lambda: nx.erdos_renyi_graph(80, 0.05, seed=1),
+          'barabasi_albert': lambda: nx.barabasi_albert_graph(80, 3, seed=1),
+          'watts_strogatz': lambda: nx.watts_strogatz_graph(80, 5, 0.4, seed=1)}
+
+
+def matrix_row(matrix, row):
+    return matrix.indices[matrix.indptr[row]:matrix.indptr[row + 1]].tolist()
+
+
+@pytest.mark.parametrize('radius', [1, 2, 3])
+@pytest.mark.parametrize('graph', list(GRAPHS))
+def test_neighbourhood_matrix_matches_network_grid(graph, radius):
+    G = GRAPHS[graph]()
+    grid = NetworkGrid(G)
+    neighbourhood = neighbourhood_matrix(G, radius=radius)
+    for node in G.nodes():
+        assert matrix_row(neighbourhood, node) == sorted(grid.get_neighborhood(node, include_center=False, radius=radius))
+    assert (neighbourhood.data == 1).all()
+
+
+def test_neighbourhood_matrix_in_node_order():
+    G = nx.relabel_nodes(GRAPHS['barabasi_albert'](), {node: 79 - node for node in range(80)})
+    nodelist = list(G.nodes())
+    neighbourhood = neighbourhood_matrix(G, radius=2, nodelist=nodelist)
+    for row, node in enumerate(nodelist):
+        expected = nx.single_source_shortest_path_length(G, node, cutoff=2)
+        del expected[node]
+        assert sorted(nodelist[column] for column in matrix_row(neighbourhood, row)) == sorted(expected)
+
+
+def test_adapted_friends_match_a_search_of_the_network():
+    model = AdaptationModel(number_of_households=80, network='watts_strogatz', gov_action_B_awa=True)
+    for _ in range(3):
+        model.step()
+    for agent in model.schedule.agents:
+        neighbours = model.grid.get_cell_list_contents(model.grid.get_neighborhood(agent.pos, include_center=False, radius=2))
+        agent.count_friends(radius=2)
+        if neighbours:
+            assert agent.adapted_friends_percentage == sum(n.is_adapted for n in neighbours) / len(neighbours)
+    assert model.get_neighbourhood_matrix(2) is model.get_neighbourhood_matrix(2)       # built once
+
+
+def assert_simple_undirected(adjacency):
+    assert (adjacency != adjacency.T).nnz == 0
+    assert adjacency.diagonal().sum() == 0
+    assert adjacency.has_sorted_indices
+
+
+def test_csr_barabasi_albert_edges():
+    n, m = 2000, 3
+    adjacency = generate_adjacency('barabasi_albert', n, seed=1, number_of_edges=m)
+    assert_simple_undirected(adjacency)
+    # the star of m + 1 nodes, then m edges for every later node
+    assert adjacency.nnz // 2 == m * (n - m)
+    assert np.diff(adjacency.indptr).min() >= 1 and np.diff(adjacency.indptr)[m + 1:].min() >= m
+
+
+def test_csr_watts_strogatz_edges():
+    n, k = 1000, 6
+    for p in [0.0, 0.3, 1.0]:
+        adjacency = generate_adjacency('watts_strogatz', n, seed=2, number_of_nearest_neighbours=k,
+                                       probability_of_network_connection=p)
+        assert_simple_undirected(adjacency)
+        assert adjacency.nnz // 2 == n * k // 2                 # rewiring keeps the number of edges
+    # without rewiring it is the ring lattice of networkx
+    lattice = generate_adjacency('watts_strogatz', 50, seed=2, number_of_nearest_neighbours=4, probability_of_network_connection=0)
+    assert nx.utils.edges_equal(adjacency_to_networkx(lattice).edges(), nx.watts_strogatz_graph(50, 4, 0).edges())
+
+
+def test_csr_erdos_renyi_edges():
+    n, k = 20000, 5
+    adjacency = generate_adjacency('erdos_renyi', n, seed=3, number_of_nearest_neighbours=k)
+    assert_simple_undirected(adjacency)
+    expected_edges = n * (n - 1) / 2 * k / n
+    assert abs(adjacency.nnz / 2 - expected_edges) < 5 * np.sqrt(expected_edges)
+    # the pair index enumerates every pair once
+    i, j = _pair_from_index(np.arange(45))
+    assert sorted(zip(i.tolist(), j.tolist())) == sorted((a, b) for b in range(10) for a in range(b))
+
+
+@pytest.mark.parametrize('network', ['erdos_renyi', 'barabasi_albert', 'watts_strogatz'])
+def test_csr_network_grid_matches_network_grid(network):
+    adjacency = generate_adjacency(network, 120, seed=4)
+    assert (generate_adjacency(network, 120, seed=4) != adjacency).nnz == 0          # the same seed gives the same network
+    G = adjacency_to_networkx(adjacency)
+    csr_grid, grid = CSRNetworkGrid(adjacency), NetworkGrid(G)
+    for radius in [1, 2, 3]:
+        assert (adjacency_neighbourhood(adjacency, radius=radius) != neighbourhood_matrix(G, radius=radius)).nnz == 0
+        for node in range(120):
+            assert csr_grid.get_neighborhood(node, radius=radius) == sorted(grid.get_neighborhood(node, include_center=False, radius=radius))
+
+
+def test_csr_model_matches_its_networkx_graph():
+    model = AdaptationModel(number_of_households=80, network='barabasi_albert', network_backend='csr', gov_action_B_awa=True)
+    for _ in range(3):
+        model.step()
+    for agent in model.schedule.agents:
+        assert sorted(neighbour.pos for neighbour in model.grid.get_neighbors(agent.pos)) == sorted(model.G.neighbors(agent.pos))
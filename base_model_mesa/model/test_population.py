@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""The population synthesizer gives the households of earlier versions, and every household a class when asked to."""
+import random
+
+import numpy as np
+import pytest
+
+from agents import Households
+from model import AdaptationModel
+from population import INCOME_DISTRIBUTION, PopulationSynthesizer, first_random
+
+
+@pytest.mark.parametrize('seeds', [np.arange(0, 50), np.arange(2 ** 32 - 50, 2 ** 32), np.array([12345, 7, 2 ** 31])])
+def test_first_random_matches_random_random(seeds):
+    assert first_random(seeds).tolist() == [random.Random(int(seed)).random() for seed in seeds]
+
+
+@pytest.mark.parametrize('number_of_households, seed', [(10, 1), (2500, 1), (2500, -1200),
+                                                        (2500, 2 ** 32 - 100)])
+def test_legacy_draws_match_random_random(number_of_households, seed):
+    expected = [random.Random(seed + unique_id).random() for unique_id in range(number_of_households)]
+    assert PopulationSynthesizer.legacy_draws(number_of_households, seed).tolist() == expected
+
+
+@pytest.mark.parametrize('number_of_households', [1, 7, 50, 99, 1001])
+def test_largest_remainder_gives_every_household_a_class(number_of_households):
+    synthesizer = PopulationSynthesizer(apportionment='largest_remainder')
+    counts = synthesizer.income_class_counts(number_of_households)
+    assert sum(counts.values()) == number_of_households
+    for income_class, share in INCOME_DISTRIBUTION.items():
+        assert abs(counts[income_class] - share * number_of_households) < 1
+    assert 'default' not in synthesizer.income_classes(number_of_households)
+
+
+def test_truncate_keeps_the_classes_of_earlier_versions():
+    number_of_households = 57
+    # the list of income classes Households used to pop from
+    income_classes = []
+    for income_class, share in INCOME_DISTRIBUTION.items():
+        income_classes.extend([income_class] * int(share * number_of_households))
+    expected = [income_classes.pop() if income_classes else 'default' for _ in range(number_of_households)]
+    assert PopulationSynthesizer().income_classes(number_of_households) == expected
+
+    model = AdaptationModel(number_of_households=number_of_households, seed=3)
+    households = sorted((agent for agent in model.schedule.agents if isinstance(agent, Households)), key=lambda agent: agent.unique_id)
+    assert [agent.income_class for agent in households] == expected
+    assert [agent.awareness for agent in households] == \
+        [0.2 + 0.8 * random.Random(3 + agent.unique_id).random() for agent in households]
+
+
+def test_unknown_apportionment():
+    with pytest.raises(ValueError):
+        PopulationSynthesizer(apportionment='round')
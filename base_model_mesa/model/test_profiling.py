@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""Profiling records every phase of a step without changing the results of the model."""
+import json
+
+import pytest
+
+from model import AdaptationModel
+
+STEPS = 6
+
+
+def run(**kwargs):
+    model = AdaptationModel(number_of_households=60, seed=5, **kwargs)
+    for _ in range(STEPS):
+        model.step()
+    return model
+
+
+@pytest.mark.parametrize('engine, activation, household_phases', [
+    ('object', 'simultaneous', {'schedule.step', 'schedule.advance'}),
+    ('object', 'dirty', {'schedule.step', 'schedule.advance'}),
+    ('vectorized', 'simultaneous', {'schedule.households'}),
+])
+def test_every_phase_of_every_step_is_recorded(engine, activation, household_phases):
+    model = run(profile='time', engine=engine, activation=activation)
+    records = model.profiler.get_dataframe()
+    phases = {'step', 'government', 'adaptations', 'collect', 'schedule'} | household_phases
+    assert phases <= set(records['phase'])
+    assert sorted(set(records['step'])) == list(range(STEPS))
+    per_step = records.pivot(index='step', columns='phase', values='time')
+    # the phases of a step take part of the time of the step, and the households part of the time of the schedule
+    assert (per_step[sorted(phases - {'step'} - household_phases)].sum(axis=1) <= per_step['step']).all()
+    assert (per_step[sorted(household_phases)].sum(axis=1) <= per_step['schedule']).all()
+    assert records.loc[records['phase'] == 'flood_shock', 'step'].tolist() == [5]
+
+
+def test_profiled_model_gives_the_same_results():
+    expected = run().datacollector.get_model_vars_dataframe()
+    assert run(profile='time').datacollector.get_model_vars_dataframe().equals(expected)
+
+
+def test_memory_profile_and_log(tmp_path):
+    log_path = tmp_path / 'profile.jsonl'
+    model = run(profile='memory', profile_log_path=log_path)
+    model.profiler.stop()
+    records = model.profiler.get_dataframe()
+    assert {'allocated', 'peak'} <= set(records.columns) and (records['peak'] >= 0).all()
+    with open(log_path) as file:
+        assert [json.loads(line) for line in file] == records.to_dict('records')
+    assert model.profiler.summary().loc['schedule', 'calls'] == STEPS
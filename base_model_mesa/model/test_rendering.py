@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""The renderers draw the households once and recolour them by adaptation status."""
+import matplotlib
+
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+import pytest
+from matplotlib.colors import to_rgba
+
+from model import AdaptationModel
+from rendering import ADAPTED_COLOUR, NOT_ADAPTED_COLOUR, NetworkRenderer, household_adaptation
+
+
+def expected_colours(model):
+    return np.array([to_rgba(ADAPTED_COLOUR if adapted else NOT_ADAPTED_COLOUR) for adapted in household_adaptation(model)])
+
+
+@pytest.fixture(autouse=True)
+def close_figures():
+    yield
+    plt.close('all')
+
+
+@pytest.mark.parametrize('engine', ['object', 'vectorized'])
+def test_update_recolours_the_households(engine):
+    model = AdaptationModel(number_of_households=60, seed=1, engine=engine, gov_action_A_sub=True, gov_action_B_awa=True)
+    domain = model.plot_model_domain_with_agents()
+    network = NetworkRenderer(model, layout_seed=0)
+    np.testing.assert_array_equal(domain.artist.get_offsets(), np.column_stack([domain.x, domain.y]))
+    for _ in range(8):
+        model.step()
+    domain.update()
+    network.update()
+    assert household_adaptation(model).any()
+    np.testing.assert_array_equal(domain.artist.get_facecolor(), expected_colours(model))
+    np.testing.assert_array_equal(network.artist.get_facecolor(), expected_colours(model))
+    assert domain.ax.get_title() == 'Model Domain with Agents at Step 8'
+    assert network.ax.get_title() == 'Social Network State at Step 8'
+
+
+def test_density_mode_shows_the_adapted_share_per_cell():
+    model = AdaptationModel(number_of_households=400, seed=2, gov_action_A_sub=True)
+    domain = model.plot_model_domain_with_agents(density_threshold=100)
+    assert domain.density
+    for _ in range(8):
+        model.step()
+    domain.update()
+    share = domain.artist.get_array()
+    adapted = household_adaptation(model)
+    # the adapted households over all cells, as the cells are weighted by their number of households
+    assert np.nansum(share.filled(np.nan).T * domain._counts) == pytest.approx(adapted.sum())
+    assert share.min() >= 0 and share.max() <= 1
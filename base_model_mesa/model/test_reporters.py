@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""The running totals behind the model reporters match a full scan of the households."""
+import math
+
+import pytest
+
+from model import AdaptationModel
+
+
+@pytest.mark.parametrize('engine, activation', [('object', 'simultaneous'), ('vectorized', 'simultaneous')])
+def test_running_totals_match_a_full_scan(engine, activation):
+    model = AdaptationModel(number_of_households=80, seed=2, engine=engine, activation=activation,
+                            gov_action_A_sub=True, gov_action_B_awa=True, flood_events={3: 'harvey', 7: '500yr'})
+    for _ in range(10):
+        model.step()
+        scanned = model.scan_household_totals()
+        for field, total in scanned.items():
+            assert math.isclose(model.household_totals.sums[field], total, rel_tol=1e-9, abs_tol=1e-9), field
+        assert model.total_adapted_households() == pytest.approx(scanned['is_adapted'] / 80)
+        assert model.calculate_average_flood_damage_actual() == pytest.approx(scanned['flood_damage_actual'] / 80)
+
+
+def test_check_reporters_raises_on_a_wrong_total():
+    model = AdaptationModel(number_of_households=30, seed=2, check_reporters=True)
+    model.step()
+    model.household_totals.add('is_adapted', 1)
+    with pytest.raises(RuntimeError, match="is_adapted"):
+        model.step()
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""The SQLite results store: run keys, resuming an interrupted sweep and selecting stored runs."""
+import sqlite3
+
+import pytest
+import shapely
+
+import sweep
+from model import AdaptationModel
+from results import ResultsStore, run_key
+from sweep import run_sweep
+
+PARAMETERS = {"number_of_households": 60, "seed": range(4), "network": ["barabasi_albert", "erdos_renyi"],
+              "gov_action_A_sub": [False, True]}
+STEPS = 5
+
+
+def test_run_key_includes_defaults():
+    assert run_key(AdaptationModel, {'seed': 1}) == run_key(AdaptationModel, {'seed': 1, 'network': 'barabasi_albert'})
+    assert run_key(AdaptationModel, {'seed': 1}) != run_key(AdaptationModel, {'seed': 2})
+    assert run_key(AdaptationModel, {'seed': 1}, max_steps=5) != run_key(AdaptationModel, {'seed': 1}, max_steps=6)
+
+
+def test_run_key_of_geometries():
+    # long geometries have the same (cut short) repr, but another key
+    line = shapely.LineString([(x, 0) for x in range(1000)])
+    other_line = shapely.LineString([(x, 0) for x in range(999)] + [(999, 1)])
+    assert repr(line) == repr(other_line)
+    assert run_key(AdaptationModel, {'gov_campaign_region': line}) != \
+        run_key(AdaptationModel, {'gov_campaign_region': other_line})
+    assert run_key(AdaptationModel, {'gov_campaign_region': line}) == \
+        run_key(AdaptationModel, {'gov_campaign_region': shapely.LineString(line.coords)})
+
+
+def test_run_key_rejects_values_without_encoding():
+    with pytest.raises(TypeError):
+        run_key(AdaptationModel, {'gov_campaign_region': object()})
+
+
+def test_interrupted_sweep_resumes(tmp_path, monkeypatch):
+    path = tmp_path / 'results.sqlite'
+    expected = run_sweep(AdaptationModel, PARAMETERS, max_steps=STEPS)
+    run_item = sweep._run_item
+
+    def interrupted_run_item(*args, **kwargs):
+        if calls:
+            calls.pop()
+            return run_item(*args, **kwargs)
+        raise KeyboardInterrupt
+
+    calls = [None] * 5
+    monkeypatch.setattr(sweep, '_run_item', interrupted_run_item)
+    with pytest.raises(KeyboardInterrupt):
+        run_sweep(AdaptationModel, PARAMETERS, max_steps=STEPS, results_path=path)
+    with ResultsStore(path) as store:
+        assert len(store.completed()) == 5
+
+    # only the runs that were not stored are run again, and the rows are those of an uninterrupted sweep
+    calls = [None] * 11
+    monkeypatch.setattr(sweep, '_run_item', interrupted_run_item)
+    assert run_sweep(AdaptationModel, PARAMETERS, max_steps=STEPS, results_path=path) == expected
+    assert not calls
+    monkeypatch.setattr(sweep, '_run_item', run_item)
+    assert run_sweep(AdaptationModel, PARAMETERS, max_steps=STEPS, results_path=path, store_agent_data=True,
+                     number_processes=2) == expected
+
+    with ResultsStore(path) as store:
+        assert len(store.completed()) == len(store.completed(need_agent_data=True)) == 16
+        selection = store.get_model_data(network='erdos_renyi', gov_action_A_sub=True, seed=range(3))
+        assert sorted(selection['seed'].unique()) == [0, 1, 2]
+        assert len(selection) == 3 * (STEPS + 1)
+        assert len(store.get_agent_data(Step=3)) == 16 * 60
+        with pytest.raises(ValueError):
+            store.get_model_data(unknown_parameter=1)
+
+
+def test_runs_can_be_selected_on_default_parameters(tmp_path):
+    path = tmp_path / 'results.sqlite'
+    rows = run_sweep(AdaptationModel, {"number_of_households": 40, "seed": range(2)}, max_steps=STEPS, results_path=path)
+    run_sweep(AdaptationModel, {"number_of_households": 40, "seed": range(2), "network": "erdos_renyi"},
+              max_steps=STEPS, results_path=path)
+    with ResultsStore(path) as store:
+        defaults = store.get_model_data(network='barabasi_albert', flood_map_choice='harvey', gov_action_A_sub=False)
+        assert len(defaults) == 2 * (STEPS + 1)
+        assert len(store.get_model_data(network='erdos_renyi')) == 2 * (STEPS + 1)
+        # the stored rows of a run are the rows of the sweep, without the parameter columns
+        key = run_key(AdaptationModel, {"number_of_households": 40, "seed": 0}, max_steps=STEPS, data_collection_period=1,
+                      iteration=0)
+        assert store.get_model_rows(key)[0].keys() == rows[0].keys()
+
+
+def test_failed_run_does_not_keep_its_new_columns(tmp_path, monkeypatch):
+    store = ResultsStore(tmp_path / 'results.sqlite')
+    store.add_run('first', {'seed': 1}, [{'Step': 0, 'seed': 1, 'Total': 1.0}])
+    insert = store._insert
+
+    def failing_insert(table, key, rows):
+        added = insert(table, key, rows)
+        if table == 'agent_data':
+            raise sqlite3.OperationalError('disk I/O error')
+        return added
+
+    monkeypatch.setattr(store, '_insert', failing_insert)
+    with pytest.raises(sqlite3.OperationalError):
+        store.add_run('second', {'seed': 2}, [{'Step': 0, 'seed': 2, 'Total': 2.0, 'NewReporter': 3.0}],
+                      [{'Step': 0, 'AgentID': 0, 'NewAgentReporter': 1.0}])
+    assert store._columns == {table: store._table_columns(table) for table in ('model_data', 'agent_data')}
+    assert 'NewReporter' not in store._columns['model_data'] and store.completed() == {'first'}
+
+    # the columns are added again by the next run that has them
+    monkeypatch.setattr(store, '_insert', insert)
+    store.add_run('second', {'seed': 2}, [{'Step': 0, 'seed': 2, 'Total': 2.0, 'NewReporter': 3.0}])
+    assert store.get_model_data(NewReporter=3.0)['seed'].tolist() == [2]
+    store.close()
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""The Philox streams give the same number to a household whether it is drawn alone or with all households."""
+import numpy as np
+import pytest
+
+from model import AdaptationModel
+from rng import RandomStreams
+
+
+@pytest.mark.parametrize('antithetic', [False, True])
+def test_agent_random_matches_the_bulk_draws(antithetic):
+    agent_ids = [0, 1, 2, 3, 4, 5, 7, 8, 63, 64, 999, 4097]
+    # a new object for the single draws, so they do not come from the cached bulk draws
+    single = [RandomStreams(11, 5000, antithetic).agent_random('shock', agent_id) for agent_id in agent_ids]
+    bulk = RandomStreams(11, 5000, antithetic).random('shock')
+    assert single == bulk[agent_ids].tolist()
+    assert not bulk.flags.writeable
+
+
+def test_antithetic_streams_mirror_the_draws():
+    streams, antithetic = RandomStreams(3, 100), RandomStreams(3, 100, antithetic=True)
+    np.testing.assert_array_equal(antithetic.random('awareness'), 1 - streams.random('awareness'))
+    assert antithetic.agent_random('awareness', 42) == 1 - streams.agent_random('awareness', 42)
+
+
+def test_purposes_and_seeds_get_other_streams():
+    streams = RandomStreams(3, 1000)
+    assert not np.array_equal(streams.random('awareness'), streams.random('adaptation'))
+    assert not np.array_equal(streams.random('awareness'), RandomStreams(4, 1000).random('awareness'))
+    # a longer stream starts with the same numbers
+    np.testing.assert_array_equal(RandomStreams(3, 10).random('awareness'), streams.random('awareness')[:10])
+
+
+def test_policy_scenarios_get_the_same_households():
+    baseline = AdaptationModel(number_of_households=40, seed=6, rng='philox')
+    policy = AdaptationModel(number_of_households=40, seed=6, rng='philox', gov_action_A_sub=True, gov_action_B_awa=True)
+    for agent, policy_agent in zip(baseline.schedule.agents, policy.schedule.agents):
+        assert agent.awareness == policy_agent.awareness
+        assert agent.location.equals(policy_agent.location)
+        assert agent.is_adapted == policy_agent.is_adapted
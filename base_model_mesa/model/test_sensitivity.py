@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+The Sobol indices and partial rank correlations of functions with known sensitivities, and a small sensitivity
+analysis of the model.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from model import AdaptationModel
+from sensitivity import (evaluate, partial_rank_correlations, run_sensitivity, sample_kwargs, sample_latin_hypercube,
+                         sample_sobol, sobol_indices)
+
+SPACE = {'a': ('uniform', 0, 1), 'b': ('uniform', 0, 1), 'c': ('uniform', 0, 1)}
+
+
+def test_sobol_indices_of_a_linear_function():
+    samples = sample_sobol(SPACE, 1024, seed=0)
+    assert len(samples) == 1024 * (len(SPACE) + 2)
+    # y = 4a + b: the variance of 4a is 16 times that of b, and c has no effect
+    outputs = pd.DataFrame({'y': 4 * samples['a'] + samples['b']})
+    indices = sobol_indices(SPACE, samples, outputs).set_index('Parameter')
+    np.testing.assert_allclose(indices.loc[['a', 'b', 'c'], 'S1'], [16 / 17, 1 / 17, 0], atol=0.05)
+    np.testing.assert_allclose(indices.loc[['a', 'b', 'c'], 'ST'], [16 / 17, 1 / 17, 0], atol=0.05)
+
+
+def test_sobol_indices_of_an_interaction():
+    samples = sample_sobol(SPACE, 1024, seed=1)
+    # y = (a - 0.5)(b - 0.5) has no first-order effects, all of its variance comes from the interaction of a and b
+    outputs = pd.DataFrame({'y': (samples['a'] - 0.5) * (samples['b'] - 0.5)})
+    indices = sobol_indices(SPACE, samples, outputs).set_index('Parameter')
+    np.testing.assert_allclose(indices.loc[['a', 'b', 'c'], 'S1'], [0, 0, 0], atol=0.05)
+    np.testing.assert_allclose(indices.loc[['a', 'b', 'c'], 'ST'], [1, 1, 0], atol=0.1)
+
+
+def test_partial_rank_correlations():
+    samples = sample_latin_hypercube(SPACE, 200, seed=0)
+    noise = np.random.default_rng(0).standard_normal(200)
+    # a monotonic but non-linear effect of a, a negative effect of b and no effect of c
+    outputs = pd.DataFrame({'y': np.exp(3 * samples['a']) - samples['b'] + 0.01 * noise})
+    prcc = partial_rank_correlations(samples, outputs).set_index('Parameter')['PRCC']
+    assert prcc['a'] > 0.9
+    assert prcc['b'] < -0.5
+    assert abs(prcc['c']) < 0.2
+
+
+def test_samples_of_integer_and_choice_parameters():
+    space = {'willingness': ('integer', 2, 4), 'network': ('choice', ['erdos_renyi', 'watts_strogatz'])}
+    samples = sample_latin_hypercube(space, 30, seed=0)
+    assert set(samples['willingness']) == {2, 3, 4}
+    assert set(samples['network']) == {'erdos_renyi', 'watts_strogatz'}
+    kwargs = sample_kwargs(samples.iloc[0], parameters={'number_of_households': 50})
+    assert kwargs['decision_thresholds'] == {'willingness': samples['willingness'][0]}
+    assert kwargs['network'] == samples['network'][0]
+    with pytest.raises(ValueError):
+        sample_latin_hypercube({'willingness': ('normal', 2, 1)}, 10)
+
+
+def test_sensitivity_analysis_of_the_model():
+    space = {'willingness': ('uniform', 2, 5), 'awareness_high': ('uniform', 0.6, 0.95),
+             'network': ('choice', ['erdos_renyi', 'watts_strogatz'])}
+    parameters = dict(number_of_households=60)
+    samples, outputs, indices = run_sensitivity(AdaptationModel, space, method='sobol', number_of_samples=8, seed=1,
+                                                parameters=parameters, seeds=range(2), max_steps=4,
+                                                number_processes=2, chunksize=4)
+    assert len(outputs) == len(samples) == 8 * (len(space) + 2)
+    assert not outputs.isna().any().any()
+    assert set(indices['Parameter']) == set(space)
+
+    # forking the thresholds from shared initializations gives the outputs of new models
+    new_models = evaluate(AdaptationModel, samples, parameters=parameters, seeds=range(2), max_steps=4,
+                          share_initialization=False)
+    pd.testing.assert_frame_equal(outputs, new_models)
+
+    samples, outputs, indices = run_sensitivity(AdaptationModel, space, method='latin_hypercube', number_of_samples=12,
+                                                seed=1, parameters=parameters, seeds=range(2), max_steps=4)
+    assert len(outputs) == 12
+    assert set(indices['Parameter']) == {'willingness', 'awareness_high'}     # the numeric parameters
+    with pytest.raises(ValueError):
+        run_sensitivity(AdaptationModel, space, method='morris')
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""A forked scenario and a model continued from a checkpoint give the same data as a model that ran uninterrupted."""
+import pytest
+
+from model import AdaptationModel
+from snapshot import fork, load_checkpoint, save_checkpoint, snapshot
+
+STEPS = 8
+
+
+def assert_same_data(model, other):
+    assert model.datacollector.get_model_vars_dataframe().equals(other.datacollector.get_model_vars_dataframe())
+    assert model.datacollector.get_agent_vars_dataframe().equals(other.datacollector.get_agent_vars_dataframe())
+
+
+@pytest.mark.parametrize('engine, rng', [('object', 'legacy'), ('object', 'philox'), ('vectorized', 'legacy'),
+                                         ('vectorized', 'philox')])
+def test_fork_matches_new_model(engine, rng):
+    base = dict(seed=3, number_of_households=100, network='watts_strogatz', engine=engine, rng=rng)
+    data = snapshot(AdaptationModel(**base))
+    for policy in [dict(gov_action_A_sub=True), dict(gov_action_B_awa=True),
+                   dict(gov_action_A_sub=True, gov_action_B_awa=True)]:
+        forked = fork(data, **policy)
+        model = AdaptationModel(**base, **policy)
+        for _ in range(STEPS):
+            forked.step()
+            model.step()
+        assert_same_data(forked, model)
+
+
+def test_fork_rejects_parameters_used_in_the_initialization():
+    model = AdaptationModel(number_of_households=50)
+    with pytest.raises(ValueError):
+        fork(snapshot(model), number_of_households=60)
+    model.step()
+    with pytest.raises(ValueError):
+        fork(snapshot(model), gov_action_A_sub=True)
+
+
+@pytest.mark.parametrize('collector', ['mesa', 'columnar'])
+@pytest.mark.parametrize('engine', ['object', 'vectorized'])
+def test_checkpoint_continues_the_run(tmp_path, engine, collector):
+    kwargs = dict(seed=5, number_of_households=100, engine=engine, collector=collector,
+                  gov_action_A_sub=True, gov_action_B_awa=True)
+    model = AdaptationModel(**kwargs)
+    for _ in range(3):
+        model.step()
+    path = tmp_path / 'model.ckpt'
+    save_checkpoint(model, path)
+    continued = load_checkpoint(path)
+    for _ in range(STEPS - 3):
+        continued.step()
+
+    uninterrupted = AdaptationModel(**kwargs)
+    for _ in range(STEPS):
+        uninterrupted.step()
+    assert_same_data(continued, uninterrupted)
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""The spatial index finds the same households as a test of every household."""
+import numpy as np
+import pytest
+from shapely import contains_xy
+from shapely.geometry import Point, box
+
+import functions
+from functions import generate_random_locations_within_map_domain
+from model import AdaptationModel
+from spatial import HouseholdSpatialIndex
+
+
+@pytest.fixture(scope='module')
+def locations():
+    return generate_random_locations_within_map_domain(2000, seed=5)
+
+
+def test_within_matches_a_test_of_every_household(locations):
+    x, y = locations
+    index = HouseholdSpatialIndex(x, y)
+    centre_x, centre_y = np.median(x), np.median(y)
+    for geometry in [Point(centre_x, centre_y).buffer(3000), box(functions.map_minx, centre_y, centre_x, functions.map_maxy),
+                     functions.floodplain_multipolygon, Point(0, 0).buffer(1)]:
+        np.testing.assert_array_equal(index.within(geometry), contains_xy(geometry, x, y))
+    np.testing.assert_array_equal(index.in_floodplain, contains_xy(functions.floodplain_multipolygon, x, y))
+
+
+def test_within_distance_matches_the_distances(locations):
+    x, y = locations
+    index = HouseholdSpatialIndex(x, y)
+    for point_x, point_y, distance in [(x[0], y[0], 1500), (np.mean(x), np.mean(y), 4000), (0, 0, 10)]:
+        expected = np.flatnonzero(np.hypot(x - point_x, y - point_y) <= distance)
+        np.testing.assert_array_equal(index.within_distance(point_x, point_y, distance), expected)
+
+
+def test_nearest_neighbours_match_the_distances(locations):
+    x, y = (coordinates[:300] for coordinates in locations)
+    neighbours = HouseholdSpatialIndex(x, y).nearest_neighbours(4)
+    distances = np.hypot(x[:, None] - x[None, :], y[:, None] - y[None, :])
+    np.fill_diagonal(distances, np.inf)
+    np.testing.assert_array_equal(neighbours, np.argsort(distances, axis=1, kind='stable')[:, :4])
+    assert HouseholdSpatialIndex(x[:3], y[:3]).nearest_neighbours(5).shape == (3, 2)
+
+
+def test_spatial_network_connects_the_nearest_households():
+    for backend in ['networkx', 'csr']:
+        model = AdaptationModel(number_of_households=120, seed=2, network='spatial_knn', network_backend=backend,
+                                number_of_nearest_neighbours=3)
+        neighbours = model.spatial_index.nearest_neighbours(3)
+        for agent in model.schedule.agents:
+            assert set(neighbours[agent.unique_id].tolist()) <= set(model.G.neighbors(agent.pos))
+
+
+def test_awareness_campaign_only_reaches_the_region():
+    model = AdaptationModel(number_of_households=200, seed=4, gov_action_B_awa=True, gov_campaign_region='floodplain')
+    awareness = {agent.unique_id: agent.awareness for agent in model.schedule.agents}
+    for _ in range(3):
+        model.step()
+    in_floodplain = model.spatial_index.in_floodplain
+    raised = {agent.unique_id for agent in model.schedule.agents if agent.awareness != awareness[agent.unique_id]}
+    assert raised and all(in_floodplain[unique_id] for unique_id in raised)
+    with pytest.raises(ValueError):
+        AdaptationModel(number_of_households=10, gov_campaign_region='coast')
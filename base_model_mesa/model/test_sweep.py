@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""run_sweep gives the same rows serially, in parallel, with shared initializations and as mesa's batch_run, and writes
+the rows of runs with other parameters to one CSV file."""
+import csv
+import filecmp
+import inspect
+
+from mesa.batchrunner import batch_run
+
+from floodmaps import flood_map_cache, flood_map_paths
+from model import AdaptationModel
+from sweep import _flood_map_choices, _RowWriter, _warm_up_worker, run_sweep
+
+PARAMETERS = {"number_of_households": 60, "network": "barabasi_albert", "flood_map_choice": ["harvey", "100yr"],
+              "seed": range(3), "gov_action_A_sub": [False, True], "gov_action_B_awa": [False, True]}
+STEPS = 6
+
+
+def test_parallel_sweep_matches_serial_sweep(tmp_path):
+    serial = run_sweep(AdaptationModel, PARAMETERS, max_steps=STEPS, output_path=tmp_path / 'serial.csv',
+                       agent_output_path=tmp_path / 'serial_agents.csv')
+    parallel = run_sweep(AdaptationModel, PARAMETERS, max_steps=STEPS, number_processes=2, chunksize=3,
+                         output_path=tmp_path / 'parallel.csv', agent_output_path=tmp_path / 'parallel_agents.csv')
+    assert len(serial) == 24 * (STEPS + 1)
+    assert serial == parallel
+    assert filecmp.cmp(tmp_path / 'serial.csv', tmp_path / 'parallel.csv', shallow=False)
+    assert filecmp.cmp(tmp_path / 'serial_agents.csv', tmp_path / 'parallel_agents.csv', shallow=False)
+
+
+def test_shared_initialization_matches_new_models():
+    rows = run_sweep(AdaptationModel, PARAMETERS, max_steps=STEPS)
+    assert run_sweep(AdaptationModel, PARAMETERS, max_steps=STEPS, share_initialization=True) == rows
+    assert run_sweep(AdaptationModel, PARAMETERS, max_steps=STEPS, share_initialization=True,
+                     number_processes=2, chunksize=4) == rows
+
+
+def test_serial_sweep_keeps_the_flood_map_cache_settings():
+    settings = (flood_map_cache.use_shared_memory, flood_map_cache.window_bounds, flood_map_cache.memmap_dir)
+    run_sweep(AdaptationModel, {"number_of_households": 30, "seed": [1]}, max_steps=2, clip_flood_maps=True)
+    assert (flood_map_cache.use_shared_memory, flood_map_cache.window_bounds, flood_map_cache.memmap_dir) == settings
+
+
+def test_merged_rows_match_batch_run():
+    parameters = {"number_of_households": 40, "seed": range(2), "gov_action_A_sub": [False, True]}
+    expected = batch_run(AdaptationModel, parameters, iterations=2, max_steps=4, number_processes=1,
+                         data_collection_period=1, display_progress=False)
+    rows = run_sweep(AdaptationModel, parameters, iterations=2, max_steps=4, merge_agent_data=True)
+    assert rows == expected
+    assert run_sweep(AdaptationModel, parameters, iterations=2, max_steps=4, merge_agent_data=True,
+                     number_processes=2) == expected
+
+
+def test_default_steps_match_batch_run():
+    assert inspect.signature(run_sweep).parameters['max_steps'].default == \
+        inspect.signature(batch_run).parameters['max_steps'].default
+
+
+def test_csv_of_runs_with_other_parameters(tmp_path):
+    runs = [{"number_of_households": 40, "seed": 1},
+            {"number_of_households": 40, "seed": 2, "network": "watts_strogatz"},
+            {"number_of_households": 40, "seed": 3, "flood_events": {2: "500yr"}}]
+    rows = run_sweep(AdaptationModel, runs, max_steps=3, output_path=tmp_path / 'runs.csv')
+    with open(tmp_path / 'runs.csv', newline='') as file:
+        written = list(csv.DictReader(file))
+    assert len(written) == len(rows) == 3 * 4
+    assert list(written[0])[:6] == ["RunId", "iteration", "Step", "number_of_households", "seed", "network"]
+    assert written[0]['network'] == '' and written[4]['network'] == 'watts_strogatz'
+    assert written[8]['flood_events'] == "{2: '500yr'}"
+
+
+def test_csv_header_widens_for_new_columns(tmp_path):
+    writer = _RowWriter(tmp_path / 'rows.csv', ["RunId"])
+    writer.write([{"RunId": 0, "a": 1}])
+    writer.write([{"RunId": 1, "a": 2, "b": 3}])
+    writer.close()
+    with open(tmp_path / 'rows.csv', newline='') as file:
+        assert list(csv.DictReader(file)) == [{"RunId": "0", "a": "1", "b": ""}, {"RunId": "1", "a": "2", "b": "3"}]
+
+
+def test_warm_up_loads_the_maps_of_flood_events():
+    runs = [(0, 0, {"flood_map_choice": "harvey", "flood_events": {3: "100yr", 6: "500yr"}})]
+    assert _flood_map_choices(runs) == ["100yr", "500yr", "harvey"]
+    flood_map_cache.clear()
+    _warm_up_worker(_flood_map_choices(runs), False)
+    cached_paths = {key[0] for key in flood_map_cache._entries}
+    assert cached_paths == {flood_map_cache._key(flood_map_paths[choice])[0] for choice in ["100yr", "500yr", "harvey"]}